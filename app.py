@@ -1,15 +1,53 @@
 
-from flask import Flask, jsonify, request, render_template, redirect, url_for
-import numpy as np
-import plotly.graph_objects as go
-from itertools import groupby
+from flask import Flask, jsonify, request, render_template, redirect, url_for, g, json, abort
+import os
+import hashlib
+import time
+import threading
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+from chartcache import ChartCache, CHART_CACHE_DIR
+from priceagg import parse_money, daily_stats, lttb
+from gamesearch import GameSearchIndex
+from catalogcache import CatalogCache
+from metrics import metrics, TimedCursor, TimedRealDictCursor
+from snapshots import SnapshotStore, SNAPSHOT_DIR
 # Python file that contains variables with a username, password, port # and database name
-from postgreslogin import un,pw,port,db_name
+try:
+    from postgreslogin import un,pw,port,db_name
+except ImportError:
+    # Fall back to the standard Postgres environment variables, e.g. for the offline benchmarks
+    un, pw, port, db_name = os.environ.get('PGUSER'), os.environ.get('PGPASSWORD'), os.environ.get('PGPORT', '5432'), os.environ.get('PGDATABASE')
 
 app = Flask(__name__)
-
+# Connection pool settings, the pool keeps DB_POOL_MIN idle connections and opens at most DB_POOL_MAX
+app.config['DB_POOL_MIN'] = int(os.environ.get('DB_POOL_MIN', 2))
+app.config['DB_POOL_MAX'] = int(os.environ.get('DB_POOL_MAX', 10))
+# Seconds a request waits for a free connection before failing
+app.config['DB_POOL_TIMEOUT'] = float(os.environ.get('DB_POOL_TIMEOUT', 5))
+# Price chart data kept in memory and how many seconds it stays valid
+app.config['CHART_CACHE_SIZE'] = int(os.environ.get('CHART_CACHE_SIZE', 256))
+app.config['CHART_CACHE_TTL'] = float(os.environ.get('CHART_CACHE_TTL', 3600))
+# JSON API responses kept in memory, they are also keyed on the data version so they never go stale
+app.config['API_CACHE_SIZE'] = int(os.environ.get('API_CACHE_SIZE', 512))
+app.config['API_CACHE_TTL'] = float(os.environ.get('API_CACHE_TTL', 3600))
+# Rows per page of /game-prices when no limit is given, and the largest limit allowed
+app.config['API_PAGE_SIZE'] = int(os.environ.get('API_PAGE_SIZE', 100))
+app.config['API_MAX_PAGE_SIZE'] = int(os.environ.get('API_MAX_PAGE_SIZE', 1000))
+# Seconds between checks of whether the catalog generation changed, the cached consoles and games
+# and the game search index are only reloaded when it did
+app.config['CATALOG_REFRESH'] = float(os.environ.get('CATALOG_REFRESH', 10))
+# Sales of one condition sent to the browser before they are downsampled
+app.config['CHART_MAX_POINTS'] = int(os.environ.get('CHART_MAX_POINTS', 500))
+# Threads running the loose, new and cib sales queries of a price page at the same time on their own
+# pooled connections, 0 runs them as the single combined query on the request's connection
+app.config['SALES_QUERY_WORKERS'] = int(os.environ.get('SALES_QUERY_WORKERS', 6))
+# Threads building the chart data of a price page while the browser loads the page
+app.config['CHART_WORKERS'] = int(os.environ.get('CHART_WORKERS', 2))
+# Threads of the production server started by python app.py --serve
+app.config['SERVE_THREADS'] = int(os.environ.get('SERVE_THREADS', 8))
 
 # Database connection configuration
 db_config = {
@@ -17,56 +55,424 @@ db_config = {
     'port': port,
     'database': db_name,
     'user': un,
-    'password': pw
+    'password': pw,
+    # Every statement of the app is timed in the /metrics db_statement_seconds histogram
+    'cursor_factory': TimedCursor
+}
+
+
+class ConnectionPool:
+    '''ThreadedConnectionPool that waits for a free connection instead of failing right away
+
+    Also keeps counts of how often and how long requests had to wait for a connection.
+
+    Args:
+        minconn: number of idle connections kept open
+        maxconn: maximum number of connections open at once
+        timeout: seconds to wait for a free connection before raising PoolError
+    '''
+
+    def __init__(self, minconn, maxconn, timeout, **db_config):
+        self.pool = ThreadedConnectionPool(minconn, maxconn, **db_config)
+        self.slots = threading.BoundedSemaphore(maxconn)
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.stats = {
+            'size_min': minconn,
+            'size_max': maxconn,
+            'checkouts': 0,
+            'in_use': 0,
+            'exhausted': 0,
+            'timeouts': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0,
+        }
+
+    def getconn(self, timeout=None):
+        '''Checks out a connection, waiting at most timeout seconds (the pool's timeout by default)'''
+        start = time.perf_counter()
+        if not self.slots.acquire(blocking=False):
+            # Every connection is checked out, wait for one to be returned
+            with self.lock:
+                self.stats['exhausted'] += 1
+            if not self.slots.acquire(timeout=self.timeout if timeout is None else timeout):
+                with self.lock:
+                    self.stats['timeouts'] += 1
+                raise PoolError('connection pool exhausted')
+        return self._checkout(time.perf_counter() - start)
+
+    def try_getconn(self):
+        '''Checks out a connection if one is free right away, returns None otherwise
+
+        For optional work that has somewhere else to run, so it never counts as the pool
+        being exhausted or timing out.
+        '''
+        if not self.slots.acquire(blocking=False):
+            return None
+        return self._checkout(0.0)
+
+    def _checkout(self, waited):
+        '''Takes a connection for a slot that was just acquired'''
+        try:
+            conn = self.pool.getconn()
+        except Exception:
+            self.slots.release()
+            raise
+        with self.lock:
+            self.stats['checkouts'] += 1
+            self.stats['in_use'] += 1
+            self.stats['wait_seconds_total'] += waited
+            self.stats['wait_seconds_max'] = max(self.stats['wait_seconds_max'], waited)
+        return conn
+
+    def putconn(self, conn):
+        try:
+            # The routes only read, drop anything left open so the connection goes back idle
+            broken = bool(conn.closed)
+            if not broken:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    # The connection broke without being marked closed, don't hand it out again
+                    broken = True
+            self.pool.putconn(conn, close=broken)
+        finally:
+            with self.lock:
+                self.stats['in_use'] -= 1
+            self.slots.release()
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats)
+
+
+db_pool = None
+db_pool_lock = threading.Lock()
+
+def get_pool():
+    '''Returns the app's connection pool, creating it on first use'''
+    global db_pool
+    with db_pool_lock:
+        if db_pool is None:
+            db_pool = ConnectionPool(app.config['DB_POOL_MIN'], app.config['DB_POOL_MAX'],
+                                     app.config['DB_POOL_TIMEOUT'], **db_config)
+    return db_pool
+
+def get_db():
+    '''Checks out a pooled connection for the current request, it is returned on teardown'''
+    if 'db' not in g:
+        g.db = get_pool().getconn()
+    return g.db
+
+@app.teardown_appcontext
+def release_db(exception):
+    conn = g.pop('db', None)
+    if conn is not None:
+        get_pool().putconn(conn)
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        metrics.observe('http_request_seconds', time.perf_counter() - start, endpoint=request.endpoint or 'unknown')
+    metrics.inc('http_responses_total', endpoint=request.endpoint or 'unknown', status=response.status_code)
+    return response
+
+def gauges(prefix, stats):
+    '''Returns the numeric values of a stats dict as Prometheus gauge lines'''
+    lines = []
+    for key, value in stats.items():
+        if isinstance(value, (int, float)):
+            lines.append(f'# TYPE {prefix}_{key} gauge')
+            lines.append(f'{prefix}_{key} {float(value)}')
+    return '\n'.join(lines) + '\n'
+
+# Endpoint for Prometheus, request, DB statement and chart timings plus the pool and cache stats
+@app.route('/metrics')
+def get_metrics():
+    body = metrics.prometheus()
+    body += gauges('db_pool', get_pool().get_stats())
+    body += gauges('chart_cache', chart_cache.get_stats())
+    body += gauges('api_cache', api_cache.get_stats())
+    body += gauges('catalog_cache', catalog_cache.get_stats())
+    return app.response_class(body, mimetype='text/plain; version=0.0.4')
+
+# Endpoint for the connection pool metrics
+@app.route('/pool-stats')
+def get_pool_stats():
+    return jsonify(get_pool().get_stats())
+
+chart_cache = ChartCache(app.config['CHART_CACHE_SIZE'], app.config['CHART_CACHE_TTL'], CHART_CACHE_DIR)
+
+# Endpoint for the price chart cache metrics
+@app.route('/chart-cache-stats')
+def get_chart_cache_stats():
+    return jsonify(chart_cache.get_stats())
+
+api_cache = ChartCache(app.config['API_CACHE_SIZE'], app.config['API_CACHE_TTL'])
+
+# Endpoint for the JSON API response cache metrics
+@app.route('/api-cache-stats')
+def get_api_cache_stats():
+    return jsonify(api_cache.get_stats())
+
+# Tables only the scraper creates, found to exist so far. They are never dropped once created,
+# so only databases that were never scraped pay for the check on every request
+existing_tables = set()
+
+def table_exists(cur, table):
+    '''Returns whether a table the scraper creates exists yet, cur must return tuples'''
+    if table in existing_tables:
+        return True
+    cur.execute('SELECT to_regclass(%s) IS NOT NULL;', (table,))
+    if cur.fetchone()[0]:
+        existing_tables.add(table)
+        return True
+    return False
+
+# Empty stand-ins for the scraper's tables in queries run before the first scrape
+EMPTY_TABLES = {
+    'sales_versions': '(SELECT NULL::integer AS game_id, NULL::timestamptz AS updated_at WHERE false)',
+    'daily_sales_stats': '(SELECT NULL::integer AS game_id, NULL::varchar AS condition, NULL::date AS date_sold, '
+                         'NULL::numeric AS mean_price WHERE false)',
 }
 
-# Endpoint for getting all game prices
+def summary_tables(cur):
+    '''Returns the names to put in the {sales_versions} and {daily_sales_stats} slots of a query'''
+    return {table: table if table_exists(cur, table) else empty for table, empty in EMPTY_TABLES.items()}
+
+def data_version(cur):
+    '''Returns the time the scraper or a catalog sync last changed the data, None if unknown'''
+    if not table_exists(cur, 'sales_versions'):
+        return None
+    cur.execute('SELECT max(updated_at) FROM sales_versions;')
+    return cur.fetchone()[0]
+
+def response_etag(version):
+    '''Returns the ETag of the current request's response for a data version'''
+    key = repr((request.path, sorted(request.args.items(multi=True)), version.isoformat()))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+def not_modified(etag, version):
+    '''Returns a 304 response if the client already has this version, None otherwise'''
+    response = app.response_class(status=200)
+    response.set_etag(etag)
+    response.last_modified = version
+    response.make_conditional(request)
+    return response if response.status_code == 304 else None
+
+def cached_json(build):
+    '''Returns the JSON response of the current request with ETag and Last-Modified headers
+
+    Responses are cached per path, query string and data version, and a 304 is returned when
+    the client sends the ETag or Last-Modified it got before and the data hasn't changed since.
+
+    Args:
+        build: function taking a dict cursor and returning the payload and a dict of extra headers
+    '''
+    conn = get_db()
+    with conn.cursor() as cur:
+        version = data_version(cur)
+
+    def render():
+        with conn.cursor(cursor_factory=TimedRealDictCursor) as cur:
+            payload, headers = build(cur)
+        return json.dumps(payload), headers
+
+    if version is None:
+        # Nothing was ever scraped or synced, there is no version to validate against
+        body, headers = render()
+        return app.response_class(body, mimetype='application/json', headers=headers)
+
+    etag = response_etag(version)
+    response = not_modified(etag, version)
+    if response is not None:
+        return response
+    body, headers = api_cache.get_or_build((request.path, request.query_string, version), render)
+    response = app.response_class(body, mimetype='application/json', headers=headers)
+    response.set_etag(etag)
+    response.last_modified = version
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+# Columns of avg_game_prices clients can select, game_id is always returned for paging
+GAME_PRICE_FIELDS = ['game_id', 'console_id', 'loose_val', 'complete_val', 'new_val', 'date_scraped', 'game_url', 'url']
+PRICE_FIELDS = ['loose_val', 'complete_val', 'new_val']
+
+def parse_game_prices_args(args):
+    '''Reads the paging, filter and column arguments of /game-prices
+
+    Args:
+        args: request arguments
+
+    Returns:
+        (tuple) list of selected columns, where clauses and the query parameters
+
+    Raises:
+        ValueError: if an argument is invalid
+    '''
+    fields = GAME_PRICE_FIELDS
+    if args.get('fields'):
+        fields = [field.strip() for field in args['fields'].split(',') if field.strip()]
+        unknown = [field for field in fields if field not in GAME_PRICE_FIELDS]
+        if unknown:
+            raise ValueError(f'unknown fields: {", ".join(unknown)}, choose from {", ".join(GAME_PRICE_FIELDS)}')
+        fields = ['game_id'] + [field for field in fields if field != 'game_id']
+
+    params = {'after': args.get('after', 0, type=int)}
+    where = ['game_id > %(after)s']
+    if 'console_id' in args:
+        params['console_id'] = args.get('console_id', type=int)
+        if params['console_id'] is None:
+            raise ValueError('console_id must be an integer')
+        where.append('console_id = %(console_id)s')
+    if 'console' in args:
+        params['console'] = args['console']
+        where.append('console_id IN (SELECT console_id FROM consoles WHERE console = %(console)s)')
+
+    price_field = args.get('price_field', 'loose_val')
+    if price_field not in PRICE_FIELDS:
+        raise ValueError(f'price_field must be one of {", ".join(PRICE_FIELDS)}')
+    for bound, op in [('min_price', '>='), ('max_price', '<=')]:
+        if bound in args:
+            params[bound] = args.get(bound, type=float)
+            if params[bound] is None:
+                raise ValueError(f'{bound} must be a number')
+            # price_field is one of PRICE_FIELDS so it is safe to put in the query
+            where.append(f'{price_field}::numeric {op} %({bound})s')
+    return fields, where, params
+
+def stream_game_prices(query, params):
+    '''Yields the rows of query as newline delimited JSON, a few thousand rows at a time
+
+    Uses a server-side cursor on its own pooled connection, since the response is
+    still being sent after the request's connection is given back.
+    '''
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        with conn.cursor(name='game_prices_export', cursor_factory=TimedRealDictCursor) as cur:
+            cur.itersize = 2000
+            cur.execute(query, params)
+            for row in cur:
+                yield json.dumps(row) + '\n'
+    finally:
+        pool.putconn(conn)
+
+# Endpoint for getting game prices, a page at a time
+# e.g. /game-prices?console=wii&min_price=10&fields=game_url,loose_val&after=1200&limit=50
+# format=ndjson streams every matching row instead of one page
 @app.route('/game-prices')
 def get_game_prices():
-    # Database connection information
-    conn = psycopg2.connect(**db_config)
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute('SELECT * FROM avg_game_prices')
-    results = cur.fetchall()
-    cur.close()
-    return jsonify(results)
+    try:
+        fields, where, params = parse_game_prices_args(request.args)
+        limit = request.args.get('limit', app.config['API_PAGE_SIZE'], type=int)
+        if not 0 < limit <= app.config['API_MAX_PAGE_SIZE']:
+            raise ValueError(f'limit must be between 1 and {app.config["API_MAX_PAGE_SIZE"]}')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    query = f"SELECT {', '.join(fields)} FROM avg_game_prices WHERE {' AND '.join(where)} ORDER BY game_id"
+
+    if request.args.get('format') == 'ndjson':
+        with get_db().cursor() as cur:
+            version = data_version(cur)
+        response = app.response_class(stream_game_prices(query, params), mimetype='application/x-ndjson')
+        if version is not None:
+            etag = response_etag(version)
+            cached = not_modified(etag, version)
+            if cached is not None:
+                return cached
+            response.set_etag(etag)
+            response.last_modified = version
+        return response
+
+    def build(cur):
+        cur.execute(query + ' LIMIT %(limit)s', dict(params, limit=limit))
+        results = cur.fetchall()
+        headers = {}
+        if len(results) == limit:
+            # Keyset paging, the next page starts after the last game_id of this one
+            next_args = request.args.to_dict()
+            next_args['after'] = results[-1]['game_id']
+            headers['Link'] = f'<{url_for("get_game_prices", **next_args)}>; rel="next"'
+        return results, headers
+    return cached_json(build)
 
 # Endpoint for getting all console names
 @app.route('/consoles')
 def get_consoles():
-    # Database connection information
-    conn = psycopg2.connect(**db_config)
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute('SELECT console FROM consoles')
-    results = cur.fetchall()
-    cur.close()
-    return jsonify(results)
+    def build(cur):
+        cur.execute('SELECT console FROM consoles')
+        return cur.fetchall(), {}
+    return cached_json(build)
 
 # Endpoint for getting average game prices by console
 @app.route('/avg-game-prices-by-console')
 def get_avg_game_prices_by_console():
-    # Database connection information
-    conn = psycopg2.connect(**db_config)
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute('SELECT console, AVG(loose_val) AS avg_loose_val, AVG(complete_val) AS avg_complete_val, AVG(new_val) AS avg_new_val FROM avg_game_prices JOIN consoles ON avg_game_prices.console_id = consoles.console_id GROUP BY console')
-    results = cur.fetchall()
-    cur.close()
-    return jsonify(results)
+    with get_db().cursor() as cur:
+        precomputed = table_exists(cur, 'console_avg_prices')
+
+    def build(cur):
+        if precomputed:
+            # console_avg_prices is refreshed by the scraper whenever the catalog or the sales change
+            cur.execute('SELECT console, avg_loose_val, avg_complete_val, avg_new_val FROM console_avg_prices')
+        else:
+            # Never scraped, average the catalog the way the view does
+            cur.execute('''
+                SELECT console, AVG(loose_val::numeric) AS avg_loose_val, AVG(complete_val::numeric) AS avg_complete_val,
+                    AVG(new_val::numeric) AS avg_new_val
+                FROM avg_game_prices JOIN consoles ON avg_game_prices.console_id = consoles.console_id
+                GROUP BY consoles.console_id, console
+            ''')
+        return cur.fetchall(), {}
+    return cached_json(build)
+
+catalog_cache = CatalogCache(app.config['CATALOG_REFRESH'])
+
+def read_catalog_generation():
+    with get_db().cursor() as cur:
+        # Databases set up before the generation existed have no table yet, their catalog is read once.
+        # The table name is resolved before any WHERE clause runs, so its existence is checked on its own
+        cur.execute("SELECT to_regclass('catalog_generation') IS NOT NULL;")
+        if not cur.fetchone()[0]:
+            return None
+        cur.execute('SELECT generation FROM catalog_generation;')
+        row = cur.fetchone()
+    return row[0] if row else None
+
+def read_catalog():
+    with get_db().cursor() as cur:
+        cur.execute('SELECT console_id, console FROM consoles;')
+        consoles = cur.fetchall()
+        cur.execute('SELECT game_id, console_id, game_url FROM avg_game_prices;')
+        games = cur.fetchall()
+    return consoles, games
+
+def get_catalog():
+    '''Returns the cached consoles and games, reading them from the database only when the catalog changed'''
+    return catalog_cache.get(read_catalog_generation, read_catalog)
+
+# Endpoint for the catalog cache metrics
+@app.route('/catalog-cache-stats')
+def get_catalog_cache_stats():
+    return jsonify(catalog_cache.get_stats())
 
 @app.route('/games_by_console', methods=['GET','POST'])
 def games_by_console():
-    conn = psycopg2.connect(**db_config)
-    cur = conn.cursor()
-    
     # Retrieve list of consoles for the dropdown menu
-    cur.execute("SELECT console_id, console FROM consoles ORDER BY console")
-    console_list = cur.fetchall()
+    console_list = get_catalog().consoles_by_name
     
     # Handle form submission
     if request.method == 'POST':
         # Get selected console ID from form
         selected_console = request.form['console']
         
+        conn = get_db()
+        cur = conn.cursor()
         # Query database for games matching selected console ID
         cur.execute("""
             SELECT game_id, loose_val, complete_val, new_val, date_scraped, url
@@ -84,10 +490,7 @@ def games_by_console():
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
-    conn = psycopg2.connect(**db_config)
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM consoles;")
-    consoles = cur.fetchall()
+    consoles = get_catalog().consoles
 
     if request.method == 'POST':
         console_id = request.form.get('console_id')
@@ -97,127 +500,377 @@ def index():
 
     return render_template('console_dropdown.html', consoles=consoles)
 
+# Sales tables of the price page, in the order they are shown
+CONDITIONS = ['loose', 'new', 'cib']
+
+# Returns the game_url, the sales data version, every loose, new and cib sale of a game
+# and the daily averages the scraper keeps in daily_sales_stats, in one round trip.
+# The scraper's tables are filled in by summary_tables
+GAME_SALES_QUERY = '''
+    SELECT s.kind, s.condition, s.game_id, s.date_sold, s.price_sold, a.game_url, v.updated_at
+    FROM avg_game_prices a
+    LEFT JOIN {sales_versions} v ON v.game_id = a.game_id
+    LEFT JOIN (
+        SELECT 'sale' AS kind, 'loose' AS condition, game_id, date_sold, price_sold FROM loose_game_prices WHERE game_id = %(game_id)s
+        UNION ALL
+        SELECT 'sale', 'new', game_id, date_sold, price_sold FROM new_game_prices WHERE game_id = %(game_id)s
+        UNION ALL
+        SELECT 'sale', 'cib', game_id, date_sold, price_sold FROM cib_game_prices WHERE game_id = %(game_id)s
+        UNION ALL
+        SELECT 'daily', condition, game_id, date_sold, mean_price FROM {daily_sales_stats} d WHERE game_id = %(game_id)s
+    ) s ON s.game_id = a.game_id
+    WHERE a.game_id = %(game_id)s
+    ORDER BY s.kind, s.condition, s.date_sold;
+'''
+
+def fetch_game_sales(cur, game_id):
+    '''Fetches the game_url and the sales of every condition of a game
+
+    Args:
+        cur: database cursor
+        game_id: id of the game
+
+    Returns:
+        game_url, the data version of the game's sales (None if unknown),
+        a dict of condition -> list of (game_id, date_sold, price_sold) rows
+        and a dict of condition -> list of (game_id, date_sold, mean price) daily rows
+    '''
+    cur.execute(GAME_SALES_QUERY.format(**summary_tables(cur)), {'game_id': game_id})
+    rows = cur.fetchall()
+    game_url = rows[0][5] if rows else None
+    updated_at = rows[0][6] if rows else None
+    data_version = f'{updated_at.timestamp():.6f}' if updated_at is not None else None
+    sales = {condition: [] for condition in CONDITIONS}
+    daily = {condition: [] for condition in CONDITIONS}
+    for kind, condition, sale_game_id, date_sold, price_sold, _, _ in rows:
+        # A game without any sales still comes back as one row with no condition
+        if kind == 'sale':
+            sales[condition].append((sale_game_id, date_sold, price_sold))
+        elif kind == 'daily':
+            daily[condition].append((sale_game_id, date_sold, price_sold))
+    return game_url, data_version, sales, daily
+
+# Returns the game_url and the sales data version of a game
+GAME_VERSION_QUERY = '''
+    SELECT a.game_url, v.updated_at
+    FROM avg_game_prices a
+    LEFT JOIN {sales_versions} v ON v.game_id = a.game_id
+    WHERE a.game_id = %(game_id)s;
+'''
+
+# Returns the sales and the daily averages of one condition of a game, the table name comes from CONDITIONS
+CONDITION_SALES_QUERY = '''
+    SELECT 'sale' AS kind, game_id, date_sold, price_sold FROM {condition}_game_prices WHERE game_id = %(game_id)s
+    UNION ALL
+    SELECT 'daily', game_id, date_sold, mean_price FROM {daily_sales_stats} d
+    WHERE game_id = %(game_id)s AND condition = %(condition)s
+    ORDER BY kind, date_sold;
+'''
+
+sales_query_executor = None
+if app.config['SALES_QUERY_WORKERS'] > 0:
+    sales_query_executor = ThreadPoolExecutor(app.config['SALES_QUERY_WORKERS'], thread_name_prefix='sales-query')
+
+def fetch_condition_sales(cur, game_id, condition):
+    '''Fetches the (game_id, date_sold, price_sold) sales and daily rows of one condition of a game'''
+    cur.execute(CONDITION_SALES_QUERY.format(condition=condition, **summary_tables(cur)),
+                {'game_id': game_id, 'condition': condition})
+    sales = []
+    daily = []
+    for kind, sale_game_id, date_sold, price_sold in cur.fetchall():
+        (sales if kind == 'sale' else daily).append((sale_game_id, date_sold, price_sold))
+    return sales, daily
+
+def fetch_pooled_condition_sales(game_id, condition):
+    '''Runs fetch_condition_sales on a connection of its own, None if the pool has none free right now'''
+    pool = get_pool()
+    conn = pool.try_getconn()
+    if conn is None:
+        metrics.inc('sales_query_fallbacks_total')
+        return None
+    try:
+        with conn.cursor() as cur:
+            return fetch_condition_sales(cur, game_id, condition)
+    finally:
+        pool.putconn(conn)
+
+def fetch_game_sales_concurrently(cur, game_id):
+    '''Same as fetch_game_sales, with the loose, new and cib queries running at the same time
+
+    Every condition is queried by a sales_query_executor thread on its own pooled connection.
+    A condition whose thread can't get a connection right away is queried on cur afterwards,
+    so a busy pool makes the page slower but never fails it.
+
+    Args:
+        cur: cursor of the request's connection
+        game_id: id of the game
+
+    Returns:
+        the same values as fetch_game_sales
+    '''
+    if sales_query_executor is None:
+        return fetch_game_sales(cur, game_id)
+    # The version is read before the sales so the sales are never older than the version they are cached under
+    cur.execute(GAME_VERSION_QUERY.format(**summary_tables(cur)), {'game_id': game_id})
+    row = cur.fetchone()
+    if row is None:
+        return None, None, {condition: [] for condition in CONDITIONS}, {condition: [] for condition in CONDITIONS}
+    game_url, updated_at = row
+    data_version = f'{updated_at.timestamp():.6f}' if updated_at is not None else None
+    futures = {condition: sales_query_executor.submit(fetch_pooled_condition_sales, game_id, condition)
+               for condition in CONDITIONS}
+    sales = {}
+    daily = {}
+    for condition, future in futures.items():
+        result = future.result()
+        if result is None:
+            result = fetch_condition_sales(cur, game_id, condition)
+        sales[condition], daily[condition] = result
+    return game_url, data_version, sales, daily
+
+# Ways /chart-data reduces long sales histories
+DOWNSAMPLE_MODES = ['lttb', 'daily', 'none']
+
+def build_chart_data(prices, daily=None, downsample='lttb', max_points=500):
+    '''Builds the compact chart arrays of one condition's sales
+
+    Args:
+        prices: list of (game_id, date_sold, price_sold) rows
+        daily: list of (game_id, date_sold, mean price) rows from daily_sales_stats,
+            the averages are computed from prices when they are missing
+        downsample: 'lttb' to keep max_points sales that preserve the shape of the scatter,
+            'daily' to send the daily low and high instead of the sales, 'none' to send every sale
+        max_points: number of sales kept by 'lttb'
+
+    Returns:
+        (dict) dates and prices of the sales and of the daily averages, None if there are no sales
+    '''
+    # Skip the placeholder row written for games without a sales table
+    prices = sorted((price for price in prices if price[1] is not None), key=lambda price: price[1])
+    y = parse_money([price[2] for price in prices])
+    # Drop the sales whose price isn't a number, NaN isn't valid JSON
+    valid = [i for i in range(len(prices)) if y[i] == y[i]]
+    if not valid:
+        return None
+    x = [prices[i][1] for i in valid]
+    y = y[valid]
+    data = {'n_sales': len(x)}
+
+    stats_df = None
+    if daily and downsample != 'daily':
+        x_avg = [day[1] for day in daily]
+        y_avg = parse_money([day[2] for day in daily])
+    else:
+        # Average the y values of every x value, whatever order the rows came in
+        stats_df = daily_stats(x, y)
+        x_avg = list(stats_df['date'])
+        y_avg = stats_df['mean'].to_numpy(dtype=float)
+
+    if downsample == 'daily':
+        data['dates'] = []
+        data['prices'] = []
+        data['low'] = stats_df['min'].round(2).tolist()
+        data['high'] = stats_df['max'].round(2).tolist()
+    else:
+        kept = range(len(x))
+        if downsample == 'lttb' and len(x) > max_points:
+            # Dates as day numbers, sales of the same day are spread over it so x keeps increasing
+            ordinals = [date.toordinal() + i / len(x) for i, date in enumerate(x)]
+            kept = lttb(ordinals, y, max_points)
+        data['dates'] = [x[i].isoformat() for i in kept]
+        data['prices'] = [round(float(y[i]), 2) for i in kept]
+    data['avg_dates'] = [date.isoformat() for date in x_avg]
+    data['avg_prices'] = [round(float(price), 2) for price in y_avg]
+    return data
+
+def chart_data_body(game_id, game_url, sales, daily, downsample, max_points):
+    '''Returns the /chart-data JSON of a game from the values of fetch_game_sales'''
+    with metrics.span('chart_data_build_seconds'):
+        conditions = {condition: build_chart_data(sales[condition], daily[condition], downsample, max_points)
+                      for condition in CONDITIONS}
+        payload = {'game_id': game_id, 'title': game_url.replace('-', ' ').title(), 'conditions': conditions}
+        return json.dumps(payload, separators=(',', ':'))
+
+def chart_data_key(game_id, downsample, max_points, data_version):
+    '''Returns the chart_cache key of a game's /chart-data, the variant names its downsampling'''
+    return (game_id, f'{downsample}-{max_points}', data_version)
+
+chart_executor = ThreadPoolExecutor(max(app.config['CHART_WORKERS'], 1), thread_name_prefix='chart-data')
+
+def prepare_chart_data(game_id, game_url, data_version, sales, daily):
+    '''Builds the default /chart-data of a game into the chart cache, off the request thread
+
+    The price page has the sales already, so the charts the browser asks for next are usually built
+    by the time it does. Errors are only logged, /chart-data builds the charts itself on a miss.
+    '''
+    max_points = app.config['CHART_MAX_POINTS']
+    key = chart_data_key(game_id, 'lttb', max_points, data_version)
+
+    def build():
+        try:
+            chart_cache.get_or_build(key, lambda: chart_data_body(game_id, game_url, sales, daily, 'lttb', max_points))
+        except Exception as e:
+            print('Fail to prepare the chart data due to the error:', e)
+
+    chart_executor.submit(build)
+
+# Endpoint for the price charts of a game, drawn in the browser by static/pricechart.js
+# e.g. /chart-data/1200?downsample=lttb&max_points=300
+@app.route('/chart-data/<int:game_id>')
+def get_chart_data(game_id):
+    downsample = request.args.get('downsample', 'lttb')
+    if downsample not in DOWNSAMPLE_MODES:
+        return jsonify({'error': f'downsample must be one of {", ".join(DOWNSAMPLE_MODES)}'}), 400
+    max_points = min(max(request.args.get('max_points', app.config['CHART_MAX_POINTS'], type=int), 3), 10000)
+    conn = get_db()
+    with conn.cursor() as cur:
+        row = None
+        if table_exists(cur, 'sales_versions'):
+            cur.execute('SELECT updated_at FROM sales_versions WHERE game_id = %s;', (game_id,))
+            row = cur.fetchone()
+    updated_at = row[0] if row else None
+
+    def build():
+        with conn.cursor() as cur:
+            game_url, _, sales, daily = fetch_game_sales_concurrently(cur, game_id)
+        if game_url is None:
+            abort(404)
+        return chart_data_body(game_id, game_url, sales, daily, downsample, max_points)
+
+    if updated_at is None:
+        # Sales the scraper never versioned can't be invalidated, always build them
+        return app.response_class(build(), mimetype='application/json')
+    etag = hashlib.sha1(f'{game_id}-{downsample}-{max_points}-{updated_at.isoformat()}'.encode()).hexdigest()
+    response = not_modified(etag, updated_at)
+    if response is not None:
+        return response
+    key = chart_data_key(game_id, downsample, max_points, f'{updated_at.timestamp():.6f}')
+    response = app.response_class(chart_cache.get_or_build(key, build), mimetype='application/json')
+    response.set_etag(etag)
+    response.last_modified = updated_at
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+search_index = None
+search_index_catalog = None
+search_index_lock = threading.Lock()
+
+def get_search_index():
+    '''Returns the game search index, rebuilding it from the cached catalog when the catalog changed'''
+    global search_index, search_index_catalog
+    catalog = get_catalog()
+    with search_index_lock:
+        if search_index_catalog is not catalog:
+            start = time.perf_counter()
+            search_index = GameSearchIndex(catalog.rows(), catalog.generation)
+            search_index_catalog = catalog
+            print(f'Built the game search index of {len(search_index)} games in {time.perf_counter() - start:.2f}s')
+        return search_index
+
+# Endpoint for the game typeahead, e.g. /search-games?q=mario+kart&console_id=3&limit=10
+@app.route('/search-games')
+def search_games():
+    console_id = request.args.get('console_id', type=int)
+    limit = min(request.args.get('limit', 10, type=int), app.config['API_MAX_PAGE_SIZE'])
+    results = get_search_index().search(request.args.get('q', ''), console_id, max(limit, 1))
+    return jsonify(results)
+
+snapshot_store = None
+
+def get_snapshot_store():
+    '''Returns the Parquet snapshot store, None if pyarrow isn't installed'''
+    global snapshot_store
+    if snapshot_store is None:
+        try:
+            snapshot_store = SnapshotStore(SNAPSHOT_DIR)
+        except ImportError as e:
+            print('Snapshots are disabled:', e)
+            return None
+    return snapshot_store
+
+def snapshot_response(result):
+    '''Returns a query result of the snapshot store as JSON, 503 if there is no snapshot to read'''
+    if result is None:
+        return jsonify({'error': 'no sales snapshot, run python snapshots.py export'}), 503
+    return app.response_class(result.to_json(orient='records', date_format='iso'), mimetype='application/json')
+
+# Analytics endpoints, read from the Parquet snapshots so they never query the database
+# e.g. /analytics/game-history/1200?condition=loose
+@app.route('/analytics/game-history/<int:game_id>')
+def get_game_history(game_id):
+    store = get_snapshot_store()
+    return snapshot_response(store.game_history(game_id, request.args.get('condition')) if store else None)
+
+# e.g. /analytics/console-trend/nintendo-64?condition=cib&start=2023-01&end=2023-06
+@app.route('/analytics/console-trend/<console>')
+def get_console_trend(console):
+    store = get_snapshot_store()
+    result = store.console_trend(console, request.args.get('condition'), request.args.get('start'),
+                                 request.args.get('end')) if store else None
+    return snapshot_response(result)
+
+@app.route('/snapshot-stats')
+def get_snapshot_stats():
+    store = get_snapshot_store()
+    return jsonify(store.get_stats() if store else {'snapshot': None})
+
 @app.route('/games/<console_id>', methods=['GET', 'POST'])
 def game_dropdown(console_id):
-    conn = psycopg2.connect(**db_config)
-    with conn.cursor() as cur:
-        cur.execute("SELECT * FROM avg_game_prices WHERE console_id = %s;", (console_id,))
-        games = cur.fetchall()
+    # The console name comes from the cached catalog, an unknown console is a 404
+    console = get_catalog().console_names.get(int(console_id)) if console_id.isdigit() else None
+    if console is None:
+        abort(404)
 
     if request.method == 'POST':
         game_id = request.form.get('game_id')
         if game_id:
-            with conn.cursor() as cur:
-                cur.execute("SELECT * FROM loose_game_prices WHERE game_id = %s;", (game_id,))
-                loose_prices = cur.fetchall()
-                # get game_url by game_id
-                cur.execute("SELECT game_url FROM avg_game_prices WHERE game_id = %s;", (game_id,))
-                game_url = cur.fetchone()[0]
-
-                # create data for the graph
-                x = [price[1] for price in loose_prices]
-                y = [float(price[2].replace('$', '').replace(',', '')) for price in loose_prices]
-                # Group y values by their corresponding x values
-                groups = groupby(zip(x, y), key=lambda pair: pair[0])
-
-                # Calculate the average of each group to get a single y value for each x value
-                x_avg = []
-                y_avg = []
-                for key , group in groups:
-                    group_y = [pair[1] for pair in group]
-                    x_avg.append(key)
-                    y_avg.append(sum(group_y) / len(group_y))
-
-                # create the line graph
-                fig = go.Figure()
-                fig.add_trace(go.Scatter(x=x_avg, y=y_avg, mode='lines', name='Average'))
-                fig.add_trace(go.Scatter(y=y, x=x, mode='markers', name='Scatter'))
-
-
-                # set the title of the graph to the game_url
-                game_url = game_url.replace('-', ' ')
-                game_url = game_url.title()
-                fig.update_layout(title=game_url, xaxis=dict(title='Date'), yaxis=dict(title='Price sold ($)'))
-                fig.update_yaxes(range=[0, max(y) + 0.05*max(y)])
-
-                # convert the graph to HTML and add it to the div in prices.html
-                loose_graph_html = fig.to_html(full_html=False)
-
-                cur.execute("SELECT * FROM new_game_prices WHERE game_id = %s;", (game_id,))
-                new_prices = cur.fetchall()
-                # get game_url by game_id
-                cur.execute("SELECT game_url FROM avg_game_prices WHERE game_id = %s;", (game_id,))
-                game_url = cur.fetchone()[0]
-
-                # create data for the graph
-                x = [price[1] for price in new_prices]
-                y = [float(price[2].replace('$', '').replace(',', '')) for price in new_prices]
-                # Group y values by their corresponding x values
-                groups = groupby(zip(x, y), key=lambda pair: pair[0])
-
-                # Calculate the average of each group to get a single y value for each x value
-                x_avg = []
-                y_avg = []
-                for key , group in groups:
-                    group_y = [pair[1] for pair in group]
-                    x_avg.append(key)
-                    y_avg.append(sum(group_y) / len(group_y))
-
-                # create the line graph
-                fig = go.Figure()
-                fig.add_trace(go.Scatter(x=x_avg, y=y_avg, mode='lines', name='Average'))
-                fig.add_trace(go.Scatter(y=y, x=x, mode='markers', name='Scatter'))
-
-                # set the title of the graph to the game_url
-                game_url = game_url.replace('-', ' ')
-                game_url = game_url.title()
-                fig.update_layout(title=game_url, xaxis=dict(title='Date'), yaxis=dict(title='Price sold ($)'))
-                fig.update_yaxes(range=[0, max(y) + 0.05*max(y)])
-
-                # convert the graph to HTML and add it to the div in prices.html
-                new_graph_html = fig.to_html(full_html=False)
-
-                cur.execute("SELECT * FROM cib_game_prices WHERE game_id = %s;", (game_id,))
-                cib_prices = cur.fetchall()
-                # get game_url by game_id
-                cur.execute("SELECT game_url FROM avg_game_prices WHERE game_id = %s;", (game_id,))
-                game_url = cur.fetchone()[0]
-
-                # create data for the graph
-                x = [price[1] for price in cib_prices]
-                y = [float(price[2].replace('$', '').replace(',', '')) for price in cib_prices]
-                # Group y values by their corresponding x values
-                groups = groupby(zip(x, y), key=lambda pair: pair[0])
-
-                # Calculate the average of each group to get a single y value for each x value
-                x_avg = []
-                y_avg = []
-                for key , group in groups:
-                    group_y = [pair[1] for pair in group]
-                    x_avg.append(key)
-                    y_avg.append(sum(group_y) / len(group_y))
-
-                # create the line graph
-                fig = go.Figure()
-                fig.add_trace(go.Scatter(x=x_avg, y=y_avg, mode='lines', name='Average'))
-                fig.add_trace(go.Scatter(y=y, x=x, mode='markers', name='Scatter'))
-
-                # set the title of the graph to the game_url
-                game_url = game_url.replace('-', ' ')
-                game_url = game_url.title()
-                fig.update_layout(title=game_url, xaxis=dict(title='Date'), yaxis=dict(title='Price sold ($)'))
-                fig.update_yaxes(range=[0, max(y) + 0.05*max(y)])
-
-                # convert the graph to HTML and add it to the div in prices.html
-                cib_graph_html = fig.to_html(full_html=False)
-
-            return render_template('prices.html', loose_prices=loose_prices, new_prices=new_prices, cib_prices=cib_prices, loose_graph=loose_graph_html, new_graph=new_graph_html, cib_graph=cib_graph_html)
-
-    return render_template('game_dropdown.html', games=games)
-
+            with get_db().cursor() as cur:
+                game_url, data_version, sales, daily = fetch_game_sales_concurrently(cur, game_id)
+            if game_url is not None and data_version is not None:
+                prepare_chart_data(int(game_id), game_url, data_version, sales, daily)
+
+            # set the title of the graphs to the game_url
+            title = game_url.replace('-', ' ').title() if game_url else ''
+            # The charts are drawn by the browser from /chart-data, only the sales tables are rendered here
+            return render_template('prices.html', game_id=int(game_id), title=title, loose_prices=sales['loose'], new_prices=sales['new'], cib_prices=sales['cib'])
+
+    # The games are loaded by the page from /search-games as the user types
+    return render_template('game_dropdown.html', console_id=console_id, console=console)
+
+def serve(host, port, threads):
+    '''Serves the app with a multi-threaded production server
+
+    Uses waitress when it is installed, otherwise the threaded werkzeug server without the
+    debugger and the reloader. Every thread serves one request at a time from its own
+    pooled connection, so the pool should have a connection per thread.
+    '''
+    if app.config['DB_POOL_MAX'] < threads:
+        print(f'DB_POOL_MAX is {app.config["DB_POOL_MAX"]} for {threads} threads, requests will wait for connections')
+    try:
+        from waitress import serve as waitress_serve
+    except ImportError:
+        from werkzeug.serving import run_simple
+        print(f'waitress is not installed, serving on http://{host}:{port} with the threaded werkzeug server')
+        run_simple(host, port, app, threaded=True)
+        return
+    print(f'Serving on http://{host}:{port} with waitress and {threads} threads')
+    waitress_serve(app, host=host, port=port, threads=threads)
 
 if __name__ == '__main__':
-    app.run(debug=True)
-
- 
-
+    parser = argparse.ArgumentParser(description='Run the game prices web app')
+    parser.add_argument('--serve', action='store_true', help='run the production server instead of the debug server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=app.config['SERVE_THREADS'], help='threads of the production server')
+    args = parser.parse_args()
+
+    # Load the catalog and build the search index before the first visitor needs them
+    with app.app_context():
+        try:
+            get_search_index()
+        except psycopg2.Error as e:
+            print('Fail to execute due to the error:', e)
+    if args.serve:
+        serve(args.host, args.port, args.threads)
+    else:
+        app.run(host=args.host, port=args.port, debug=True)
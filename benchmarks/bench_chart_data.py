@@ -0,0 +1,73 @@
+import argparse
+import datetime
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import build_chart_data, DOWNSAMPLE_MODES
+from priceagg import parse_money, daily_stats
+
+
+def fake_sales(n_sales, n_days, seed=0):
+    '''Builds (game_id, date_sold, price_sold) rows like the rows of a sales table'''
+    rng = random.Random(seed)
+    start = datetime.date(2022, 1, 1)
+    return [(1, start + datetime.timedelta(days=rng.randrange(n_days)), f'{rng.lognormvariate(3, 0.3):.2f}')
+            for _ in range(n_sales)]
+
+
+def legacy_price_chart(prices, title):
+    '''What game_dropdown used to send for every condition: a full Plotly figure as html'''
+    import numpy as np
+    import plotly.graph_objects as go
+    x = [price[1] for price in prices]
+    y = parse_money([price[2] for price in prices])
+    stats_df = daily_stats(x, y)
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=stats_df['date'], y=stats_df['mean'], mode='lines', name='Average'))
+    fig.add_trace(go.Scatter(y=y, x=x, mode='markers', name='Scatter'))
+    fig.update_layout(title=title, xaxis=dict(title='Date'), yaxis=dict(title='Price sold ($)'))
+    fig.update_yaxes(range=[0, np.nanmax(y) + 0.05*np.nanmax(y)])
+    return fig.to_html(full_html=False)
+
+
+def best_time(func, repeat):
+    '''Returns the result of func and its best time in milliseconds'''
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the size and build time of Plotly html charts and /chart-data payloads')
+    parser.add_argument('--sales', type=int, nargs='+', default=[100, 1000, 10000, 100000])
+    parser.add_argument('--days', type=int, default=730)
+    parser.add_argument('--max-points', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for n_sales in args.sales:
+        prices = fake_sales(n_sales, args.days)
+        print(f'{n_sales} sales')
+        try:
+            html, elapsed = best_time(lambda: legacy_price_chart(prices, 'Bench Game'), args.repeat)
+            print(f'  {"plotly html":15s} {len(html.encode()):>10,d} bytes {elapsed:9.2f} ms')
+        except ImportError:
+            print('  plotly html     skipped, plotly is not installed')
+        for mode in DOWNSAMPLE_MODES:
+            body, elapsed = best_time(
+                lambda: json.dumps(build_chart_data(prices, None, mode, args.max_points), separators=(',', ':')),
+                args.repeat)
+            print(f'  {"json " + mode:15s} {len(body.encode()):>10,d} bytes {elapsed:9.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_big_csv(path, copies):
+    '''Writes game_prices.csv repeated copies times, so ingest can be measured on a larger catalog'''
+    with open(os.path.join(REPO_DIR, 'game_prices.csv'), encoding='utf-8') as f:
+        header = f.readline()
+        body = f.read()
+    if not body.endswith('\n'):
+        body += '\n'
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(header)
+        for _ in range(copies):
+            f.write(body)
+
+
+def run_mode(mode, path, chunksize):
+    '''Reads and cleans the csv in this process and returns wall time and peak RSS'''
+    from gamescraperapi import read_game_prices, clean_game_prices, iter_clean_game_prices, avg_game_prices_rows, add_console_id, create_console_df
+
+    start = time.perf_counter()
+    n_rows = 0
+    if mode == 'full':
+        gs_df = clean_game_prices(read_game_prices(path))
+        gs_df = add_console_id(gs_df, create_console_df(gs_df))
+        # Game ids come from game_keys in the database, any ids do for timing the rows
+        gs_df['game_id'] = range(len(gs_df))
+        n_rows = sum(1 for _ in avg_game_prices_rows(gs_df))
+    else:
+        console_df = None
+        for clean_df in iter_clean_game_prices(path, chunksize):
+            console_df = create_console_df(clean_df)
+            clean_df = add_console_id(clean_df, console_df)
+            clean_df['game_id'] = range(len(clean_df))
+            n_rows += sum(1 for _ in avg_game_prices_rows(clean_df))
+    elapsed = time.perf_counter() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {'mode': mode, 'rows': n_rows, 'seconds': elapsed, 'peak_rss_mb': peak_kb / 1024}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare wall time and peak RSS of whole-file and chunked catalog ingest')
+    parser.add_argument('--copies', type=int, default=50, help='times game_prices.csv is repeated')
+    parser.add_argument('--chunksize', type=int, default=5000)
+    parser.add_argument('--run', choices=['full', 'chunked'], help=argparse.SUPPRESS)
+    parser.add_argument('--path', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run_mode(args.run, args.path, args.chunksize)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'game_prices.csv')
+        make_big_csv(path, args.copies)
+        # Every mode runs in its own process so peak RSS isn't shared between them
+        for mode in ['full', 'chunked']:
+            output = subprocess.run([sys.executable, __file__, '--run', mode, '--path', path, '--chunksize', str(args.chunksize)],
+                                    check=True, capture_output=True, text=True, cwd=REPO_DIR).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{result['mode']:8s} rows={result['rows']} time={result['seconds']:.2f}s peak_rss={result['peak_rss_mb']:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gamescraperapi import bulk_insert, create_connection, un, pw, port, db_name
+
+
+def fake_sales(n_rows, seed=0):
+    '''Builds (game_id, date_sold, price_sold, sale_seq) rows like the ones scraped into the sales tables'''
+    rng = random.Random(seed)
+    seqs = {}
+    rows = []
+    for _ in range(n_rows):
+        sale = (rng.randint(1, 9500), datetime.date(2023, rng.randint(1, 12), rng.randint(1, 28)), round(rng.uniform(1, 300), 2))
+        # Sales sharing a game, date and price are told apart by sale_seq, like parse_sales_values does
+        seq = seqs.get(sale, 0)
+        seqs[sale] = seq + 1
+        rows.append(sale + (seq,))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare executemany, execute_values and COPY load speed on a local Postgres')
+    parser.add_argument('--rows', type=int, default=50000)
+    args = parser.parse_args()
+
+    rows = fake_sales(args.rows)
+    columns = ['game_id', 'date_sold', 'price_sold', 'sale_seq']
+    conn, cursor = create_connection(un, pw, port, db_name)
+    # Same columns and unique key as the sales tables of create_recent_sales_tables
+    cursor.execute('''
+        CREATE TEMP TABLE bench_game_prices
+        (game_id integer, date_sold date, price_sold numeric(12,2), sale_seq smallint NOT NULL DEFAULT 0);
+        CREATE UNIQUE INDEX bench_game_prices_sale_key ON bench_game_prices (game_id, date_sold, price_sold, sale_seq);
+    ''')
+
+    def executemany(rows):
+        cursor.executemany('INSERT INTO bench_game_prices (game_id, date_sold, price_sold, sale_seq) VALUES (%s, %s, %s, %s);', rows)
+
+    methods = {
+        'executemany': executemany,
+        'execute_values': lambda rows: bulk_insert(cursor, 'bench_game_prices', columns, rows, method='values'),
+        'copy': lambda rows: bulk_insert(cursor, 'bench_game_prices', columns, rows, method='copy'),
+    }
+    for name, load in methods.items():
+        cursor.execute('TRUNCATE bench_game_prices;')
+        start = time.perf_counter()
+        load(rows)
+        conn.commit()
+        elapsed = time.perf_counter() - start
+        print(f'{name:15s} {len(rows) / elapsed:12,.0f} rows/s')
+
+    conn.rollback()
+    cursor.close()
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+import argparse
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gamescraperapi import PARSERS, parse_product_page
+from fakeserver import fake_product_page, load_fixtures
+
+
+def load_pages(pages_dir, n_pages, n_sales):
+    '''Reads recorded product pages from pages_dir or the fixtures directory, or builds fake ones if there are none'''
+    if pages_dir:
+        pages = []
+        for path in sorted(glob.glob(os.path.join(pages_dir, '*.html'))):
+            with open(path, 'rb') as f:
+                pages.append(f.read())
+        return pages
+    fixtures = load_fixtures()
+    if fixtures:
+        return [fixtures[key] for key in sorted(fixtures)]
+    return [fake_product_page(i, n_sales).encode() for i in range(1, n_pages + 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark per-page parse time for every installed parser backend')
+    parser.add_argument('--pages', help='directory of recorded product pages (*.html), defaults to the recorded fixtures')
+    parser.add_argument('--n-pages', type=int, default=50)
+    parser.add_argument('--n-sales', type=int, default=30)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    pages = load_pages(args.pages, args.n_pages, args.n_sales)
+    print(f'{len(pages)} pages')
+    for name in PARSERS:
+        best = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            for game_id, content in enumerate(pages, 1):
+                parse_product_page(content, game_id, name)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        print(f'{name:10s} {best / len(pages) * 1000:8.3f} ms/page')
+
+
+if __name__ == '__main__':
+    main()
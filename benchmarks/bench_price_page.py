@@ -0,0 +1,65 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, fetch_game_sales, fetch_game_sales_concurrently, get_pool
+
+
+def legacy_fetch_game_sales(cur, game_id):
+    '''The six queries game_dropdown used to run for one price page'''
+    sales = {}
+    for condition in ['loose', 'new', 'cib']:
+        cur.execute(f"SELECT * FROM {condition}_game_prices WHERE game_id = %s;", (game_id,))
+        sales[condition] = cur.fetchall()
+        cur.execute("SELECT game_url FROM avg_game_prices WHERE game_id = %s;", (game_id,))
+        game_url = cur.fetchone()[0]
+    return game_url, None, sales, None
+
+
+def time_calls(func, n):
+    '''Runs func n times and returns the latencies in milliseconds'''
+    latencies = []
+    for _ in range(n):
+        start = time.perf_counter()
+        func()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def report(name, latencies):
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f'{name:25s} p50={statistics.median(latencies):8.2f} ms  p99={p99:8.2f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the price page of one game against the local database')
+    parser.add_argument('--console-id', default='0')
+    parser.add_argument('--game-id', default='1')
+    parser.add_argument('-n', type=int, default=200)
+    args = parser.parse_args()
+
+    conn = get_pool().getconn()
+    try:
+        with conn.cursor() as cur:
+            report('queries (six queries)', time_calls(lambda: legacy_fetch_game_sales(cur, args.game_id), args.n))
+            report('queries (one query)', time_calls(lambda: fetch_game_sales(cur, args.game_id), args.n))
+            report('queries (concurrent)', time_calls(lambda: fetch_game_sales_concurrently(cur, args.game_id), args.n))
+    finally:
+        get_pool().putconn(conn)
+
+    client = app.test_client()
+    url = f'/games/{args.console_id}'
+    report('POST ' + url, time_calls(lambda: client.post(url, data={'game_id': args.game_id}), args.n))
+    for mode in ['lttb', 'daily', 'none']:
+        url = f'/chart-data/{args.game_id}?downsample={mode}'
+        print(f'{url} is {len(client.get(url).data):,d} bytes')
+        report('GET ' + url, time_calls(lambda: client.get(url), args.n))
+
+
+if __name__ == '__main__':
+    main()
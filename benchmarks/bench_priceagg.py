@@ -0,0 +1,60 @@
+import argparse
+import os
+import random
+import sys
+import time
+from itertools import groupby
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from priceagg import daily_stats, reference_daily_stats
+
+
+def fake_sales(n_sales, n_days, seed=0):
+    '''Builds unsorted (date, price) sales like the rows of a sales table'''
+    rng = random.Random(seed)
+    dates = [f'2023-{rng.randint(1, 12):02d}-{rng.randint(1, min(n_days, 28)):02d}' for _ in range(n_sales)]
+    prices = [f'${rng.uniform(1, 3000):,.2f}' for _ in range(n_sales)]
+    return dates, prices
+
+
+def groupby_average(dates, prices):
+    '''What game_dropdown used to do: list comprehension parse and itertools.groupby'''
+    y = [float(price.replace('$', '').replace(',', '')) for price in prices]
+    x_avg, y_avg = [], []
+    for key, group in groupby(zip(dates, y), key=lambda pair: pair[0]):
+        group_y = [pair[1] for pair in group]
+        x_avg.append(key)
+        y_avg.append(sum(group_y) / len(group_y))
+    return x_avg, y_avg
+
+
+def best_time(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark per-date price aggregation')
+    parser.add_argument('--sales', type=int, nargs='+', default=[100, 1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for n_sales in args.sales:
+        # daily_stats is checked against reference_daily_stats in tests/test_priceagg.py
+        dates, prices = fake_sales(n_sales, 28)
+        times = {
+            'groupby (mean only)': best_time(lambda: groupby_average(dates, prices), args.repeat),
+            'reference': best_time(lambda: reference_daily_stats(dates, prices), args.repeat),
+            'daily_stats': best_time(lambda: daily_stats(dates, prices), args.repeat),
+        }
+        print(f'{n_sales} sales: ' + '  '.join(f'{name}={elapsed * 1000:.2f} ms' for name, elapsed in times.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gamescraperapi import create_connection, SALES_TABLES, un, pw, port, db_name
+
+
+def plan_summary(cursor, query, params):
+    '''Runs EXPLAIN ANALYZE on query and returns the scan node types and the execution time'''
+    cursor.execute('EXPLAIN (ANALYZE, FORMAT JSON) ' + query, params)
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    plan = plan[0]
+    nodes = []
+    stack = [plan['Plan']]
+    while stack:
+        node = stack.pop()
+        if 'Scan' in node['Node Type']:
+            nodes.append(node['Node Type'])
+        stack.extend(node.get('Plans', []))
+    return nodes, plan['Execution Time']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the plan of a game lookup with and without the (game_id, date_sold) indexes')
+    parser.add_argument('--game-id', type=int, default=1)
+    args = parser.parse_args()
+
+    conn, cursor = create_connection(un, pw, port, db_name)
+    try:
+        for table in SALES_TABLES:
+            query = f'SELECT * FROM {table} WHERE game_id = %s ORDER BY date_sold;'
+            nodes, ms = plan_summary(cursor, query, (args.game_id,))
+            print(f'{table:20s} indexed:   {", ".join(nodes):30s} {ms:8.3f} ms')
+            # Drop the indexes inside the transaction only, they come back on rollback. The sale key
+            # starts with (game_id, date_sold) too, with it left the lookup would still use an index
+            cursor.execute(f'DROP INDEX IF EXISTS {table}_game_id_date_sold_idx;')
+            cursor.execute(f'DROP INDEX IF EXISTS {table}_sale_key;')
+            nodes, ms = plan_summary(cursor, query, (args.game_id,))
+            print(f'{table:20s} unindexed: {", ".join(nodes):30s} {ms:8.3f} ms')
+    finally:
+        conn.rollback()
+        cursor.close()
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gamescraperapi import scrape_games, scrape_pipeline, ScraperClient, HostRateLimiter
+from fakeserver import FakePriceChartingServer
+
+
+def fake_console_df(base_url, n_games):
+    '''Builds a console dataframe whose urls point at the fake server'''
+    return pd.DataFrame({
+        'game': [f'Game {i}' for i in range(1, n_games + 1)],
+        'url': [f'{base_url}/game/fake-console/{i}' for i in range(1, n_games + 1)],
+        'game_id': range(1, n_games + 1),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark scrape throughput against a local fake server')
+    parser.add_argument('--games', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8, 16])
+    parser.add_argument('--rate', type=float, default=1000.0)
+    parser.add_argument('--parse-workers', type=int, default=0,
+                        help='also run the fetch/parse pipeline with this many parser processes')
+    parser.add_argument('--n-sales', type=int, default=30)
+    args = parser.parse_args()
+
+    with FakePriceChartingServer(latency=args.latency, n_sales=args.n_sales) as server:
+        console_df = fake_console_df(server.base_url, args.games)
+        modes = [('threads', lambda df, workers, client: scrape_games(df, max_workers=workers, client=client))]
+        if args.parse_workers:
+            modes.append(('pipeline', lambda df, workers, client: scrape_pipeline(df, client, workers, args.parse_workers)))
+        for mode, scrape in modes:
+            for workers in args.workers:
+                client = ScraperClient(pool_size=workers, rate_limiter=HostRateLimiter(args.rate, workers))
+                start = time.perf_counter()
+                scraped = sum(1 for _ in scrape(console_df, workers, client))
+                elapsed = time.perf_counter() - start
+                stats = client.connection_stats()
+                client.close()
+                print(f'{mode:8s} workers={workers:3d} games={scraped} time={elapsed:.2f}s games/s={scraped / elapsed:.1f} '
+                      f'connections opened={stats["opened"]} reused={stats["reused"]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+import argparse
+import csv
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gamesearch import GameSearchIndex, normalize
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUERIES = ['mario', 'super mar', 'zelda ocarina', 'pokemn', 'final fantasy', 'sonic 2', 'x', '']
+
+
+def catalog_rows(copies):
+    '''Builds (game_id, console_id, game_url) rows from game_prices.csv, repeated copies times'''
+    rows = []
+    consoles = {}
+    with open(os.path.join(REPO_DIR, 'game_prices.csv'), encoding='utf-8') as f:
+        games = list(csv.DictReader(f))
+    for copy in range(copies):
+        for game in games:
+            # Same url cleaning as clean_game_prices, without needing pandas
+            game_url = re.sub(r'[:\[\].#?/,]', '', game['game'].lower().replace(' ', '-')).replace('amp;', '').replace('--', '-')
+            console_id = consoles.setdefault(f"{game['console']}-{copy}", len(consoles))
+            rows.append((len(rows) + 1, console_id, game_url))
+    return rows
+
+
+def linear_search(rows, query, console_id, limit):
+    '''What a LIKE query over the whole console does, scanning every game'''
+    query = normalize(query)
+    return [row for row in rows if (console_id is None or row[1] == console_id) and query in normalize(row[2])][:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the game search index against a linear scan')
+    parser.add_argument('--copies', type=int, default=1, help='times the csv catalog is repeated')
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--limit', type=int, default=10)
+    args = parser.parse_args()
+
+    rows = catalog_rows(args.copies)
+    start = time.perf_counter()
+    index = GameSearchIndex(rows)
+    print(f'Built the index of {len(index)} games in {time.perf_counter() - start:.2f}s')
+
+    for query in QUERIES:
+        for console_id in [None, 3]:
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                results = index.search(query, console_id, args.limit)
+            indexed = (time.perf_counter() - start) / args.repeat
+            start = time.perf_counter()
+            linear_search(rows, query, console_id, args.limit)
+            linear = time.perf_counter() - start
+            print(f'{query!r:16} console={console_id!s:4} index={indexed * 1e6:8.0f} us  scan={linear * 1e6:8.0f} us  '
+                  f'top={[result["name"] for result in results[:3]]}')
+
+
+if __name__ == '__main__':
+    main()
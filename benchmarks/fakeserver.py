@@ -0,0 +1,169 @@
+import glob
+import gzip
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Recorded PriceCharting product pages, written by record_fixtures.py
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def fake_sales_table(condition, n_sales, seed):
+    '''Builds a completed auctions table shaped like the ones on PriceCharting
+
+    Args:
+        condition: 'used', 'cib' or 'new'
+        n_sales: number of sale rows in the table
+        seed: seed so the same game always gets the same sales
+
+    Returns:
+        (string) html of the completed auctions division
+    '''
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n_sales):
+        date = f'2023-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}'
+        price = f'${rng.uniform(1, 300):,.2f}'
+        rows.append(f'''
+                <tr id="ebay-{seed}-{i}">
+                    <td class="date">{date}</td>
+                    <td class="title">
+                        <a href="#">Listing {i}
+                        </a>
+                        <a class="js-report" href="#">Report It</a>
+                    </td>
+                    <td class="numeric"><span class="js-price">{price}</span></td>
+                </tr>''')
+    return f'''
+        <div class="completed-auctions-{condition}">
+            <table class="hoverable-rows sortable">
+                <tbody>{''.join(rows)}
+                </tbody>
+            </table>
+        </div>'''
+
+
+def fake_product_page(game_id, n_sales=30):
+    '''Builds a full product page with used, cib and new completed auctions'''
+    tables = ''.join(fake_sales_table(condition, n_sales, game_id * 3 + i)
+                     for i, condition in enumerate(['used', 'cib', 'new']))
+    return f'''<!DOCTYPE html>
+<html>
+<head><title>Game {game_id}</title></head>
+<body>
+    <div class="tab-frame">{tables}
+    </div>
+</body>
+</html>'''
+
+
+def load_fixtures(fixtures_dir=FIXTURES_DIR):
+    '''Reads the recorded product pages saved by record_fixtures.py
+
+    Returns:
+        (dict) '<console>/<game_url>' -> html bytes, empty if nothing was recorded
+    '''
+    pages = {}
+    for path in sorted(glob.glob(os.path.join(fixtures_dir, '*.html.gz'))):
+        name = os.path.basename(path)[:-len('.html.gz')]
+        with gzip.open(path, 'rb') as f:
+            pages[name.replace('--', '/', 1)] = f.read()
+    return pages
+
+
+class FakePriceChartingServer:
+    '''Local HTTP server replaying product pages so scraping can be benchmarked offline
+
+    Paths like /game/<console>/<game_url> get the recorded page of that game if there is one.
+    Every other path ending in /<game_id> gets a recorded page picked by the id, or a generated
+    product page when no fixtures are given. Faults are injected at random, seeded so every run
+    sees the same ones.
+
+    Args:
+        latency: seconds to wait before answering each request
+        n_sales: number of sales in every completed auctions table of the generated pages
+        fixtures: dict of '<console>/<game_url>' -> html from load_fixtures
+        jitter: extra random latency of up to this many seconds
+        fault_rate: fraction of requests answered with one of fault_statuses instead of the page
+        fault_statuses: statuses the faults are picked from, e.g. 429 and 5xx
+        retry_after: Retry-After header sent with faults, None to leave it out
+    '''
+
+    def __init__(self, latency=0.05, n_sales=30, host='127.0.0.1', port=0, fixtures=None, jitter=0.0,
+                 fault_rate=0.0, fault_statuses=(429, 503), retry_after=0, seed=0):
+        self.latency = latency
+        self.n_sales = n_sales
+        self.fixtures = fixtures or {}
+        self.fixture_pages = [self.fixtures[key] for key in sorted(self.fixtures)]
+        self.jitter = jitter
+        self.fault_rate = fault_rate
+        self.fault_statuses = list(fault_statuses)
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.faults = {}
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                with server.lock:
+                    server.requests += 1
+                    delay = server.latency + server.rng.uniform(0, server.jitter)
+                    fault = server.rng.choice(server.fault_statuses) if server.rng.random() < server.fault_rate else None
+                    if fault is not None:
+                        server.faults[fault] = server.faults.get(fault, 0) + 1
+                time.sleep(delay)
+                if fault is not None:
+                    self.send_response(fault)
+                    if server.retry_after is not None:
+                        self.send_header('Retry-After', str(server.retry_after))
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                body = server.page(self.path)
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def page(self, path):
+        '''Returns the html served for a request path'''
+        path = path.split('?', 1)[0].rstrip('/')
+        key = path.split('/game/', 1)[-1]
+        if key in self.fixtures:
+            return self.fixtures[key]
+        slug = path.rsplit('/', 1)[-1]
+        game_id = int(slug) if slug.isdigit() else 0
+        if self.fixture_pages:
+            return self.fixture_pages[game_id % len(self.fixture_pages)]
+        return fake_product_page(game_id, self.n_sales).encode()
+
+    def get_stats(self):
+        with self.lock:
+            return {'requests': self.requests, 'faults': dict(self.faults)}
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
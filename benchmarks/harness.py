@@ -0,0 +1,286 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gamescraperapi import (PARSERS, parse_product_page, scrape_games, ScraperClient, HostRateLimiter,
+                            create_console_table, create_avg_game_prices_table, create_recent_sales_tables,
+                            create_price_summary_tables, insert_console_values, insert_avg_game_prices_values,
+                            bulk_insert, refresh_daily_sales_stats, refresh_console_avg_prices, touch_sales_versions)
+from metrics import metrics
+from fakeserver import FakePriceChartingServer, load_fixtures
+from bench_parse import load_pages
+from bench_scrape import fake_console_df
+from synthdata import synthetic_catalog, synthetic_sales, sales_rows, SALES_COLUMNS, CONDITIONS
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_DIR, 'benchmarks', 'results')
+SCENARIOS = ['parse', 'scrape', 'load', 'routes']
+# Scratch schema the database scenarios create their tables in, it is dropped and recreated by the load scenario
+BENCH_SCHEMA = 'gsda_bench'
+
+
+def latency_stats(latencies):
+    '''Returns the p50, p99 and mean of latencies given in seconds, in milliseconds'''
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return {'p50_ms': statistics.median(latencies) * 1000, 'p99_ms': p99 * 1000,
+            'mean_ms': statistics.fmean(latencies) * 1000}
+
+
+def bench_parse(args):
+    '''Per-page parse time of every installed parser backend on the recorded (or generated) pages'''
+    pages = load_pages(None, args.pages, args.n_sales)
+    results = {}
+    for name in PARSERS:
+        latencies = []
+        for _ in range(args.repeat):
+            for game_id, content in enumerate(pages, 1):
+                start = time.perf_counter()
+                parse_product_page(content, game_id, name)
+                latencies.append(time.perf_counter() - start)
+        results[name] = dict(latency_stats(latencies), pages=len(pages), pages_per_s=len(latencies) / sum(latencies))
+    return results
+
+
+def bench_scrape(args):
+    '''Scrape throughput against the replay server, with its latency and injected faults'''
+    fixtures = load_fixtures()
+    results = {}
+    with FakePriceChartingServer(latency=args.latency, n_sales=args.n_sales, fixtures=fixtures, jitter=args.jitter,
+                                 fault_rate=args.fault_rate, seed=args.seed) as server:
+        console_df = fake_console_df(server.base_url, args.games)
+        for workers in args.workers:
+            metrics.reset()
+            requests_before = server.get_stats()['requests']
+            client = ScraperClient(pool_size=workers, rate_limiter=HostRateLimiter(args.rate, workers))
+            n_ok = n_failed = 0
+            start = time.perf_counter()
+            for _, _, result, error in scrape_games(console_df, max_workers=workers, client=client):
+                if error is None:
+                    n_ok += 1
+                else:
+                    n_failed += 1
+            elapsed = time.perf_counter() - start
+            client.close()
+            results[f'workers_{workers}'] = {
+                'games': args.games,
+                'games_per_s': args.games / elapsed,
+                'failed': n_failed,
+                'requests': server.get_stats()['requests'] - requests_before,
+                'retries': metrics.get('scraper_http_retries_total'),
+            }
+        results['faults_served'] = {str(status): n for status, n in server.get_stats()['faults'].items()}
+        results['fixture_pages'] = len(fixtures)
+    return results
+
+
+def connect(args):
+    import psycopg2
+    from metrics import TimedCursor
+    conn = psycopg2.connect(args.dsn, options=f'-c search_path={BENCH_SCHEMA}', cursor_factory=TimedCursor)
+    return conn, conn.cursor()
+
+
+def bench_load(args):
+    '''Loads a synthetic catalog and millions of synthetic sales into the scratch schema'''
+    conn, cursor = connect(args)
+    cursor.execute(f'DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE; CREATE SCHEMA {BENCH_SCHEMA};')
+    create_console_table(cursor)
+    create_avg_game_prices_table(cursor)
+    create_recent_sales_tables(cursor)
+    create_price_summary_tables(cursor)
+    conn.commit()
+
+    gs_df, console_df = synthetic_catalog(args.games, seed=args.seed)
+    start = time.perf_counter()
+    insert_console_values(cursor, console_df)
+    insert_avg_game_prices_values(cursor, gs_df)
+    conn.commit()
+    catalog_s = time.perf_counter() - start
+
+    n_rows = 0
+    generate_s = 0.0
+    start = time.perf_counter()
+    for i, condition in enumerate(CONDITIONS):
+        chunks = synthetic_sales(gs_df['game_id'], args.sales_per_game, seed=args.seed + i)
+        while True:
+            generate_start = time.perf_counter()
+            sales_df = next(chunks, None)
+            generate_s += time.perf_counter() - generate_start
+            if sales_df is None:
+                break
+            n_rows += bulk_insert(cursor, f'{condition}_game_prices', SALES_COLUMNS, sales_rows(sales_df))
+        conn.commit()
+    sales_s = time.perf_counter() - start - generate_s
+
+    start = time.perf_counter()
+    refresh_daily_sales_stats(cursor, gs_df['game_id'])
+    touch_sales_versions(cursor, None)
+    refresh_console_avg_prices(cursor)
+    conn.commit()
+    summary_s = time.perf_counter() - start
+    cursor.close()
+    conn.close()
+    return {
+        'catalog': {'rows': len(gs_df), 'rows_per_s': len(gs_df) / catalog_s},
+        'sales': {'rows': n_rows, 'rows_per_s': n_rows / sales_s},
+        'summaries': {'refresh_s': summary_s},
+    }
+
+
+def bench_routes(args):
+    '''p50/p99 latency of the web app routes on the data of the load scenario'''
+    import app as webapp
+    from metrics import TimedCursor
+    # Point the app's pool at the scratch schema before it opens any connection
+    webapp.db_config.clear()
+    webapp.db_config.update(dsn=args.dsn, options=f'-c search_path={BENCH_SCHEMA}', cursor_factory=TimedCursor)
+    client = webapp.app.test_client()
+    rng = random.Random(args.seed)
+    gs_df, console_df = synthetic_catalog(args.games, seed=args.seed)
+    game_consoles = dict(zip(gs_df['game_id'], gs_df['console_id']))
+
+    def price_page():
+        game_id = rng.randint(1, args.games)
+        return client.post(f'/games/{game_consoles[game_id]}', data={'game_id': game_id})
+
+    routes = {
+        'game_prices_page': lambda: client.get(f'/game-prices?limit=100&after={rng.randint(0, args.games)}'),
+        'game_prices_filtered': lambda: client.get(f'/game-prices?console_id={rng.randrange(len(console_df))}&min_price=10&limit=50'),
+        'game_prices_conditional': lambda: client.get('/game-prices?limit=100', headers={'If-None-Match': etag}),
+        'search_games': lambda: client.get(f'/search-games?q=bench+game+{rng.randint(1, args.games)}&limit=10'),
+        'avg_game_prices_by_console': lambda: client.get('/avg-game-prices-by-console'),
+        'price_page': price_page,
+    }
+    etag = client.get('/game-prices?limit=100').headers.get('ETag', '')
+    results = {}
+    for name, call in routes.items():
+        latencies = []
+        errors = 0
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            response = call()
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+        results[name] = dict(latency_stats(latencies), requests=args.requests, errors=errors)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(results, prefix=''):
+    '''Flattens nested result dicts into 'scenario.case.metric' -> number'''
+    flat = {}
+    for key, value in results.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{name}.'))
+        elif isinstance(value, (int, float)):
+            flat[name] = value
+    return flat
+
+
+def compare(results, baseline, tolerance):
+    '''Returns the metrics that got worse than the baseline by more than tolerance
+
+    Metrics ending in _per_s should go up, metrics ending in _ms or _s should go down,
+    everything else is informational.
+    '''
+    current = flatten(results['scenarios'])
+    previous = flatten(baseline['scenarios'])
+    regressions = []
+    for name, value in sorted(current.items()):
+        old = previous.get(name)
+        if not old:
+            continue
+        if name.endswith('_per_s'):
+            change = (old - value) / old
+        elif name.endswith('_ms') or name.endswith('_s'):
+            change = (value - old) / old
+        else:
+            continue
+        if change > tolerance:
+            regressions.append((name, old, value, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the offline benchmark scenarios and save the results as JSON')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument('--dsn', default=os.environ.get('BENCH_DSN'),
+                        help=f'Postgres DSN for the load and routes scenarios, they use the {BENCH_SCHEMA} schema '
+                             'and are skipped without one')
+    parser.add_argument('--games', type=int, default=2000, help='games scraped, and games in the synthetic catalog')
+    parser.add_argument('--sales-per-game', type=int, default=200, help='synthetic sales per game and condition')
+    parser.add_argument('--pages', type=int, default=50, help='generated pages parsed when there are no fixtures')
+    parser.add_argument('--n-sales', type=int, default=30, help='sales per table of the generated pages')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--workers', type=int, nargs='+', default=[4, 16])
+    parser.add_argument('--rate', type=float, default=1000.0)
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds the replay server waits per request')
+    parser.add_argument('--jitter', type=float, default=0.02)
+    parser.add_argument('--fault-rate', type=float, default=0.02, help='fraction of requests answered 429 or 503')
+    parser.add_argument('--requests', type=int, default=200, help='requests sent to every route')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='results file, a timestamped file in benchmarks/results by default')
+    parser.add_argument('--baseline', help='results file to compare with, exits with 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='allowed slowdown against the baseline')
+    args = parser.parse_args()
+
+    runners = {'parse': bench_parse, 'scrape': bench_scrape, 'load': bench_load, 'routes': bench_routes}
+    results = {
+        'meta': {
+            'started': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'args': {key: value for key, value in vars(args).items() if key != 'dsn'},
+        },
+        'scenarios': {},
+    }
+    for scenario in args.scenarios:
+        if scenario in ('load', 'routes') and not args.dsn:
+            print(f'Skipping {scenario}, it needs --dsn or BENCH_DSN')
+            continue
+        print('Running', scenario)
+        start = time.perf_counter()
+        results['scenarios'][scenario] = runners[scenario](args)
+        print(json.dumps(results['scenarios'][scenario], indent=2))
+        print(f'{scenario} took {time.perf_counter() - start:.1f}s')
+
+    out = args.out
+    if out is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        out = os.path.join(RESULTS_DIR, datetime.datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    with open(out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print('Saved results to', out)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for name, old, new, change in regressions:
+            print(f'REGRESSION {name}: {old:.4g} -> {new:.4g} ({change:+.0%})')
+        if regressions:
+            sys.exit(1)
+        print('No regressions against', args.baseline)
+
+
+if __name__ == '__main__':
+    main()
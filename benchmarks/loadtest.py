@@ -0,0 +1,138 @@
+import argparse
+import http.client
+import json
+import random
+import socket
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit, urlencode
+
+# Requests sent per scenario, page is the price page, chart the /chart-data the page fetches next
+# and browse the two of them one after the other like a browser does
+SCENARIOS = ['page', 'chart', 'browse']
+
+
+def sample_games(base_url, n):
+    '''Returns (game_id, console_id) of the first n games of the server's /game-prices'''
+    url = urlsplit(base_url)
+    conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+    conn.request('GET', f'/game-prices?fields=game_id,console_id&limit={n}')
+    response = conn.getresponse()
+    if response.status != 200:
+        raise SystemExit(f'/game-prices answered {response.status}, is the app running on {base_url}?')
+    games = [(row['game_id'], row['console_id']) for row in json.loads(response.read())]
+    conn.close()
+    if not games:
+        raise SystemExit('The database has no games to request')
+    return games
+
+
+class Worker(threading.Thread):
+    '''Sends requests on one keep-alive connection until the deadline, like one user at a time'''
+
+    def __init__(self, base_url, scenario, games, deadline, seed):
+        super().__init__(daemon=True)
+        url = urlsplit(base_url)
+        self.host, self.port = url.hostname, url.port or 80
+        self.scenario = scenario
+        self.games = games
+        self.deadline = deadline
+        self.rng = random.Random(seed)
+        self.latencies = []
+        self.errors = 0
+        self.bytes = 0
+        self.conn = None
+
+    def send(self, method, path, body=None):
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'} if body else {}
+        for _ in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            try:
+                if self.conn.sock is None:
+                    self.conn.connect()
+                    # Send small requests right away instead of waiting for the ACK of the previous one
+                    self.conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self.conn.request(method, path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                data = response.read()
+                self.bytes += len(data)
+                return response.status
+            except (OSError, http.client.HTTPException):
+                # The server closed the keep-alive connection, reconnect once
+                self.conn.close()
+                self.conn = None
+        return None
+
+    def run(self):
+        while time.perf_counter() < self.deadline:
+            game_id, console_id = self.rng.choice(self.games)
+            start = time.perf_counter()
+            statuses = []
+            if self.scenario in ('page', 'browse'):
+                statuses.append(self.send('POST', f'/games/{console_id}', urlencode({'game_id': game_id})))
+            if self.scenario in ('chart', 'browse'):
+                statuses.append(self.send('GET', f'/chart-data/{game_id}'))
+            self.latencies.append(time.perf_counter() - start)
+            if any(status is None or status >= 400 for status in statuses):
+                self.errors += 1
+        if self.conn is not None:
+            self.conn.close()
+
+
+def run(base_url, scenario, games, concurrency, duration, seed):
+    '''Runs concurrency workers for duration seconds and returns the throughput and latency stats'''
+    deadline = time.perf_counter() + duration
+    workers = [Worker(base_url, scenario, games, deadline, seed + i) for i in range(concurrency)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    latencies = sorted(latency for worker in workers for latency in worker.latencies)
+    if not latencies:
+        return {'requests': 0}
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': sum(worker.errors for worker in workers),
+        'requests_per_s': len(latencies) / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p99_ms': p99 * 1000,
+        'max_ms': latencies[-1] * 1000,
+        'kb_per_request': sum(worker.bytes for worker in workers) / len(latencies) / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test a running web app (python app.py --serve) against its local database')
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--scenario', choices=SCENARIOS, default='browse')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32], help='users sending requests at once')
+    parser.add_argument('--duration', type=float, default=20, help='seconds every concurrency level runs')
+    parser.add_argument('--warmup', type=float, default=3, help='seconds of requests sent before measuring')
+    parser.add_argument('--games', type=int, default=1000, help='games requested, the first ones of /game-prices')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    games = sample_games(args.url, args.games)
+    print(f'{args.scenario} on {args.url}, {len(games)} games')
+    if args.warmup:
+        run(args.url, args.scenario, games, max(args.concurrency), args.warmup, args.seed)
+    results = []
+    for concurrency in args.concurrency:
+        result = run(args.url, args.scenario, games, concurrency, args.duration, args.seed)
+        results.append(result)
+        if not args.json and result['requests']:
+            print(f'concurrency={concurrency:<4d} {result["requests_per_s"]:8.1f} req/s  p50={result["p50_ms"]:8.2f} ms  '
+                  f'p99={result["p99_ms"]:8.2f} ms  max={result["max_ms"]:8.2f} ms  errors={result["errors"]}')
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
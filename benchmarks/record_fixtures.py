@@ -0,0 +1,48 @@
+import argparse
+import gzip
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gamescraperapi import read_game_prices, clean_game_prices, ScraperClient, HostRateLimiter
+from fakeserver import FIXTURES_DIR
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def fixture_path(fixtures_dir, console, game_url):
+    return os.path.join(fixtures_dir, f'{console}--{game_url}.html.gz')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record PriceCharting product pages as fixtures for the offline benchmarks')
+    parser.add_argument('--games', type=int, default=25, help='number of catalog games to record, picked at random')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--csv', default=os.path.join(REPO_DIR, 'game_prices.csv'))
+    parser.add_argument('--out', default=FIXTURES_DIR)
+    parser.add_argument('--rate', type=float, default=0.5, help='requests per second sent to PriceCharting')
+    args = parser.parse_args()
+
+    gs_df = clean_game_prices(read_game_prices(args.csv))
+    sample = gs_df.sample(n=min(args.games, len(gs_df)), random_state=args.seed)
+    os.makedirs(args.out, exist_ok=True)
+    client = ScraperClient(pool_size=1, rate_limiter=HostRateLimiter(args.rate, 1))
+    try:
+        for console, game_url, url in zip(sample['console'].astype(str), sample['game_url'], sample['url']):
+            path = fixture_path(args.out, console, game_url)
+            if os.path.exists(path):
+                continue
+            response = client.get(url)
+            if response.status_code != 200:
+                print('Skipping', url, 'status', response.status_code)
+                continue
+            with gzip.open(path, 'wb') as f:
+                f.write(response.content)
+            print('Recorded', url)
+    finally:
+        client.close()
+
+
+if __name__ == '__main__':
+    main()
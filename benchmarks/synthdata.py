@@ -0,0 +1,107 @@
+import argparse
+import datetime
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gamescraperapi import SCRAPE_DATE_COLUMN
+
+# Sales tables columns, in the order synthetic_sales returns them
+SALES_COLUMNS = ['game_id', 'date_sold', 'price_sold', 'sale_seq']
+CONDITIONS = ['loose', 'cib', 'new']
+
+
+def synthetic_catalog(n_games, n_consoles=20, seed=0):
+    '''Builds a cleaned catalog dataframe like clean_game_prices and add_console_id give
+
+    Args:
+        n_games: number of games
+        n_consoles: number of consoles the games are spread over
+        seed: seed so the same arguments always give the same catalog
+
+    Returns:
+        (dataframe, dataframe) game sales dataframe with game ids, console dataframe
+    '''
+    rng = np.random.default_rng(seed)
+    console_df = pd.DataFrame({'console': [f'bench-console-{i}' for i in range(n_consoles)],
+                               'console_id': range(n_consoles)})
+    game_ids = np.arange(1, n_games + 1)
+    console_ids = rng.integers(0, n_consoles, n_games)
+    loose = rng.lognormal(3, 1, n_games).round(2)
+    game_urls = [f'bench-game-{i}' for i in game_ids]
+    consoles = console_df['console'].to_numpy()[console_ids]
+    gs_df = pd.DataFrame({
+        'game_id': game_ids,
+        'console_id': console_ids,
+        'console': consoles,
+        'game': [url.replace('-', ' ') for url in game_urls],
+        'loose_val': loose,
+        'complete_val': (loose * rng.uniform(1.2, 2, n_games)).round(2),
+        'new_val': (loose * rng.uniform(2, 5, n_games)).round(2),
+        SCRAPE_DATE_COLUMN: pd.Timestamp('2023-06-01'),
+        'game_url': game_urls,
+        'url': [f'https://www.pricecharting.com/game/{console}/{url}' for console, url in zip(consoles, game_urls)],
+    })
+    return gs_df, console_df
+
+
+def synthetic_sales(game_ids, sales_per_game, seed=0, chunk_games=10000, start=datetime.date(2022, 1, 1), days=365):
+    '''Yields synthetic sales of every game, a chunk of games at a time so millions of rows fit in memory
+
+    Args:
+        game_ids: ids of the games to generate sales for
+        sales_per_game: number of sales of every game
+        seed: seed so the same arguments always give the same sales
+        chunk_games: number of games generated per chunk
+        start, days: sales are spread over the days from start on
+
+    Returns:
+        (generator) dataframes with the SALES_COLUMNS, sorted by game and date
+    '''
+    rng = np.random.default_rng(seed)
+    game_ids = np.asarray(game_ids)
+    for first in range(0, len(game_ids), chunk_games):
+        ids = game_ids[first:first + chunk_games]
+        n_rows = len(ids) * sales_per_game
+        base_prices = rng.lognormal(3, 1, len(ids))
+        sales_df = pd.DataFrame({
+            'game_id': np.repeat(ids, sales_per_game),
+            'date_sold': np.datetime64(start) + rng.integers(0, days, n_rows).astype('timedelta64[D]'),
+            'price_sold': (np.repeat(base_prices, sales_per_game) * rng.lognormal(0, 0.25, n_rows)).round(2),
+        })
+        sales_df = sales_df.sort_values(['game_id', 'date_sold'], kind='stable')
+        # Numbered within the game so every row has a distinct sale key
+        sales_df['sale_seq'] = np.tile(np.arange(sales_per_game), len(ids))
+        yield sales_df[SALES_COLUMNS]
+
+
+def sales_rows(sales_df):
+    '''Returns the rows of a synthetic sales dataframe in the shape bulk_insert takes'''
+    return zip(sales_df['game_id'].tolist(), sales_df['date_sold'].dt.date.tolist(),
+               sales_df['price_sold'].tolist(), sales_df['sale_seq'].tolist())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write synthetic catalog and sales csvs for load testing')
+    parser.add_argument('--games', type=int, default=10000)
+    parser.add_argument('--sales-per-game', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='.', help='directory the csvs are written to')
+    args = parser.parse_args()
+
+    gs_df, _ = synthetic_catalog(args.games, seed=args.seed)
+    gs_df.to_csv(os.path.join(args.out, 'synthetic_catalog.csv'), index=False)
+    path = os.path.join(args.out, 'synthetic_sales.csv')
+    n_rows = 0
+    for i, sales_df in enumerate(synthetic_sales(gs_df['game_id'], args.sales_per_game, args.seed)):
+        sales_df.to_csv(path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+        n_rows += len(sales_df)
+    print('Wrote', len(gs_df), 'games and', n_rows, 'sales to', args.out)
+
+
+if __name__ == '__main__':
+    main()
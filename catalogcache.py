@@ -0,0 +1,89 @@
+import time
+import threading
+from array import array
+
+
+class Catalog:
+    '''Immutable, compact copy of the consoles and the game list of every console
+
+    Games are kept in flat arrays sorted by console, so the whole catalog costs a few bytes
+    per game besides the url strings. The per-console game lists of the dropdowns are built
+    from rows() by GameSearchIndex.
+
+    Args:
+        generation: catalog generation the rows were read at
+        consoles: (console_id, console) rows
+        games: (game_id, console_id, game_url) rows
+    '''
+
+    def __init__(self, generation, consoles, games):
+        self.generation = generation
+        self.consoles = sorted((int(console_id), console) for console_id, console in consoles)
+        self.consoles_by_name = sorted(self.consoles, key=lambda row: row[1] or '')
+        self.console_names = dict(self.consoles)
+        games = sorted((int(console_id), int(game_id), game_url) for game_id, console_id, game_url in games)
+        self.game_ids = array('i', (game_id for _, game_id, _ in games))
+        self.console_ids = array('i', (console_id for console_id, _, _ in games))
+        self.game_urls = tuple(game_url for _, _, game_url in games)
+
+    def __len__(self):
+        return len(self.game_ids)
+
+    def rows(self):
+        '''Returns (game_id, console_id, game_url) rows of every game'''
+        return zip(self.game_ids, self.console_ids, self.game_urls)
+
+
+class CatalogCache:
+    '''Keeps the catalog in memory, shared by every thread of the web app
+
+    The catalog generation is read from the database at most once every refresh_interval
+    seconds and the catalog is only read again when the generation moved on, so in the
+    steady state the dropdown pages don't touch the database at all.
+
+    Args:
+        refresh_interval: seconds between checks of the catalog generation
+    '''
+
+    def __init__(self, refresh_interval=10):
+        self.refresh_interval = refresh_interval
+        self.catalog = None
+        self.checked = 0.0
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'checks': 0, 'reloads': 0, 'reload_seconds_total': 0.0}
+
+    def get(self, read_generation, read_catalog):
+        '''Returns the cached catalog, reloading it if the generation changed
+
+        Args:
+            read_generation: function returning the current catalog generation
+            read_catalog: function returning the (console rows, game rows) of the Catalog
+        '''
+        catalog = self.catalog
+        if catalog is not None and time.monotonic() - self.checked < self.refresh_interval:
+            self.stats['hits'] += 1
+            return catalog
+        with self.lock:
+            # Another thread may have checked while this one waited for the lock
+            if self.catalog is not None and time.monotonic() - self.checked < self.refresh_interval:
+                self.stats['hits'] += 1
+                return self.catalog
+            self.stats['checks'] += 1
+            generation = read_generation()
+            if self.catalog is None or generation != self.catalog.generation:
+                start = time.perf_counter()
+                consoles, games = read_catalog()
+                self.catalog = Catalog(generation, consoles, games)
+                self.stats['reloads'] += 1
+                self.stats['reload_seconds_total'] += time.perf_counter() - start
+            self.checked = time.monotonic()
+            return self.catalog
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            catalog = self.catalog
+        stats['generation'] = catalog.generation if catalog is not None else None
+        stats['games'] = len(catalog) if catalog is not None else 0
+        stats['consoles'] = len(catalog.consoles) if catalog is not None else 0
+        return stats
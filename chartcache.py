@@ -0,0 +1,142 @@
+import os
+import glob
+import time
+import threading
+from collections import OrderedDict
+
+# Directory shared by the web app and the scraper for the on-disk chart data tier, disabled when unset
+CHART_CACHE_DIR = os.environ.get('CHART_CACHE_DIR')
+
+
+def chart_file_name(game_id, variant, version):
+    return f'{game_id}-{variant}-{version}.json'
+
+
+def invalidate_chart_files(game_ids, disk_dir=CHART_CACHE_DIR):
+    '''Deletes the on-disk chart data of the given games
+
+    Called by the scraper for the games it touched, entries for older data versions
+    would never be hit again but there is no point in keeping them around.
+
+    Args:
+        game_ids: ids of the games whose sales changed
+        disk_dir: directory of the on-disk tier, nothing is done if it is None
+    '''
+    if not disk_dir:
+        return
+    for game_id in game_ids:
+        for path in glob.glob(os.path.join(disk_dir, f'{game_id}-*.json')):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class ChartCache:
+    '''Thread-safe LRU cache of built responses with a TTL and an optional on-disk tier
+
+    Holds the /chart-data JSON of price charts, keyed on (game_id, variant, data version) tuples
+    where the variant names the downsampling of the data. The data version changes every time
+    the scraper writes new sales for the game so stale chart data is never served. The on-disk
+    tier stores the JSON text; a cache without one can hold any value under any key.
+
+    Args:
+        max_entries: number of entries kept in memory
+        ttl: seconds an entry stays valid, None to keep entries until they are evicted
+        disk_dir: directory for the on-disk tier, None to only cache in memory
+    '''
+
+    def __init__(self, max_entries=256, ttl=3600, disk_dir=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'build_seconds_total': 0.0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def get(self, key):
+        '''Returns the cached value for key, None on a miss'''
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                created, value = entry
+                if not self._expired(created):
+                    self.entries.move_to_end(key)
+                    self.stats['hits'] += 1
+                    return value
+                del self.entries[key]
+
+        value = self._read_disk(key)
+        if value is not None:
+            with self.lock:
+                self.stats['disk_hits'] += 1
+            self._put_memory(key, value)
+            return value
+
+        with self.lock:
+            self.stats['misses'] += 1
+        return None
+
+    def put(self, key, value):
+        self._put_memory(key, value)
+        self._write_disk(key, value)
+
+    def get_or_build(self, key, build):
+        '''Returns the cached value for key, calling build() and caching its result on a miss'''
+        value = self.get(key)
+        if value is None:
+            start = time.perf_counter()
+            value = build()
+            with self.lock:
+                self.stats['build_seconds_total'] += time.perf_counter() - start
+            self.put(key, value)
+        return value
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self.entries)
+        lookups = stats['hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_ratio'] = (stats['hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        return stats
+
+    def _put_memory(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.time(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, chart_file_name(*key))
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            if self._expired(os.path.getmtime(path)):
+                os.remove(path)
+                return None
+            with open(path, encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_disk(self, key, value):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(value)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print('Fail to write chart data cache file due to the error:', e)
@@ -1,27 +1,81 @@
 import pandas as pd
-from pandas import Series, DataFrame
+from pandas import DataFrame
 import numpy as np
 from bs4 import BeautifulSoup
 import requests
 from requests.adapters import HTTPAdapter, Retry
 import time
+import sys
+import argparse
+import io
+import csv
+import hashlib
+import os
+import queue
+import multiprocessing
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from urllib.parse import urlsplit
 import psycopg2
+from psycopg2.extras import execute_values
+try:
+    from selectolax.parser import HTMLParser
+except ImportError:
+    HTMLParser = None
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+from chartcache import invalidate_chart_files
+from priceagg import parse_money
+from metrics import metrics, TimedCursor
+from snapshots import export_snapshot, SNAPSHOT_DIR
 # Python file that contains variables with a username, password, port # and database name
-from postgreslogin import un,pw,port,db_name
+try:
+    from postgreslogin import un,pw,port,db_name
+except ImportError:
+    # Fall back to the standard Postgres environment variables, e.g. for the offline benchmarks
+    un, pw, port, db_name = os.environ.get('PGUSER'), os.environ.get('PGPASSWORD'), os.environ.get('PGPORT', '5432'), os.environ.get('PGDATABASE')
 
 
-def read_game_prices(file_path):
+# Compact dtypes for the columns of game_prices.csv
+GAME_PRICES_DTYPES = {
+    'game': str,
+    'console': 'category',
+    'loose_val': 'float32',
+    'complete_val': 'float32',
+    'new_val': 'float32',
+}
+# Column of game_prices.csv holding the date the average prices were scraped
+SCRAPE_DATE_COLUMN = 'date(D/M/Y)'
+
+def parse_scrape_dates(gs_df):
+    gs_df[SCRAPE_DATE_COLUMN] = pd.to_datetime(gs_df[SCRAPE_DATE_COLUMN], format='%d/%m/%Y', errors='coerce')
+    return gs_df
+
+def read_game_prices(file_path, chunksize=None):
     '''Returns a dataframe from a filepath to a csv
     
     Args:
         string: file path to a csv
+        chunksize: if given, rows are read chunksize at a time and an iterator of dataframes is returned
 
     Returns:
-        (dataframe) Dataframe object containing the contents of the csv
+        (dataframe) Dataframe object containing the contents of the csv, with compact dtypes and parsed dates
     '''
-    gs_df = pd.read_csv(file_path)
-    gs_df = pd.DataFrame(gs_df)
-    return gs_df
+    gs_df = pd.read_csv(file_path, dtype=GAME_PRICES_DTYPES, chunksize=chunksize)
+    if chunksize is None:
+        return parse_scrape_dates(gs_df)
+    return (parse_scrape_dates(chunk) for chunk in gs_df)
+
+# Pricecharting urls that can't be built from the game name, keyed by (console, game_url)
+URL_OVERRIDES = {
+    ('nintendo-64', 'ique'): 'https://www.pricecharting.com/game/nintendo-64/ique-player',
+    ('gameboy-advance', 'ique'): 'https://www.pricecharting.com/game/gameboy-advance/ique-gameboy-advance',
+    ('wii', 'the-$1000000-pyramid'): 'https://www.pricecharting.com/game/wii/the-$1,000,000-pyramid',
+    ('nintendo-ds', 'pokemon-black-nintendo-dsi-system'): 'https://www.pricecharting.com/game/nintendo-ds/black-reshiram-&-zekrom-edition-nintendo-dsi',
+    ('gameboy-advance', "disney's-atlantis"): 'https://www.pricecharting.com/game/gameboy-advance/disney%27s-atlantis-the-lost-empire',
+}
 
 def clean_game_prices(gs_df):
     '''Returns a cleaned dataframe from the game sales dataframe
@@ -30,105 +84,434 @@ def clean_game_prices(gs_df):
         Dataframe: original dataframe
 
     Returns:
-        (dataframe) Cleaned Dataframe object with url values and a game id
+        (dataframe) Cleaned Dataframe object with url values, game ids are given by assign_game_ids
     '''
-    clean_df = gs_df.copy()
     # Drop values with no average values
-    clean_df = clean_df.dropna(subset=['loose_val', 'complete_val', 'new_val'])
+    clean_df = gs_df.dropna(subset=['loose_val', 'complete_val', 'new_val'])
 
     # Data engineer url column based on Game name
-    clean_df['game_url'] = clean_df['game'].str.lower()
-    clean_df['game_url'] = clean_df['game_url'].str.replace(' ', '-')
-    clean_df['game_url'] = clean_df['game_url'].str.replace("[:\[\].#?/,]",'',regex=True).str.replace('amp;','')
-    clean_df['game_url'] = clean_df['game_url'].str.replace('--', '-')
-    console_game_list = list(zip(clean_df['console'], clean_df['game_url']))
+    clean_df['game_url'] = (clean_df['game'].str.lower()
+                            .str.replace(' ', '-', regex=False)
+                            .str.replace("[:\[\].#?/,]", '', regex=True)
+                            .str.replace('amp;', '', regex=False)
+                            .str.replace('--', '-', regex=False))
     base_pc_url = 'https://www.pricecharting.com/game/'
-    url_list = []
-    for tpl in console_game_list:
-        url = base_pc_url + f'{tpl[0]}' + '/' + f'{tpl[1]}'
-        url_list.append(url)
-    clean_df['url'] = url_list
-    clean_df['game_id'] = range(len(clean_df))
-    clean_df['game_id'] += 1
+    clean_df['url'] = base_pc_url + clean_df['console'].astype(str) + '/' + clean_df['game_url']
 
     # Special Cases
-    clean_df.loc[clean_df['game_id'] == 3246, 'url'] = 'https://www.pricecharting.com/game/nintendo-64/ique-player'
-    clean_df.loc[clean_df['game_id'] == 3913, 'url'] = 'https://www.pricecharting.com/game/gameboy-advance/ique-gameboy-advance'
-    clean_df.loc[clean_df['game_id'] == 6769, 'url'] = 'https://www.pricecharting.com/game/wii/the-$1,000,000-pyramid'
-    clean_df.loc[clean_df['game_id'] == 6932, 'url'] = 'https://www.pricecharting.com/game/nintendo-ds/black-reshiram-&-zekrom-edition-nintendo-dsi'
-    clean_df.loc[clean_df['game_id'] == 4193, 'url'] = 'https://www.pricecharting.com/game/gameboy-advance/disney%27s-atlantis-the-lost-empire'
+    for (console, game_url), url in URL_OVERRIDES.items():
+        clean_df.loc[(clean_df['console'] == console) & (clean_df['game_url'] == game_url), 'url'] = url
     return clean_df
+
+def iter_clean_game_prices(file_path, chunksize=5000):
+    '''Reads and cleans the game prices csv a chunk at a time
+
+    Returns:
+        (generator) cleaned dataframes of at most chunksize rows
+    '''
+    for chunk in read_game_prices(file_path, chunksize):
+        yield clean_game_prices(chunk)
     
+class TokenBucket:
+    '''Thread-safe token bucket used to rate limit requests to a single host
+
+    Args:
+        rate: number of tokens added to the bucket per second
+        capacity: maximum number of tokens the bucket can hold (burst size)
+    '''
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        '''Blocks until a token is available and consumes it'''
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class HostRateLimiter:
+    '''Keeps one TokenBucket per host so every host gets its own request budget
+
+    Args:
+        rate: requests per second allowed for each host
+        capacity: burst size allowed for each host
+    '''
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, url):
+        '''Blocks until the host of url is allowed another request'''
+        host = urlsplit(url).netloc
+        with self.lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                bucket = TokenBucket(self.rate, self.capacity)
+                self.buckets[host] = bucket
+        bucket.acquire()
+
+
+class ScraperClient:
+    '''Long-lived HTTP client that keeps one pooled, keep-alive session for all page fetches
+
+    Args:
+        pool_size: number of connections kept open per host, should be at least the number of scraping threads
+        n_retries, backoff_factor, status_codes: retry settings, same defaults as send_request
+        rate_limiter: optional HostRateLimiter to wait on before every request
+    '''
+
+    def __init__(self,
+        pool_size=10,
+        n_retries=4,
+        backoff_factor=0.9,
+        status_codes=[504, 503, 502, 500, 429],
+        rate_limiter=None):
+        self.rate_limiter = rate_limiter
+        self.session = requests.Session()
+        self.session.headers.update({'Accept-Encoding': 'gzip, deflate', 'Connection': 'keep-alive'})
+        retries = Retry(connect=n_retries, backoff_factor=backoff_factor,
+         status_forcelist=status_codes)
+        self.adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries)
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+
+    def get(self, url, headers=None):
+        '''Sends a GET request through the shared session
+
+        Args:
+            url: link to request
+            headers: optional extra request headers, e.g. conditional request headers
+
+        Returns:
+            (response) response to website request
+        '''
+        if self.rate_limiter is not None:
+            with metrics.span('scraper_rate_limit_wait_seconds'):
+                self.rate_limiter.acquire(url)
+        with metrics.span('scraper_http_request_seconds'):
+            response = self.session.get(url, headers=headers)
+        metrics.inc('scraper_http_responses_total', status=response.status_code)
+        retries = getattr(response.raw, 'retries', None)
+        if retries is not None and retries.history:
+            metrics.inc('scraper_http_retries_total', len(retries.history))
+            for attempt in retries.history:
+                if attempt.status is not None:
+                    metrics.inc('scraper_http_retried_responses_total', status=attempt.status)
+        return response
+
+    def connection_stats(self):
+        '''Counts the connections opened and reused by the session's connection pools
+
+        Returns:
+            (dict) number of requests sent, connections opened and connections reused
+        '''
+        pools = self.adapter.poolmanager.pools
+        n_requests = 0
+        n_opened = 0
+        for key in pools.keys():
+            pool = pools[key]
+            n_requests += pool.num_requests
+            n_opened += pool.num_connections
+        return {'requests': n_requests, 'opened': n_opened, 'reused': max(n_requests - n_opened, 0)}
+
+    def close(self):
+        self.session.close()
+
+
+# Clients shared by send_request, one per retry configuration
+_clients = {}
+_clients_lock = threading.Lock()
 
 def send_request(url,
     n_retries=4,
     backoff_factor=0.9,
-    status_codes=[504, 503, 502, 500, 429]):
+    status_codes=[504, 503, 502, 500, 429],
+    client=None,
+    headers=None):
     '''Fixes issues with gamescraper sending requests to website to scrape
     
     Args:
         Only necessary argument is url, other arguments are better left default
+        client: ScraperClient to send the request with, a shared client with the given retry settings is used otherwise
+        headers: optional extra request headers
 
     Returns:
         (response) response to website request to to retrieve data
     '''
-    sess = requests.Session()
-    retries = Retry(connect=n_retries, backoff_factor=backoff_factor,
-     status_forcelist=status_codes)
-    sess.mount("https://", HTTPAdapter(max_retries=retries))
-    sess.mount("http://", HTTPAdapter(max_retries=retries))
-    response = sess.get(url)
-    return response
+    if client is None:
+        key = (n_retries, backoff_factor, tuple(status_codes))
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = ScraperClient(n_retries=n_retries, backoff_factor=backoff_factor, status_codes=status_codes)
+                _clients[key] = client
+    return client.get(url, headers=headers)
 
-def indivgamescraper(url, game_id):
+def check_response(result, url):
+    '''Raises if the website didn't answer with a product page
+
+    404s, block pages and anything else that isn't a 200 (or a 304 to a conditional request)
+    must not be parsed, they would be stored as a game without sales.
+    '''
+    if result.status_code not in (200, 304):
+        raise requests.HTTPError(f'{result.status_code} {result.reason} for url: {url}', response=result)
+
+def indivgamescraper(url, game_id, client=None, parser=None):
     '''Scrapes date sold and price sold values of the item in url
     
     Args:
         url: link of the item you're wishing to scrape
+        client: optional ScraperClient shared by concurrent scrapers
+        parser: name of the parser backend to use, see PARSERS
 
     Returns:
         (3 dataframes) cleaned dataframes of recently sold loose, cib, and new listings
     '''
 
-    # Generate different urls for used, complete-in-box and sealed sales
-    looseurl = url + '#completed-auctions-used'
-    ciburl = url + '#completed-auctions-cib'
-    newurl = url + '#completed-auctions-new'
+    # The used, complete-in-box and sealed sales are all tables on the same page,
+    # the '#completed-auctions-*' fragments never reach the server so one request is enough
+    result = send_request(url, client=client)
+    check_response(result, url)
+
+    loose_df, cib_df, new_df = parse_product_page(result.content, game_id, parser)
+    print("Just created df's for", game_id)
 
-    # Send request to website to retrieve data
-    lresult = send_request(looseurl)
-    cresult = send_request(ciburl)
-    nresult = send_request(newurl)
+    return loose_df, cib_df, new_df
 
-    # Get content from website
-    lc = lresult.content
-    cc = cresult.content
-    nc = nresult.content
+def sales_hash(dfs):
+    '''Hashes the date and price of every sale in the loose, cib and new dataframes'''
+    digest = hashlib.sha1()
+    for df in dfs:
+        digest.update(df[['date', 'price_sold']].to_csv(index=False).encode())
+        digest.update(b'|')
+    return digest.hexdigest()
 
-    # Scrape websites HTML using BeautifulSoup to find appropriate tables
-    lsoup = BeautifulSoup(lc, features='html.parser')
-    csoup = BeautifulSoup(cc, features='html.parser')
-    nsoup = BeautifulSoup(nc, features='html.parser')
+def scrape_game_incremental(url, game_id, state=None, client=None, parser=None):
+    '''Scrapes a game only if its sales changed since the previous scrape
 
-    ldivid = lsoup.find('div', {'class': 'tab-frame'})
-    cdivid = csoup.find('div', {'class': 'tab-frame'})
-    ndivid = nsoup.find('div', {'class': 'tab-frame'})
+    The page is requested with the ETag/Last-Modified of the previous scrape so the server can
+    answer 304, and the parsed sales are compared to the previous content hash.
 
-    lsummary = ldivid.find_all('div', {'class':'completed-auctions-used'})
-    csummary = cdivid.find_all('div', {'class':'completed-auctions-cib'})
-    nsummary = ndivid.find_all('div', {'class':'completed-auctions-new'})
+    Args:
+        url: link of the item you're wishing to scrape
+        game_id: id of the game
+        state: dict of etag, last_modified, content_hash and last_sale_dates (condition -> date) from the previous scrape,
+            None if never scraped
+        client: optional ScraperClient shared by concurrent scrapers
+        parser: name of the parser backend to use, see PARSERS
 
-    # Create the dataframe from the scraped html table
-    loose_df = html_cleaning(lsummary, game_id)
-    cib_df = html_cleaning(csummary, game_id)
-    new_df = html_cleaning(nsummary, game_id)
+    Returns:
+        (3 dataframes or None, dict) loose, cib and new sales from the previous last sale date of their condition on,
+        None if nothing changed, and the state to save for the next scrape
+    '''
+    state = dict(state or {})
+    headers = {}
+    if state.get('etag'):
+        headers['If-None-Match'] = state['etag']
+    if state.get('last_modified'):
+        headers['If-Modified-Since'] = state['last_modified']
+    result = send_request(url, client=client, headers=headers)
+    check_response(result, url)
+    if result.status_code == 304:
+        print('Unchanged', game_id)
+        return None, state
+    state['etag'] = result.headers.get('ETag')
+    state['last_modified'] = result.headers.get('Last-Modified')
+
+    dfs = parse_product_page(result.content, game_id, parser)
+    content_hash = sales_hash(dfs)
+    if content_hash == state.get('content_hash'):
+        print('Unchanged', game_id)
+        return None, state
+    state['content_hash'] = content_hash
+
+    # Every condition has its own cutoff, a cib sale showing up late is still newer than the last cib sale stored
+    last_sale_dates = dict(state.get('last_sale_dates') or {})
+    filtered = []
+    for condition, df in zip(SALE_CONDITIONS, dfs):
+        cutoff = last_sale_dates.get(condition)
+        if cutoff is not None:
+            # Sales on the cutoff date itself are kept, the sale key on the tables drops the ones already stored
+            df = df[df['date'].map(lambda date: date is not None and date >= cutoff)]
+        sale_dates = [date for date in df['date'] if date is not None]
+        if sale_dates:
+            last_sale_dates[condition] = max(sale_dates + ([cutoff] if cutoff is not None else []))
+        filtered.append(df)
+    dfs = tuple(filtered)
+    state['last_sale_dates'] = last_sale_dates
     print("Just created df's for", game_id)
+    return dfs, state
 
-    return loose_df, cib_df, new_df
+# Class suffix of the completed auctions division for loose, cib and new sales
+AUCTION_CLASSES = ['used', 'cib', 'new']
+# Conditions of the sales dataframes the parsers return, in order
+SALE_CONDITIONS = ['loose', 'cib', 'new']
+
+def missing_sales_division(game_id, cls=None):
+    '''Error raised by every parser when the page isn't a product page, e.g. a captcha or block page'''
+    division = 'tab-frame' if cls is None else f'completed-auctions-{cls}'
+    return ValueError(f'No {division} division on the page of game {game_id}, it is not a product page')
+
+def bs4_sales(content, game_id):
+    '''Parses a product page with BeautifulSoup and html_cleaning
+
+    Returns:
+        (3 dataframes) loose, cib and new sales
+    '''
+    with metrics.span('scraper_soup_seconds'):
+        soup = BeautifulSoup(content, features='html.parser')
+    divid = soup.find('div', {'class': 'tab-frame'})
+    if divid is None:
+        raise missing_sales_division(game_id)
+    dfs = []
+    for cls in AUCTION_CLASSES:
+        summary = divid.find_all('div', {'class': f'completed-auctions-{cls}'})
+        if not summary:
+            raise missing_sales_division(game_id, cls)
+        dfs.append(html_cleaning(summary, game_id))
+    return tuple(dfs)
+
+def selectolax_sales(content, game_id):
+    '''Parses a product page with selectolax, reading date/price pairs straight from the table rows
+
+    Returns:
+        (3 dataframes) loose, cib and new sales
+    '''
+    tree = HTMLParser(content)
+    frame = tree.css_first('div.tab-frame')
+    if frame is None:
+        raise missing_sales_division(game_id)
+    dfs = []
+    for cls in AUCTION_CLASSES:
+        division = frame.css_first(f'div.completed-auctions-{cls}')
+        if division is None:
+            raise missing_sales_division(game_id, cls)
+        table = division.css_first('table')
+        pairs = None
+        if table is not None:
+            pairs = []
+            for tr in table.css('tr'):
+                date = tr.css_first('td.date')
+                price = tr.css_first('span.js-price') or tr.css_first('td.numeric')
+                if date is not None and price is not None:
+                    pairs.append((date.text(strip=True), price.text(strip=True)))
+        dfs.append(sales_to_df(pairs, game_id))
+    return tuple(dfs)
+
+def _xpath_class(cls):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {cls} ')"
+
+def lxml_sales(content, game_id):
+    '''Parses a product page with lxml, reading date/price pairs straight from the table rows
+
+    Returns:
+        (3 dataframes) loose, cib and new sales
+    '''
+    doc = lxml.html.fromstring(content)
+    frames = doc.xpath(f"//div[{_xpath_class('tab-frame')}]")
+    if not frames:
+        raise missing_sales_division(game_id)
+    dfs = []
+    for cls in AUCTION_CLASSES:
+        divisions = frames[0].xpath(f".//div[{_xpath_class('completed-auctions-' + cls)}]")
+        if not divisions:
+            raise missing_sales_division(game_id, cls)
+        tables = divisions[0].xpath('.//table')
+        pairs = None
+        if tables:
+            pairs = []
+            for tr in tables[0].iter('tr'):
+                date = tr.xpath(f"./td[{_xpath_class('date')}]")
+                price = tr.xpath(f".//span[{_xpath_class('js-price')}]") or tr.xpath(f"./td[{_xpath_class('numeric')}]")
+                if date and price:
+                    pairs.append((date[0].text_content().strip(), price[0].text_content().strip()))
+        dfs.append(sales_to_df(pairs, game_id))
+    return tuple(dfs)
+
+def sales_to_df(pairs, game_id):
+    '''Builds the same dataframe as html_cleaning from (date, price) pairs
+
+    Args:
+        pairs: list of (date, price) text pairs, None if the page has no sales table
+        game_id: id of the game the sales belong to
+
+    Returns:
+        (dataframe) Cleaned dataframe
+    '''
+    # If there is no table found, create an 'empty row'
+    if pairs is None:
+        return DataFrame({'date': None, 'price_sold': 0, 'game_id': game_id, 'sale_seq': 0}, index=[0])
+    # 'Private Sale' rows have no price
+    pairs = [(date, price) for date, price in pairs if price.startswith('$')]
+    game_sales_df = DataFrame(pairs, columns=['date', 'price_sold'])
+    game_sales_df['game_id'] = game_id
+    return parse_sales_values(game_sales_df)
+
+def parse_sales_values(game_sales_df):
+    '''Parses the scraped date and price text once, at ingest, into dates and floats
 
+    Args:
+        game_sales_df: dataframe with 'date' and 'price_sold' text columns
+
+    Returns:
+        (dataframe) sales with date objects (None if unparseable) and float prices,
+        rows whose price can't be parsed are dropped. sale_seq numbers the sales sharing
+        a date and price so every sale on the page has its own key.
+    '''
+    dates = pd.to_datetime(game_sales_df['date'], errors='coerce')
+    prices = parse_money(game_sales_df['price_sold'])
+    game_sales_df = game_sales_df.assign(
+        date=dates.dt.date.astype(object).where(dates.notna(), None),
+        price_sold=prices)
+    game_sales_df = game_sales_df[~np.isnan(prices)]
+    return game_sales_df.assign(sale_seq=game_sales_df.groupby(['date', 'price_sold'], dropna=False).cumcount())
+
+# Parser backends by name, fastest first
+PARSERS = {}
+if HTMLParser is not None:
+    PARSERS['selectolax'] = selectolax_sales
+if lxml is not None:
+    PARSERS['lxml'] = lxml_sales
+PARSERS['bs4'] = bs4_sales
+
+def parse_product_page(content, game_id, parser=None):
+    '''Parses the loose, cib and new sales out of a product page
+
+    Args:
+        content: html of the product page
+        game_id: id of the game the page belongs to
+        parser: name of the backend in PARSERS, the fastest installed one is used by default
+
+    Returns:
+        (3 dataframes) loose, cib and new sales
+    '''
+    if parser is None:
+        parser = next(iter(PARSERS))
+    with metrics.span('scraper_parse_seconds', parser=parser):
+        return PARSERS[parser](content, game_id)
+
+@metrics.timed('scraper_html_cleaning_seconds')
 def html_cleaning(summary, game_id):
     '''Uses a summary from a BeautifulSoup object to parse information into a DataFrame
-    
+
+    Reads the date and price of every table row, so a 'Private Sale' row is dropped
+    on its own and the rows after it keep their dates and prices.
+
     Args: 
         summary: Uses the created summary from the html division
 
@@ -138,66 +521,19 @@ def html_cleaning(summary, game_id):
 
     tables = summary[0].find_all('table')
 
-    data=[]
-
     # If there is no table found, create an 'empty row'
     if len(tables) == 0:
-        game_sales_df = DataFrame(columns=['date','price_sold','game_id'])
-        new_row = DataFrame({'date': None, 'price_sold': 0, 'game_id': game_id}, index=[0])
-        game_sales_df = pd.concat([game_sales_df, new_row])
-        return game_sales_df
-    
-    # Otherwise, find the rows and collect the data
-    rows = tables[0].findAll('tr')
-
-    for tr in rows:
-        cols = tr.findAll('td')
-        for td in cols:
-            texts = td.findAll(text=True)
-            for text in texts:
-                data.append(text)
-
-    # Clean the data scraped
-    cleanerdata = []    
-    for item in data:
-        if '\n' not in item:
-            cleanerdata.append(item)
-    cleandata = []
-    for item in cleanerdata:
-        #if 'Report It' not in item:
-        if 'Report' not in item and 'It' not in item:
-            cleandata.append(item)
-
-    # Create the dataframe
-    index = 0 
-    date = []
-    price = []
-    for item in cleandata:
-        if index%2 == 0:
-            date.append(item)
-        else:
-            price.append(item.replace('$',''))
-        index +=1
+        return sales_to_df(None, game_id)
 
-    date = Series(date)
-    price = Series(price)
-
-    game_sales_df = pd.concat([date , price], axis=1)
-    game_sales_df.columns = ['date','price_sold']
-    game_sales_df['game_id'] = game_id
-
-    # EVERY TIME THERE IS A 'Private Sale' the following rows swap the date and price_sold
-    # After 'private_sold' drop nan values and swap 'price_sold' and 'date' columns for all rows after the dropped rows
-    if game_sales_df['price_sold'].eq('Private Sale').any():
-        mask = game_sales_df.index > game_sales_df[game_sales_df['price_sold'] == 'Private Sale'].index.max()
-        game_sales_df.loc[mask, ['date', 'price_sold']] = game_sales_df.loc[mask, ['price_sold', 'date']].values
-        # Select rows with 'Private Sale' in 'price_sold' column and drop them
-        game_sales_df = game_sales_df.drop(game_sales_df[game_sales_df['price_sold'] == 'Private Sale'].index)
-        game_sales_df = game_sales_df.dropna(axis=0)  # remove rows with nan values in 'price_sold' column
-        game_sales_df['price_sold'] = game_sales_df['price_sold'].str.replace('$', '', regex=True)  # remove '$' sign from 'price_sold' column
-        print(game_sales_df.to_string(index=False))
+    # Otherwise, find the rows and collect the data
+    pairs = []
+    for tr in tables[0].find_all('tr'):
+        date = tr.find('td', {'class': 'date'})
+        price = tr.find('span', {'class': 'js-price'}) or tr.find('td', {'class': 'numeric'})
+        if date is not None and price is not None:
+            pairs.append((date.get_text(strip=True), price.get_text(strip=True)))
 
-    return game_sales_df
+    return sales_to_df(pairs, game_id)
 
 def create_console_df(gs_df):
     '''Creates a separate df containing the different consoles and gives them a console id
@@ -208,7 +544,7 @@ def create_console_df(gs_df):
     Returns: 
         (dataframe) Dataframe with console and console id columns
     '''
-    console_df = pd.DataFrame({'console': gs_df['console'].unique()})
+    console_df = pd.DataFrame({'console': gs_df['console'].astype(object).unique()})
     console_df['console_id'] = pd.factorize(console_df['console'])[0]
     return console_df
 
@@ -223,7 +559,7 @@ def add_console_id(gs_df, console_df):
         (dataframe) Mapped gs_df games a respective console id column
     '''
     console_map = dict(zip(console_df['console'], console_df['console_id']))
-    gs_df['console_id'] = gs_df['console'].map(console_map)
+    gs_df['console_id'] = gs_df['console'].astype(object).map(console_map)
     return gs_df
 
 def create_connection(un, pw, port, db_name):
@@ -237,7 +573,7 @@ def create_connection(un, pw, port, db_name):
     '''
     try:
         conn = psycopg2.connect(dbname=db_name, user=un, password=pw, port=port, host='localhost')
-        cursor = conn.cursor()
+        cursor = conn.cursor(cursor_factory=TimedCursor)
         cursor.execute('SELECT version();')
         result = cursor.fetchone()
         print("The version of PostgreSQL is:", result)
@@ -245,6 +581,70 @@ def create_connection(un, pw, port, db_name):
         print('Fail to execute due to the error:', e)
     return conn, cursor
 
+def copy_rows(cursor, table, columns, rows):
+    '''Streams rows into a table in one round trip with COPY FROM STDIN
+
+    Args:
+        cursor: database cursor
+        table: name of the table to load
+        columns: list of column names, in the order of the values in each row
+        rows: iterable of row tuples, None values are loaded as NULL
+    '''
+    buf = io.StringIO()
+    csv.writer(buf).writerows(rows)
+    buf.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buf)
+
+def bulk_insert(cursor, table, columns, rows, method='copy', page_size=1000, on_conflict=None):
+    '''Loads rows into a table with COPY, falling back to batched execute_values
+
+    Args:
+        cursor: database cursor
+        table: name of the table to load
+        columns: list of column names, in the order of the values in each row
+        rows: iterable of row tuples
+        method: 'copy' to stream with COPY FROM STDIN, 'values' to use execute_values batches
+        page_size: number of rows per INSERT statement when using execute_values
+        on_conflict: optional ON CONFLICT action such as 'DO NOTHING', rows are then
+            copied into a staging table and upserted from there
+
+    Returns:
+        (int) number of rows written
+    '''
+    rows = list(rows)
+    if not rows:
+        return 0
+    column_list = ', '.join(columns)
+    if method == 'copy':
+        # Keep the transaction usable if the server refuses COPY (e.g. behind some poolers)
+        cursor.execute('SAVEPOINT bulk_insert;')
+        try:
+            if on_conflict is None:
+                copy_rows(cursor, table, columns, rows)
+            else:
+                staging = f'{table}_staging'
+                cursor.execute(f'CREATE TEMP TABLE IF NOT EXISTS {staging} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS;')
+                copy_rows(cursor, staging, columns, rows)
+                cursor.execute(f'INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {staging} ON CONFLICT {on_conflict};')
+            written = cursor.rowcount
+            if on_conflict is not None:
+                cursor.execute(f'TRUNCATE {staging};')
+            cursor.execute('RELEASE SAVEPOINT bulk_insert;')
+            metrics.inc('db_rows_written_total', written, table=table)
+            return written
+        except psycopg2.Error as e:
+            cursor.execute('ROLLBACK TO SAVEPOINT bulk_insert;')
+            print('COPY into', table, 'failed, falling back to execute_values:', e)
+    query = f"INSERT INTO {table} ({column_list}) VALUES %s"
+    if on_conflict is not None:
+        query += f' ON CONFLICT {on_conflict}'
+    written = 0
+    for start in range(0, len(rows), page_size):
+        execute_values(cursor, query, rows[start:start + page_size], page_size=page_size)
+        written += cursor.rowcount
+    metrics.inc('db_rows_written_total', written, table=table)
+    return written
+
 def create_console_table(cursor):
     try:
         query = '''
@@ -255,6 +655,7 @@ def create_console_table(cursor):
             );
         '''
         cursor.execute(query)
+        bump_catalog_generation(cursor)
         print('The consoles df has been created successfully')
     except psycopg2.Error as e:
         print('Fail to execute due to the error:', e)
@@ -263,13 +664,8 @@ def create_console_table(cursor):
 def insert_console_values(cursor, console_df):
     try:
         values = zip(console_df['console_id'], console_df['console'])
-        query = '''
-                    INSERT INTO
-                    consoles (console_id, console)
-                    VALUES (%s, %s)
-                    ;
-                '''
-        cursor.executemany(query, values)
+        bulk_insert(cursor, 'consoles', ['console_id', 'console'], values)
+        bump_catalog_generation(cursor)
         print('Inserted records into consoles')  
     except psycopg2.Error as e:
         print('Fail to execute due to the error:', e)
@@ -292,36 +688,182 @@ def create_avg_game_prices_table(cursor):
                 '''
         
         cursor.execute(query)
+        bump_catalog_generation(cursor)
 
         print('The avg_game_prices table has been created successfully')
     except psycopg2.Error as e:
         print('Fail to execute due to the error:', e)
 
+# Columns of avg_game_prices, in the order avg_game_prices_rows returns them
+AVG_GAME_PRICES_COLUMNS = ['game_id', 'console_id', 'loose_val', 'complete_val', 'new_val', 'date_scraped', 'game_url', 'url']
+
+def avg_game_prices_rows(gs_df):
+    '''Returns the avg_game_prices rows of a cleaned game sales dataframe'''
+    # float32 prices are rounded back to cents, dates are stored in the csv's D/M/Y format
+    prices = [gs_df[column].astype(float).round(2) for column in ['loose_val', 'complete_val', 'new_val']]
+    dates = gs_df[SCRAPE_DATE_COLUMN]
+    dates = dates.dt.strftime('%d/%m/%Y').astype(object).where(dates.notna(), None)
+    return zip(gs_df['game_id'], gs_df["console_id"], *prices, dates, gs_df["game_url"], gs_df["url"])
+
 def insert_avg_game_prices_values(cursor, gs_df):
     try:
-        values = zip(gs_df['game_id'], gs_df["console_id"], gs_df["loose_val"], gs_df["complete_val"], gs_df["new_val"], gs_df["date(D/M/Y)"], gs_df["game_url"], gs_df["url"])
-
-        query = '''
-                INSERT INTO
-                avg_game_prices (game_id, console_id, loose_val, complete_val, new_val, date_scraped, game_url, url)
-                VALUES (%s, %s, %s, %s, %s, %s, %s,%s)
-                ;
-                '''
-        cursor.executemany(query, values)
+        bulk_insert(cursor, 'avg_game_prices', AVG_GAME_PRICES_COLUMNS, avg_game_prices_rows(gs_df))
+        bump_catalog_generation(cursor)
+        refresh_console_avg_prices(cursor)
         print('Inserted records into avg_game_prices')
     except psycopg2.Error as e:
         print('Fail to execute due to the error:', e)
 
+def create_game_keys_table(cursor):
+    '''Creates the table that gives every (console, game_url) a stable game id, if it doesn't exist
+
+    Ids are handed out once and never depend on the row order of the csv. When the table is
+    first created the ids already in avg_game_prices are kept, so scraped sales stay attached.
+    '''
+    try:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS game_keys
+            (game_id serial PRIMARY KEY,
+            console varchar NOT NULL,
+            game_url varchar NOT NULL,
+            UNIQUE (console, game_url)
+            );
+        ''')
+        cursor.execute('SELECT EXISTS (SELECT 1 FROM game_keys);')
+        seeded = cursor.fetchone()[0]
+        cursor.execute("SELECT to_regclass('avg_game_prices') IS NOT NULL AND to_regclass('consoles') IS NOT NULL;")
+        if not seeded and cursor.fetchone()[0]:
+            cursor.execute('''
+                INSERT INTO game_keys (game_id, console, game_url)
+                SELECT DISTINCT ON (c.console, a.game_url) a.game_id, c.console, a.game_url
+                FROM avg_game_prices a JOIN consoles c ON c.console_id = a.console_id
+                WHERE a.game_url IS NOT NULL
+                ORDER BY c.console, a.game_url, a.game_id
+                ON CONFLICT DO NOTHING;
+            ''')
+            n_seeded = cursor.rowcount
+            # New games are numbered after the highest id that was kept
+            cursor.execute("SELECT setval(pg_get_serial_sequence('game_keys', 'game_id'), COALESCE(MAX(game_id), 0) + 1, false) FROM game_keys;")
+            print('Seeded game_keys with', n_seeded, 'existing game ids')
+        print('The game_keys table is ready')
+    except psycopg2.Error as e:
+        print('Fail to execute due to the error:', e)
+
+def assign_game_ids(cursor, gs_df, register=True):
+    '''Adds the stable game_id of every game in a cleaned game sales dataframe
+
+    Args:
+        cursor: database cursor
+        gs_df: cleaned game sales dataframe
+        register: give games that are new to game_keys an id, otherwise they are dropped
+
+    Returns:
+        (dataframe) gs_df with a game_id column, one row per (console, game_url)
+    '''
+    gs_df = (gs_df.drop(columns=['game_id'], errors='ignore')
+             .assign(console_key=gs_df['console'].astype(str))
+             .drop_duplicates(subset=['console_key', 'game_url']))
+    keys = list(gs_df[['console_key', 'game_url']].itertuples(index=False, name=None))
+    if not keys:
+        return gs_df.drop(columns=['console_key']).assign(game_id=pd.Series(dtype='int64'))
+    if register:
+        execute_values(cursor, 'INSERT INTO game_keys (console, game_url) VALUES %s ON CONFLICT (console, game_url) DO NOTHING', keys)
+    ids = execute_values(cursor, '''
+        SELECT k.console, k.game_url, k.game_id FROM game_keys k
+        JOIN (VALUES %s) v (console, game_url) ON v.console = k.console AND v.game_url = k.game_url
+    ''', keys, fetch=True)
+    ids_df = pd.DataFrame(ids, columns=['console_key', 'game_url', 'game_id'])
+    merged = gs_df.merge(ids_df, on=['console_key', 'game_url'], how='left')
+    missing = merged['game_id'].isna()
+    if missing.any():
+        print(int(missing.sum()), 'games are not in game_keys yet, run with --sync-catalog to add them')
+    merged = merged[~missing].drop(columns=['console_key'])
+    merged['game_id'] = merged['game_id'].astype('int64')
+    return merged
+
+def load_console_df(cursor):
+    '''Returns the consoles table as a console dataframe'''
+    cursor.execute('SELECT console, console_id FROM consoles ORDER BY console_id;')
+    return pd.DataFrame(cursor.fetchall(), columns=['console', 'console_id'])
+
+def sync_consoles(cursor, consoles):
+    '''Adds consoles that aren't in the consoles table yet, existing consoles keep their id
+
+    Args:
+        cursor: database cursor
+        consoles: console names, in the order new ones should get their ids
+
+    Returns:
+        (dataframe) Console dataframe of every console in the table
+    '''
+    console_df = load_console_df(cursor)
+    known = set(console_df['console'])
+    next_id = int(console_df['console_id'].max()) + 1 if len(console_df) else 0
+    new_consoles = [console for console in dict.fromkeys(consoles) if console not in known]
+    if new_consoles:
+        new_df = pd.DataFrame({'console': new_consoles, 'console_id': range(next_id, next_id + len(new_consoles))})
+        insert_console_values(cursor, new_df)
+        console_df = pd.concat([console_df, new_df], ignore_index=True)
+    return console_df
+
+# Only rows whose values changed are rewritten when the catalog is synced
+AVG_GAME_PRICES_UPSERT = '''(game_id) DO UPDATE SET
+    console_id = EXCLUDED.console_id, loose_val = EXCLUDED.loose_val, complete_val = EXCLUDED.complete_val,
+    new_val = EXCLUDED.new_val, date_scraped = EXCLUDED.date_scraped, game_url = EXCLUDED.game_url, url = EXCLUDED.url
+    WHERE (avg_game_prices.console_id, avg_game_prices.loose_val, avg_game_prices.complete_val, avg_game_prices.new_val,
+           avg_game_prices.date_scraped, avg_game_prices.game_url, avg_game_prices.url)
+    IS DISTINCT FROM (EXCLUDED.console_id, EXCLUDED.loose_val, EXCLUDED.complete_val, EXCLUDED.new_val,
+           EXCLUDED.date_scraped, EXCLUDED.game_url, EXCLUDED.url)'''
+
+def sync_catalog(cursor, file_path, chunksize=5000):
+    '''Upserts the game prices csv into the consoles and avg_game_prices tables a chunk at a time
+
+    Games keep their id from game_keys, so a changed csv only rewrites the rows that changed and
+    the scraped sales of existing games are kept. Only one chunk is in memory at a time.
+
+    Args:
+        cursor: database cursor
+        file_path: path to the game prices csv
+        chunksize: number of csv rows read, cleaned and upserted at a time
+
+    Returns:
+        (dataframe) Console dataframe of every console in the table
+    '''
+    create_game_keys_table(cursor)
+    # First pass over the console and price columns only, so every console exists before its games
+    consoles = []
+    usecols = ['console', 'loose_val', 'complete_val', 'new_val']
+    for chunk in pd.read_csv(file_path, usecols=usecols, dtype=GAME_PRICES_DTYPES, chunksize=chunksize):
+        consoles.extend(chunk.dropna(subset=usecols[1:])['console'].astype(object).unique())
+    console_df = sync_consoles(cursor, consoles)
+
+    n_games = n_changed = 0
+    for clean_df in iter_clean_game_prices(file_path, chunksize):
+        clean_df = assign_game_ids(cursor, add_console_id(clean_df, console_df))
+        n_changed += bulk_insert(cursor, 'avg_game_prices', AVG_GAME_PRICES_COLUMNS, avg_game_prices_rows(clean_df),
+                                 on_conflict=AVG_GAME_PRICES_UPSERT)
+        n_games += len(clean_df)
+    refresh_console_avg_prices(cursor)
+    if n_changed:
+        bump_catalog_generation(cursor)
+        # The web app's ETags and caches follow sales_versions, move them on for the new catalog
+        create_sales_versions_table(cursor)
+        touch_sales_versions(cursor, None)
+    print('Synced', n_games, 'games into avg_game_prices,', n_changed, 'added or changed')
+    return console_df
+
 def create_recent_sales_tables(cursor):
     try:
         query = '''
                 DROP TABLE IF EXISTS loose_game_prices;
                 CREATE TABLE loose_game_prices
                 (game_id integer,
-                date_sold varchar,
-                price_sold money,
+                date_sold date,
+                price_sold numeric(12,2),
+                sale_seq smallint NOT NULL DEFAULT 0,
                 FOREIGN KEY (game_id) REFERENCES avg_game_prices (game_id)
-                );                
+                );
+                CREATE UNIQUE INDEX loose_game_prices_sale_key ON loose_game_prices (game_id, date_sold, price_sold, sale_seq);
                 '''
         cursor.execute(query)
         print('The loose_game_prices table has been created successfully')
@@ -330,10 +872,12 @@ def create_recent_sales_tables(cursor):
                 DROP TABLE IF EXISTS cib_game_prices;
                 CREATE TABLE cib_game_prices
                 (game_id integer,
-                date_sold varchar,
-                price_sold money,
+                date_sold date,
+                price_sold numeric(12,2),
+                sale_seq smallint NOT NULL DEFAULT 0,
                 FOREIGN KEY (game_id) REFERENCES avg_game_prices (game_id)
-                );                
+                );
+                CREATE UNIQUE INDEX cib_game_prices_sale_key ON cib_game_prices (game_id, date_sold, price_sold, sale_seq);
                 '''
         cursor.execute(query)
         print('The cib_game_prices table has been created successfully')
@@ -342,119 +886,923 @@ def create_recent_sales_tables(cursor):
                 DROP TABLE IF EXISTS new_game_prices;
                 CREATE TABLE new_game_prices
                 (game_id integer,
-                date_sold varchar,
-                price_sold money,
+                date_sold date,
+                price_sold numeric(12,2),
+                sale_seq smallint NOT NULL DEFAULT 0,
                 FOREIGN KEY (game_id) REFERENCES avg_game_prices (game_id)
-                );                
+                );
+                CREATE UNIQUE INDEX new_game_prices_sale_key ON new_game_prices (game_id, date_sold, price_sold, sale_seq);
                 '''
         cursor.execute(query)
         print('The new_game_prices table has been created successfully') 
+
+        # The state and the daily statistics of the previous scrapes describe sales that are gone,
+        # an incremental scrape would skip every unchanged page and leave the new tables empty
+        create_scrape_state_table(cursor)
+        create_price_summary_tables(cursor)
+        cursor.execute('TRUNCATE scrape_state, daily_sales_stats;')
+        print('The scrape_state and daily_sales_stats tables have been emptied')
+
+        create_sales_versions_table(cursor)
+        # The sales tables were just emptied, so every game's sales changed
+        touch_sales_versions(cursor, None)
+        print('The sales_versions table has been created successfully') 
     except psycopg2.Error as e:
         print('Fail to execute due to the error:', e) 
 
-def update_recent_sales_tables(cursor, console_df):
-
-    for i in range(len(console_df)):
-        loose_df = pd.DataFrame(columns=['date', 'price_sold', 'game_id'])
-        cib_df = pd.DataFrame(columns=['date', 'price_sold', 'game_id'])
-        new_df = pd.DataFrame(columns=['date', 'price_sold', 'game_id'])
-        time.sleep(1)
-        url = console_df.iloc[i]['url']
-        id = console_df.iloc[i]['game_id']
-        g_name = console_df.iloc[i]['game']
-        print('Trying to add', g_name)
-        l_df, c_df, n_df = indivgamescraper(url, id)
-        loose_df = pd.concat([loose_df, l_df])
-        cib_df = pd.concat([cib_df, c_df])
-        new_df = pd.concat([new_df, n_df])
-        try: 
-            values = zip(loose_df['date'], loose_df['price_sold'], loose_df['game_id'])
-            query = '''
-                    INSERT INTO loose_game_prices (date_sold, price_sold, game_id)
-                    VALUES (%s, %s, %s)
-                    ;
-                    '''
-            cursor.executemany(query, values)
-
-            values = zip(cib_df['date'], cib_df['price_sold'], cib_df['game_id'])
-            query = '''
-                    INSERT INTO cib_game_prices (date_sold, price_sold, game_id)
-                    VALUES (%s, %s, %s)
-                    ;
-                    '''
-            cursor.executemany(query, values)
-
-            values = zip(new_df['date'], new_df['price_sold'], new_df['game_id'])
-            query = '''
-                    INSERT INTO new_game_prices (date_sold, price_sold, game_id)
-                    VALUES (%s, %s, %s)
-                    ;
-                    '''
-            cursor.executemany(query, values)
-        except psycopg2.Error as e:
-            print('Fail to execute due to the error:', e, '\n On game id:', id)
-            # continue loop // now it should exit as you don't want to commit any changes to the db if there's an error
-            exit()
-
-
-
-def choose_console_update(cursor, console_dataframes):
-    console_dict = {
-        'wii-u': 0,
-        'nintendo-switch': 1,
-        'gameboy': 2,
-        'super-nintendo': 3,
-        'nes': 4,
-        'nintendo-64': 5,
-        'gameboy-advance': 6,
-        'gamecube': 7,
-        'wii': 8,
-        'nintendo-ds': 9
-    }
+# Recently sold tables, one per condition
+SALES_TABLES = ['loose_game_prices', 'cib_game_prices', 'new_game_prices']
+
+def migrate_sales_tables(cursor):
+    '''Converts sales tables created with varchar dates and money prices to date and numeric columns
+
+    Also adds the unique sale key (game_id, date_sold, price_sold, sale_seq) that lets re-scrapes
+    skip stored sales. It starts with (game_id, date_sold), so it is also the index every game
+    lookup uses and the separate (game_id, date_sold) index of older tables is dropped.
+    Safe to run on tables that are already migrated.
+
+    Args:
+        cursor: database cursor
+    '''
+    for table in SALES_TABLES + ['daily_sales_stats']:
+        cursor.execute('''
+                SELECT column_name, data_type
+                FROM information_schema.columns
+                WHERE table_name = %s AND column_name IN ('date_sold', 'price_sold', 'sale_seq')
+                ;
+                ''', (table,))
+        types = dict(cursor.fetchall())
+        alters = []
+        if types.get('date_sold') == 'character varying':
+            alters.append("ALTER COLUMN date_sold TYPE date USING NULLIF(date_sold, '')::date")
+        if types.get('price_sold') == 'money':
+            alters.append('ALTER COLUMN price_sold TYPE numeric(12,2) USING price_sold::numeric')
+        if alters:
+            cursor.execute(f"ALTER TABLE {table} {', '.join(alters)};")
+            print('Converted', table, 'to date and numeric columns')
+        if table in SALES_TABLES and types and 'sale_seq' not in types:
+            # Number existing rows sharing a sale key instead of deleting them, so the unique index can be built
+            cursor.execute(f'''
+                    ALTER TABLE {table} ADD COLUMN sale_seq smallint;
+                    UPDATE {table} SET sale_seq = numbered.seq
+                    FROM (SELECT ctid, row_number() OVER (PARTITION BY game_id, date_sold, price_sold ORDER BY ctid) - 1 AS seq
+                          FROM {table}) numbered
+                    WHERE {table}.ctid = numbered.ctid;
+                    ALTER TABLE {table} ALTER COLUMN sale_seq SET DEFAULT 0, ALTER COLUMN sale_seq SET NOT NULL;
+                    ''')
+            print('Added sale keys to', table)
+    for table in SALES_TABLES:
+        cursor.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS {table}_sale_key ON {table} (game_id, date_sold, price_sold, sale_seq);')
+        cursor.execute(f'DROP INDEX IF EXISTS {table}_game_id_date_sold_idx;')
+
+def create_scrape_state_table(cursor):
+    '''Creates the table holding every game's high-water mark for incremental scrapes if it doesn't exist'''
+    query = '''
+            CREATE TABLE IF NOT EXISTS scrape_state
+            (game_id integer PRIMARY KEY,
+            etag varchar,
+            last_modified varchar,
+            content_hash varchar,
+            last_sale_date date,
+            scraped_at timestamptz NOT NULL DEFAULT now(),
+            FOREIGN KEY (game_id) REFERENCES avg_game_prices (game_id)
+            );
+            ALTER TABLE scrape_state
+                ADD COLUMN IF NOT EXISTS last_loose_date date,
+                ADD COLUMN IF NOT EXISTS last_cib_date date,
+                ADD COLUMN IF NOT EXISTS last_new_date date;
+            '''
+    cursor.execute(query)
+
+def load_scrape_states(cursor, game_ids):
+    '''Returns a dict of game_id -> state saved by the previous scrape of each game'''
+    cursor.execute('''
+            SELECT game_id, etag, last_modified, content_hash, last_loose_date, last_cib_date, last_new_date
+            FROM scrape_state
+            WHERE game_id = ANY(%s)
+            ;
+            ''', ([int(id) for id in game_ids],))
+    # States saved with a single last_sale_date across conditions have no per condition dates, their
+    # next scrape keeps every sale and the sale key drops the ones already stored
+    return {game_id: {'etag': etag, 'last_modified': last_modified, 'content_hash': content_hash,
+                      'last_sale_dates': {condition: date for condition, date in zip(SALE_CONDITIONS, dates) if date is not None}}
+            for game_id, etag, last_modified, content_hash, *dates in cursor.fetchall()}
+
+def save_scrape_state(cursor, game_id, state):
+    last_sale_dates = state.get('last_sale_dates') or {}
+    cursor.execute('''
+            INSERT INTO scrape_state
+            (game_id, etag, last_modified, content_hash, last_sale_date, last_loose_date, last_cib_date, last_new_date, scraped_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, now())
+            ON CONFLICT (game_id) DO UPDATE SET
+                etag = EXCLUDED.etag,
+                last_modified = EXCLUDED.last_modified,
+                content_hash = EXCLUDED.content_hash,
+                last_sale_date = EXCLUDED.last_sale_date,
+                last_loose_date = EXCLUDED.last_loose_date,
+                last_cib_date = EXCLUDED.last_cib_date,
+                last_new_date = EXCLUDED.last_new_date,
+                scraped_at = EXCLUDED.scraped_at
+            ;
+            ''', (int(game_id), state.get('etag'), state.get('last_modified'), state.get('content_hash'),
+                  max(last_sale_dates.values(), default=None),
+                  *(last_sale_dates.get(condition) for condition in SALE_CONDITIONS)))
+
+def create_sales_versions_table(cursor):
+    '''Creates the table holding the version of every game's sales if it doesn't exist
+
+    The web app keys its chart cache on these versions.
+    '''
+    query = '''
+            CREATE TABLE IF NOT EXISTS sales_versions
+            (game_id integer PRIMARY KEY,
+            updated_at timestamptz NOT NULL DEFAULT clock_timestamp(),
+            FOREIGN KEY (game_id) REFERENCES avg_game_prices (game_id)
+            );
+            '''
+    cursor.execute(query)
+
+def touch_sales_versions(cursor, game_ids):
+    '''Moves the sales version of the given games forward so cached charts of them are no longer used
+
+    Args:
+        cursor: database cursor
+        game_ids: ids of the games whose sales changed, None for every game
+    '''
+    query = '''
+            INSERT INTO sales_versions (game_id)
+            {}
+            ON CONFLICT (game_id) DO UPDATE SET updated_at = clock_timestamp()
+            ;
+            '''
+    if game_ids is None:
+        cursor.execute(query.format('SELECT game_id FROM avg_game_prices'))
+    else:
+        execute_values(cursor, query.format('VALUES %s'), [(int(id),) for id in game_ids])
+
+def bump_catalog_generation(cursor):
+    '''Moves the catalog generation forward so the web app reloads its cached consoles and games
+
+    Called by every function that changes the consoles or avg_game_prices tables.
+    '''
+    cursor.execute('''
+            CREATE TABLE IF NOT EXISTS catalog_generation
+            (id boolean PRIMARY KEY DEFAULT true CHECK (id),
+            generation bigint NOT NULL DEFAULT 0,
+            updated_at timestamptz NOT NULL DEFAULT now()
+            );
+            INSERT INTO catalog_generation (generation) VALUES (1)
+            ON CONFLICT (id) DO UPDATE SET generation = catalog_generation.generation + 1, updated_at = now()
+            ;
+            ''')
+
+def create_price_summary_tables(cursor):
+    '''Creates the summary tables read by the web app if they don't exist
+
+    daily_sales_stats holds the price statistics of every (game, condition, date),
+    console_avg_prices the average catalog values of every console.
+    '''
+    query = '''
+            CREATE TABLE IF NOT EXISTS daily_sales_stats
+            (game_id integer,
+            condition varchar,
+            date_sold date,
+            mean_price numeric,
+            median_price numeric,
+            n_sales integer,
+            min_price numeric,
+            max_price numeric,
+            PRIMARY KEY (game_id, condition, date_sold),
+            FOREIGN KEY (game_id) REFERENCES avg_game_prices (game_id)
+            );
+
+            CREATE MATERIALIZED VIEW IF NOT EXISTS console_avg_prices AS
+            SELECT consoles.console_id, console,
+                AVG(loose_val::numeric) AS avg_loose_val,
+                AVG(complete_val::numeric) AS avg_complete_val,
+                AVG(new_val::numeric) AS avg_new_val,
+                COUNT(*) AS n_games
+            FROM avg_game_prices JOIN consoles ON avg_game_prices.console_id = consoles.console_id
+            GROUP BY consoles.console_id, console
+            ;
+            '''
+    cursor.execute(query)
+
+def refresh_console_avg_prices(cursor):
+    create_price_summary_tables(cursor)
+    cursor.execute('REFRESH MATERIALIZED VIEW console_avg_prices;')
+
+def refresh_daily_sales_stats(cursor, game_ids):
+    '''Recomputes the daily price statistics of the given games only
+
+    Args:
+        cursor: database cursor
+        game_ids: ids of the games whose sales changed
+    '''
+    game_ids = [int(id) for id in game_ids]
+    if not game_ids:
+        return
+    create_price_summary_tables(cursor)
+    cursor.execute('DELETE FROM daily_sales_stats WHERE game_id = ANY(%(game_ids)s);', {'game_ids': game_ids})
+    selects = []
+    for condition in ['loose', 'cib', 'new']:
+        selects.append(f'''
+            SELECT game_id, '{condition}', date_sold,
+                AVG(price_sold::numeric),
+                percentile_cont(0.5) WITHIN GROUP (ORDER BY price_sold::numeric),
+                COUNT(*),
+                MIN(price_sold::numeric),
+                MAX(price_sold::numeric)
+            FROM {condition}_game_prices
+            WHERE game_id = ANY(%(game_ids)s) AND date_sold IS NOT NULL
+            GROUP BY game_id, date_sold''')
+    query = f'''
+            INSERT INTO daily_sales_stats
+            (game_id, condition, date_sold, mean_price, median_price, n_sales, min_price, max_price)
+            {' UNION ALL '.join(selects)}
+            ;
+            '''
+    cursor.execute(query, {'game_ids': game_ids})
+
+def scrape_games(console_df, max_workers=4, rate=2.0, burst=2, client=None, states=None):
+    '''Scrapes every game in console_df concurrently and yields results as they finish
+
+    Args:
+        console_df: Game sales dataframe with 'game', 'url' and 'game_id' columns
+        max_workers: maximum number of games being scraped at the same time
+        rate: requests per second allowed for each host
+        burst: number of requests a host can receive back to back
+        client: ScraperClient to fetch pages with, one sized for max_workers is created otherwise
+        states: dict of game_id -> previous scrape state, games are then scraped with scrape_game_incremental
+
+    Returns:
+        (generator) (game_id, game name, result, error) tuples in completion order. result is
+        (loose_df, cib_df, new_df), or (dataframes or None, state) when states is given.
+        If the game couldn't be scraped result is None and error holds the exception.
+    '''
+    if client is None:
+        client = ScraperClient(pool_size=max_workers, rate_limiter=HostRateLimiter(rate, burst))
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = {}
+        for g_name, url, id in console_df[['game', 'url', 'game_id']].itertuples(index=False):
+            print('Trying to add', g_name)
+            if states is None:
+                future = executor.submit(indivgamescraper, url, id, client)
+            else:
+                future = executor.submit(scrape_game_incremental, url, id, states.get(id), client)
+            futures[future] = (id, g_name)
+
+        for future in as_completed(futures):
+            id, g_name = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                print('Fail to scrape due to the error:', e, '\n On game id:', id)
+                yield id, g_name, None, e
+                continue
+            yield id, g_name, result, None
+    finally:
+        # Don't keep scraping queued games if the caller stops early
+        executor.shutdown(wait=True, cancel_futures=True)
+
+# Sales table of every condition, in the order parse_product_page returns them
+CONDITION_TABLES = {'loose': 'loose_game_prices', 'cib': 'cib_game_prices', 'new': 'new_game_prices'}
+
+def parse_page_records(game_id, content, parser=None):
+    '''Parses a product page into compact (game_id, condition, date, price, sale_seq) records
+
+    Runs in the parser processes of scrape_pipeline, plain tuples are much cheaper than
+    dataframes to send back to the writer.
+
+    Returns:
+        (list) one record per sale, the 'empty row' of pages without sales is left out
+    '''
+    dfs = parse_product_page(content, game_id, parser)
+    records = []
+    for condition, df in zip(CONDITION_TABLES, dfs):
+        for date, price, seq in zip(df['date'], df['price_sold'], df['sale_seq']):
+            if date is not None:
+                records.append((int(game_id), condition, date, float(price), int(seq)))
+    return records
+
+def _put(q, item, stop):
+    '''Puts item on a bounded queue, waiting for room unless the pipeline is stopping'''
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+def _get(q, stop):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.5)
+        except queue.Empty:
+            pass
+    return None
+
+def scrape_pipeline(console_df, client, fetch_workers=8, parse_workers=None, queue_size=32, parser=None):
+    '''Scrapes games with separate fetch and parse stages so network waits and parsing overlap
+
+    Fetcher threads download pages onto a bounded queue and a dispatcher hands them to a pool
+    of parser processes. Both the queue and the number of pages being parsed are bounded, so
+    fetchers wait whenever parsing falls behind.
+
+    Args:
+        console_df: Game sales dataframe with 'game', 'url' and 'game_id' columns
+        client: ScraperClient shared by the fetcher threads
+        fetch_workers: number of fetcher threads
+        parse_workers: number of parser processes, one per CPU by default
+        queue_size: number of downloaded pages allowed to wait for a parser
+        parser: name of the parser backend to use, see PARSERS
+
+    Returns:
+        (generator) (game_id, game name, records, error) tuples in completion order,
+        records come from parse_page_records and are None if the game failed
+    '''
+    parse_workers = parse_workers or os.cpu_count()
+    games = list(console_df[['game', 'url', 'game_id']].itertuples(index=False))
+    names = {id: g_name for g_name, url, id in games}
+    work = queue.Queue()
+    for game in games:
+        work.put(game)
+    pages = queue.Queue(maxsize=queue_size)
+    results = queue.Queue()
+    in_flight = threading.BoundedSemaphore(parse_workers * 2)
+    stop = threading.Event()
+    dispatch_errors = []
+    # Forking here would copy locks held by the fetcher threads (metrics, other consoles' scrapers)
+    # into the parser processes, where they stay locked forever
+    start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    process_pool = ProcessPoolExecutor(max_workers=parse_workers, mp_context=multiprocessing.get_context(start_method))
+
+    def fetcher():
+        while not stop.is_set():
+            try:
+                g_name, url, id = work.get_nowait()
+            except queue.Empty:
+                return
+            print('Trying to add', g_name)
+            try:
+                result = send_request(url, client=client)
+                check_response(result, url)
+                page = (id, result.content, None)
+            except Exception as e:
+                page = (id, None, e)
+            if not _put(pages, page, stop):
+                return
+
+    def parsed(future, id, submitted):
+        # Spans inside the parser processes stay there, time the whole round trip instead
+        metrics.observe('scraper_parse_task_seconds', time.perf_counter() - submitted)
+        in_flight.release()
+        if future.cancelled():
+            return
+        error = future.exception()
+        results.put((id, None if error else future.result(), error))
+
+    def dispatch():
+        for _ in range(len(games)):
+            page = _get(pages, stop)
+            if page is None:
+                return
+            id, content, error = page
+            if error is not None:
+                results.put((id, None, error))
+                continue
+            while not in_flight.acquire(timeout=0.5):
+                if stop.is_set():
+                    return
+            submitted = time.perf_counter()
+            try:
+                future = process_pool.submit(parse_page_records, id, content, parser)
+            except Exception as e:
+                in_flight.release()
+                results.put((id, None, e))
+                raise
+            future.add_done_callback(lambda future, id=id, submitted=submitted: parsed(future, id, submitted))
+
+    def dispatcher():
+        try:
+            dispatch()
+        except Exception as e:
+            # A parser process died and broke the pool, stop fetching and fail the games left
+            dispatch_errors.append(e)
+            stop.set()
+
+    threads = [threading.Thread(target=fetcher, daemon=True) for _ in range(fetch_workers)]
+    dispatcher_thread = threading.Thread(target=dispatcher, daemon=True)
+    threads.append(dispatcher_thread)
+    for thread in threads:
+        thread.start()
+    try:
+        done = set()
+        while len(done) < len(games):
+            try:
+                id, records, error = results.get(timeout=0.5)
+            except queue.Empty:
+                # The futures of a broken pool fail right away, once they are in nothing else is coming
+                if dispatch_errors and not dispatcher_thread.is_alive():
+                    break
+                continue
+            done.add(id)
+            if error is not None:
+                print('Fail to scrape due to the error:', error, '\n On game id:', id)
+            yield id, names[id], records, error
+        for g_name, url, id in games:
+            if id not in done:
+                print('Fail to scrape due to the error:', dispatch_errors[0], '\n On game id:', id)
+                yield id, g_name, None, dispatch_errors[0]
+    finally:
+        # Don't keep scraping queued games if the caller stops early
+        stop.set()
+        for thread in threads:
+            thread.join()
+        process_pool.shutdown(wait=True, cancel_futures=True)
+
+def write_record_batch(cursor, games):
+    '''Writes the records of a batch of games with one COPY per sales table and marks the games done
+
+    If the batch fails the games are written one at a time, so one bad game doesn't fail the others.
+
+    Args:
+        cursor: database cursor
+        games: list of (game_id, records) tuples, records come from parse_page_records
+
+    Returns:
+        (list, int) ids of the games that had sales written, number of games marked done
+    '''
+    columns = ['date_sold', 'price_sold', 'game_id', 'sale_seq']
+    cursor.execute('SAVEPOINT record_batch;')
+    try:
+        for condition, table in CONDITION_TABLES.items():
+            rows = [(date, price, game_id, seq) for _, records in games
+                    for game_id, record_condition, date, price, seq in records if record_condition == condition]
+            bulk_insert(cursor, table, columns, rows, on_conflict='DO NOTHING')
+        updated_ids = [id for id, records in games if records]
+        if updated_ids:
+            touch_sales_versions(cursor, updated_ids)
+        for id, _ in games:
+            mark_scrape_job(cursor, id, 'done')
+        cursor.execute('RELEASE SAVEPOINT record_batch;')
+        return updated_ids, len(games)
+    except psycopg2.Error as e:
+        cursor.execute('ROLLBACK TO SAVEPOINT record_batch;')
+        if len(games) == 1:
+            print('Fail to execute due to the error:', e, '\n On game id:', games[0][0])
+            mark_scrape_job(cursor, games[0][0], 'failed', e)
+            return [], 0
+        print('Fail to write batch, writing its games one at a time:', e)
+        updated_ids = []
+        n_done = 0
+        for game in games:
+            game_updated_ids, game_done = write_record_batch(cursor, [game])
+            updated_ids += game_updated_ids
+            n_done += game_done
+        return updated_ids, n_done
+
+def insert_recent_sales_values(cursor, loose_df, cib_df, new_df):
+    '''Inserts one game's scraped loose, cib and new sales into their tables
+
+    Sales already stored under the same (game_id, date_sold, price_sold, sale_seq) key are skipped.
+
+    Args:
+        cursor: database cursor
+        loose_df, cib_df, new_df: dataframes returned by indivgamescraper
+
+    Returns:
+        (int) number of new sales written
+    '''
+    columns = ['date_sold', 'price_sold', 'game_id', 'sale_seq']
+    written = 0
+    for table, df in [('loose_game_prices', loose_df), ('cib_game_prices', cib_df), ('new_game_prices', new_df)]:
+        # The 'empty row' of a page without sales has no date and would be stored again on every run
+        df = df[df['date'].notna()]
+        written += bulk_insert(cursor, table, columns, zip(df['date'], df['price_sold'], df['game_id'], df['sale_seq']),
+                               on_conflict='DO NOTHING')
+    return written
+
+def create_scrape_jobs_table(cursor):
+    '''Creates the checkpoint table holding the scrape status of every game if it doesn't exist'''
+    query = '''
+            CREATE TABLE IF NOT EXISTS scrape_jobs
+            (game_id integer PRIMARY KEY,
+            status varchar NOT NULL DEFAULT 'pending',
+            attempts integer NOT NULL DEFAULT 0,
+            last_error text,
+            updated_at timestamptz NOT NULL DEFAULT now(),
+            FOREIGN KEY (game_id) REFERENCES avg_game_prices (game_id)
+            );
+            '''
+    cursor.execute(query)
+
+def start_scrape_jobs(cursor, game_ids, max_attempts=3, restart=False):
+    '''Returns the games left to scrape, resuming the previous pass over game_ids if it didn't finish
+
+    Games are left when they are pending, or failed fewer than max_attempts times. If none
+    are left (or restart is set) every game is set back to pending and a new pass starts.
+
+    Args:
+        cursor: database cursor
+        game_ids: ids of the games of the job
+        max_attempts: number of times a failing game is tried before it is given up on
+        restart: start a new pass even if the previous one didn't finish
+
+    Returns:
+        (list) ids of the games to scrape
+    '''
+    game_ids = [int(id) for id in game_ids]
+    # Only a pass that already has rows can be resumed, games inserted now start out pending
+    cursor.execute('SELECT EXISTS (SELECT 1 FROM scrape_jobs WHERE game_id = ANY(%s));', (game_ids,))
+    resumable = cursor.fetchone()[0]
+    execute_values(cursor, 'INSERT INTO scrape_jobs (game_id) VALUES %s ON CONFLICT (game_id) DO NOTHING', [(id,) for id in game_ids])
+    query = '''
+            SELECT game_id FROM scrape_jobs
+            WHERE game_id = ANY(%s) AND (status = 'pending' OR (status = 'failed' AND attempts < %s))
+            ;
+            '''
+    cursor.execute(query, (game_ids, max_attempts))
+    left = [row[0] for row in cursor.fetchall()]
+    if left and not restart:
+        if resumable:
+            print('Resuming previous scrape,', len(left), 'of', len(game_ids), 'games left')
+        else:
+            print('Starting a new scrape of', len(game_ids), 'games')
+        return left
+    cursor.execute('''
+            UPDATE scrape_jobs SET status = 'pending', attempts = 0, last_error = NULL, updated_at = now()
+            WHERE game_id = ANY(%s)
+            ;
+            ''', (game_ids,))
+    print('Starting a new scrape of', len(game_ids), 'games')
+    return game_ids
+
+def mark_scrape_job(cursor, game_id, status, error=None):
+    cursor.execute('''
+            UPDATE scrape_jobs SET status = %s, attempts = attempts + 1, last_error = %s, updated_at = now()
+            WHERE game_id = %s
+            ;
+            ''', (status, str(error) if error is not None else None, int(game_id)))
+    metrics.inc('scraper_games_total', status=status)
+
+def commit_scrape_batch(cursor, updated_ids):
+    '''Refreshes the summaries of the games written since the last batch and commits them with their job status'''
+    refresh_daily_sales_stats(cursor, updated_ids)
+    cursor.connection.commit()
+    # Only drop cached charts once the new sales are visible to the web app
+    invalidate_chart_files(updated_ids)
+
+def write_scraped_game(cursor, id, result, incremental):
+    '''Writes one scraped game's sales and scrape state
+
+    Returns:
+        (bool) True if new sales were written
+    '''
+    if incremental:
+        dfs, state = result
+        save_scrape_state(cursor, id, state)
+        if dfs is None:
+            return False
+    else:
+        dfs = result
+    if insert_recent_sales_values(cursor, *dfs) > 0:
+        touch_sales_versions(cursor, [id])
+        return True
+    return False
+
+def prepare_sales_tables(cursor):
+    '''Migrates the sales tables and creates the tables a scrape writes to if they don't exist
+
+    Runs once before consoles are scraped in parallel, concurrent migrations of the same
+    tables would fail every console but one.
+    '''
+    migrate_sales_tables(cursor)
+    create_sales_versions_table(cursor)
+    create_price_summary_tables(cursor)
+    create_scrape_state_table(cursor)
+    create_scrape_jobs_table(cursor)
+
+def update_recent_sales_tables(cursor, console_df, max_workers=4, rate=2.0, burst=2, incremental=False,
+                               batch_size=50, max_attempts=3, restart=False, parse_workers=0, queue_size=32,
+                               client=None, setup=True):
+    '''Scrapes every game of a console and writes the sales to the database as they arrive
+
+    Games are committed in batches together with their status in scrape_jobs, so a crashed run
+    resumes where it stopped. A game that fails is recorded as failed and the run carries on,
+    failed games are retried until they have been tried max_attempts times.
+
+    Args:
+        cursor: database cursor
+        console_df: Game sales dataframe for a single console
+        max_workers, rate, burst: passed on to scrape_games
+        incremental: only fetch and write games whose sales changed since their last scrape
+        batch_size: number of games written per commit
+        max_attempts: number of times a failing game is tried
+        restart: ignore an unfinished previous pass and scrape every game again
+        parse_workers: number of parser processes, 0 to parse in the scraping threads.
+            With parser processes max_workers is the number of fetcher threads and each
+            batch is written with one COPY per sales table.
+        queue_size: number of downloaded pages allowed to wait for a parser process
+        client: ScraperClient to share with other scrapes (e.g. other consoles) so they share
+            one rate budget, one is created from max_workers, rate and burst otherwise
+        setup: run prepare_sales_tables first, False when the caller already did
+    '''
+    if incremental and parse_workers:
+        raise ValueError('incremental scrapes parse in the scraping threads, use parse_workers=0')
+    conn = cursor.connection
+    try:
+        if setup:
+            prepare_sales_tables(cursor)
+        game_ids = start_scrape_jobs(cursor, console_df['game_id'], max_attempts, restart)
+        states = load_scrape_states(cursor, game_ids) if incremental else None
+        conn.commit()
+    except psycopg2.Error as e:
+        print('Fail to execute due to the error:', e)
+        conn.rollback()
+        # Raised instead of exiting, update_consoles records the console as failed and carries on
+        raise
+
+    own_client = client is None
+    if own_client:
+        client = ScraperClient(pool_size=max_workers, rate_limiter=HostRateLimiter(rate, burst))
+    n_updated = 0
+    n_done = 0
+    n_failed = 0
+    for attempt in range(max_attempts):
+        todo_df = console_df[console_df['game_id'].isin(game_ids)]
+        if todo_df.empty:
+            break
+        if attempt > 0:
+            print('Retrying', len(todo_df), 'failed games')
+
+        updated_ids = []
+        pending_records = []
+        n_in_batch = 0
+        if parse_workers:
+            results = scrape_pipeline(todo_df, client, max_workers, parse_workers, queue_size)
+        else:
+            results = scrape_games(todo_df, max_workers, client=client, states=states)
+        # Results are written from this thread only, the cursor is not shared with the scrapers
+        for id, g_name, result, error in results:
+            if error is not None:
+                mark_scrape_job(cursor, id, 'failed', error)
+            elif parse_workers:
+                # Counted as done once write_record_batch has written and marked them
+                pending_records.append((id, result))
+            else:
+                cursor.execute('SAVEPOINT scrape_game;')
+                try:
+                    if write_scraped_game(cursor, id, result, incremental):
+                        updated_ids.append(id)
+                    mark_scrape_job(cursor, id, 'done')
+                    cursor.execute('RELEASE SAVEPOINT scrape_game;')
+                    n_done += 1
+                except psycopg2.Error as e:
+                    print('Fail to execute due to the error:', e, '\n On game id:', id)
+                    cursor.execute('ROLLBACK TO SAVEPOINT scrape_game;')
+                    mark_scrape_job(cursor, id, 'failed', e)
+            n_in_batch += 1
+            if n_in_batch >= batch_size:
+                if pending_records:
+                    batch_updated_ids, batch_done = write_record_batch(cursor, pending_records)
+                    updated_ids += batch_updated_ids
+                    n_done += batch_done
+                n_updated += len(updated_ids)
+                commit_scrape_batch(cursor, updated_ids)
+                print('Committed a batch of', n_in_batch, 'games')
+                updated_ids = []
+                pending_records = []
+                n_in_batch = 0
+        if pending_records:
+            batch_updated_ids, batch_done = write_record_batch(cursor, pending_records)
+            updated_ids += batch_updated_ids
+            n_done += batch_done
+        n_updated += len(updated_ids)
+        commit_scrape_batch(cursor, updated_ids)
+
+        # Failed games that still have attempts left go through the scraper again
+        cursor.execute('''
+                SELECT game_id FROM scrape_jobs
+                WHERE game_id = ANY(%s) AND status = 'failed' AND attempts < %s
+                ;
+                ''', ([int(id) for id in game_ids], max_attempts))
+        game_ids = [row[0] for row in cursor.fetchall()]
+
+    cursor.execute("SELECT count(*) FROM scrape_jobs WHERE game_id = ANY(%s) AND status = 'failed';",
+                   ([int(id) for id in console_df['game_id']],))
+    n_failed = cursor.fetchone()[0]
+    print('Connections:', client.connection_stats())
+    print('Games scraped:', n_done, 'with new sales:', n_updated, 'failed:', n_failed)
+    if own_client:
+        client.close()
+
+    try:
+        refresh_console_avg_prices(cursor)
+        conn.commit()
+    except psycopg2.Error as e:
+        print('Fail to execute due to the error:', e)
+        conn.rollback()
+
+
+
+def scrape_options(args):
+    '''Returns the update_recent_sales_tables arguments given on the command line'''
+    return {'max_workers': args.workers, 'rate': args.rate, 'burst': args.burst, 'incremental': args.incremental,
+            'batch_size': args.batch_size, 'max_attempts': args.max_attempts, 'restart': args.restart,
+            'parse_workers': args.parse_workers, 'queue_size': args.queue_size}
+
+def choose_console_update(cursor, console_dataframes, console_df, args):
+    '''Asks which console library to update and updates it
+
+    Args:
+        cursor: database cursor
+        console_dataframes: dict of console_id -> game sales dataframe of the console
+        console_df: Console dataframe from load_console_df
+        args: command line arguments from parse_args
+    '''
+    for console_id, console in zip(console_df['console_id'], console_df['console']):
+        print(f'{console_id}: {console}')
+    n_consoles = len(console_df)
 
     while True:
-        selection = input("Select what console library you wish to update by entering a number from 0-9: ")
-        if selection.isdigit() and int(selection) in range(10):
+        selection = input(f"Select what console library you wish to update by entering a number from 0-{n_consoles - 1}: ")
+        if selection.isdigit() and int(selection) in range(n_consoles):
             console_id = int(selection)
-            console = list(console_dict.keys())[list(console_dict.values()).index(console_id)]
+            console = console_df.loc[console_df['console_id'] == console_id, 'console'].iloc[0]
             print(f"You have selected {console}.")
-            update_recent_sales_tables(cursor, console_dataframes[console_id])
+            update_recent_sales_tables(cursor, console_dataframes[console_id], **scrape_options(args))
             break
         else:
-            print("Invalid input. Please select a console by entering a number from 0-9.")
+            print(f"Invalid input. Please select a console by entering a number from 0-{n_consoles - 1}.")
+
+def parse_id_ranges(text):
+    '''Parses game id ranges like '1-100,250,300-310' into a set of ids'''
+    ids = set()
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            if '-' in part:
+                first, last = part.split('-', 1)
+                ids.update(range(int(first), int(last) + 1))
+            else:
+                ids.add(int(part))
+        except ValueError:
+            raise argparse.ArgumentTypeError(f'invalid game id range: {part}')
+    return ids
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Scrape recently sold prices from PriceCharting into the database')
+    parser.add_argument('consoles', nargs='*',
+                        help='names or ids of the consoles to update, asks interactively when none are given')
+    parser.add_argument('--all', action='store_true', help='update every console')
+    parser.add_argument('--game-ids', type=parse_id_ranges,
+                        help="only update these games, e.g. '1-100,250'")
+    parser.add_argument('--csv', default='game_prices.csv', help='game prices csv the catalog is built from')
+    parser.add_argument('--setup', action='store_true',
+                        help='drop and recreate the consoles, catalog and sales tables before scraping')
+    parser.add_argument('--sync-catalog', action='store_true',
+                        help='add new games and update changed prices from the csv, keeping every game id and scraped sale')
+    parser.add_argument('--workers', type=int, default=4, help='games scraped at the same time per console')
+    parser.add_argument('--parallel-consoles', type=int, default=1, help='consoles updated at the same time')
+    parser.add_argument('--rate', type=float, default=2.0,
+                        help='requests per second allowed to each host, shared by every console')
+    parser.add_argument('--burst', type=int, default=2, help='requests a host can receive back to back')
+    parser.add_argument('--parse-workers', type=int, default=0, help='parser processes, 0 to parse in the scraping threads')
+    parser.add_argument('--queue-size', type=int, default=32,
+                        help='downloaded pages allowed to wait for a parser process when --parse-workers is set')
+    parser.add_argument('--batch-size', type=int, default=50, help='games written per commit')
+    parser.add_argument('--max-attempts', type=int, default=3, help='times a failing game is tried')
+    parser.add_argument('--incremental', action='store_true', help='only fetch and write games whose sales changed')
+    parser.add_argument('--restart', action='store_true', help='ignore an unfinished previous scrape of the consoles')
+    parser.add_argument('--snapshot', nargs='?', const=SNAPSHOT_DIR, metavar='DIR',
+                        help=f'export a Parquet snapshot of the catalog and sales after scraping, to {SNAPSHOT_DIR} by default')
+    args = parser.parse_args(argv)
+    if args.all and args.consoles:
+        parser.error('give console names/ids or --all, not both')
+    if args.incremental and args.parse_workers:
+        parser.error('--incremental scrapes parse in the scraping threads, leave out --parse-workers')
+    return args
+
+def resolve_consoles(selected, console_df):
+    '''Returns the console ids of console names or ids given on the command line'''
+    by_name = dict(zip(console_df['console'], console_df['console_id']))
+    ids = set(console_df['console_id'])
+    console_ids = []
+    for console in selected:
+        if console.isdigit() and int(console) in ids:
+            console_ids.append(int(console))
+        elif console in by_name:
+            console_ids.append(int(by_name[console]))
+        else:
+            raise SystemExit(f'Unknown console: {console}, choose from {", ".join(console_df["console"])}')
+    return console_ids
 
+def update_consoles(console_dataframes, console_ids, args):
+    '''Updates several consoles at the same time under one shared rate budget
 
+    Every console gets its own database connection, all of them share one ScraperClient
+    so the per-host rate limit holds across consoles. The tables are set up once before.
 
-def main():
-    gs_df = read_game_prices('game_prices.csv')
+    Returns:
+        (list) ids of the consoles that failed
+    '''
+    conn, cursor = create_connection(un, pw, port, db_name)
+    try:
+        prepare_sales_tables(cursor)
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+    client = ScraperClient(pool_size=args.workers * args.parallel_consoles,
+                           rate_limiter=HostRateLimiter(args.rate, args.burst))
+
+    def update_console(console_id):
+        conn, cursor = create_connection(un, pw, port, db_name)
+        try:
+            update_recent_sales_tables(cursor, console_dataframes[console_id], client=client, setup=False,
+                                       **scrape_options(args))
+            conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=args.parallel_consoles) as executor:
+        futures = {executor.submit(update_console, console_id): console_id for console_id in console_ids}
+        for future in as_completed(futures):
+            try:
+                future.result()
+                print('Finished console', futures[future])
+            except (Exception, SystemExit) as e:
+                print('Fail to update console', futures[future], 'due to the error:', e)
+                failed.append(futures[future])
+    client.close()
+    return failed
+
+def main(argv=None):
+    args = parse_args(argv)
+    conn, cursor = create_connection(un, pw, port, db_name)  
+    if args.setup:
+        create_console_table(cursor)
+        create_avg_game_prices_table(cursor)
+        sync_catalog(cursor, args.csv)
+        create_recent_sales_tables(cursor)
+        create_price_summary_tables(cursor)
+        conn.commit()
+    elif args.sync_catalog:
+        sync_catalog(cursor, args.csv)
+        conn.commit()
+
+    gs_df = read_game_prices(args.csv)
     gs_df = clean_game_prices(gs_df)
-    console_df = create_console_df(gs_df)
+    console_df = load_console_df(cursor)
     gs_df = add_console_id(gs_df, console_df)
-    conn, cursor = create_connection(un, pw, port, db_name)  
-    # create_console_table(cursor)
-    # insert_console_values(cursor, console_df)
-    # create_avg_game_prices_table(cursor)
-    # insert_avg_game_prices_values(cursor, gs_df)
-    # create_recent_sales_tables(cursor)
-    
+    # Databases set up before game_keys existed get it here, seeded with their current game ids
+    create_game_keys_table(cursor)
+    conn.commit()
+    gs_df = assign_game_ids(cursor, gs_df, register=False)
+
+    if args.game_ids:
+        gs_df = gs_df[gs_df['game_id'].isin(args.game_ids)]
+
     # Group the data by console_id and create a dictionary of dataframes
     console_dataframes = {}
-    for console_id, console_df in gs_df.groupby('console_id'):
-        console_dataframes[console_id] = console_df
-    
-    # Update the dataframe for a selected console
-    choose_console_update(cursor, console_dataframes)
-    '''
-    for console_id, console_df in console_dataframes.items():
-        update_recent_sales_tables(cursor, console_df)
-    '''
+    for console_id, games_df in gs_df.groupby('console_id'):
+        console_dataframes[console_id] = games_df
+
+    if args.all or args.consoles:
+        console_ids = list(console_dataframes) if args.all else resolve_consoles(args.consoles, console_df)
+        console_ids = [console_id for console_id in console_ids if console_id in console_dataframes]
+        failed = update_consoles(console_dataframes, console_ids, args)
+    else:
+        # Update the dataframe for a selected console
+        choose_console_update(cursor, console_dataframes, console_df, args)
+        failed = []
 
     # Make the changes to the database persistent
     conn.commit()
+    if args.snapshot:
+        with metrics.span('snapshot_export_seconds'):
+            export_snapshot(conn, args.snapshot)
+        conn.rollback()
+    print('Scrape metrics:')
+    print(metrics.summary())
     # Close the cursor
     cursor.close()
+    conn.close()
+    if failed:
+        print('Failed consoles:', ', '.join(str(console_id) for console_id in failed))
+        return 1
+    return 0
 
 if __name__ == "__main__":
     print('Starting Pricecharting API process\n')
-    main()
-    print('Finished Pricecharting API process')
\ No newline at end of file
+    status = main()
+    print('Finished Pricecharting API process')
+    sys.exit(status)
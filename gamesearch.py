@@ -0,0 +1,123 @@
+import re
+import heapq
+from bisect import bisect_left
+from collections import Counter
+
+# Fraction of the query's trigrams a game name must share to be returned as a fuzzy match
+MIN_TRIGRAM_SCORE = 0.3
+
+
+def normalize(text):
+    '''Lowercases text and turns everything that isn't a letter or a digit into single spaces'''
+    return ' '.join(re.sub(r'[^0-9a-z]+', ' ', text.lower()).split())
+
+
+def game_name(game_url):
+    '''Returns the display name of a game from its game_url, the same as the price page title'''
+    return game_url.replace('-', ' ').title()
+
+
+def trigrams(text):
+    '''Returns the set of three character substrings of every word of text, padded like pg_trgm'''
+    grams = set()
+    for word in text.split():
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class GameSearchIndex:
+    '''In-memory prefix and trigram index over the game names of the catalog
+
+    Every word of a game name is kept in one sorted list, so a query whose words all start
+    words of a name is answered with a binary search per word. Queries with typos or
+    partial words fall back to the trigram index.
+
+    Args:
+        rows: (game_id, console_id, game_url) rows of avg_game_prices
+        version: data version the rows were read at, used to tell when to rebuild
+    '''
+
+    def __init__(self, rows, version=None):
+        self.version = version
+        self.games = []
+        words = []
+        self.grams = {}
+        self.by_console = {}
+        for game_id, console_id, game_url in rows:
+            if not game_url:
+                continue
+            key = normalize(game_url)
+            idx = len(self.games)
+            self.games.append((game_id, console_id, game_url, key))
+            words.extend((word, idx) for word in set(key.split()))
+            for gram in trigrams(key):
+                self.grams.setdefault(gram, []).append(idx)
+            self.by_console.setdefault(console_id, []).append(idx)
+        words.sort()
+        self.words = [word for word, _ in words]
+        self.word_games = [idx for _, idx in words]
+        # Empty queries list games alphabetically
+        by_name = lambda idx: self.games[idx][3]
+        self.by_name = sorted(range(len(self.games)), key=by_name)
+        for idxs in self.by_console.values():
+            idxs.sort(key=by_name)
+
+    def __len__(self):
+        return len(self.games)
+
+    def _rank_key(self, query):
+        # Names starting with the query come first, then shorter names, then alphabetically
+        def key(idx):
+            name = self.games[idx][3]
+            return (not name.startswith(query), len(name), name)
+        return key
+
+    def _prefix_matches(self, terms):
+        matches = None
+        for term in terms:
+            lo = bisect_left(self.words, term)
+            hi = bisect_left(self.words, term + '\uffff', lo)
+            found = set(self.word_games[lo:hi])
+            matches = found if matches is None else matches & found
+            if not matches:
+                break
+        return matches
+
+    def _trigram_matches(self, query):
+        query_grams = trigrams(query)
+        counts = Counter()
+        for gram in query_grams:
+            counts.update(self.grams.get(gram, ()))
+        return {idx: n / len(query_grams) for idx, n in counts.items() if n / len(query_grams) >= MIN_TRIGRAM_SCORE}
+
+    def search(self, query, console_id=None, limit=10):
+        '''Returns the best matching games of a query
+
+        Args:
+            query: text typed by the user, an empty query lists the console's games by name
+            console_id: only return games of this console
+            limit: maximum number of games returned
+
+        Returns:
+            (list) dicts with the game_id, console_id, game_url and name of each match, best first
+        '''
+        query = normalize(query or '')
+        if not query:
+            idxs = self.by_console.get(console_id, []) if console_id is not None else self.by_name
+            return [self._result(idx) for idx in idxs[:limit]]
+
+        keep = (lambda idx: True) if console_id is None else (lambda idx: self.games[idx][1] == console_id)
+        prefix = [idx for idx in self._prefix_matches(query.split()) if keep(idx)]
+        ranked = heapq.nsmallest(limit, prefix, key=self._rank_key(query))
+        if len(ranked) < limit:
+            # Not enough games whose words start with the query, fill up with the closest names
+            seen = set(ranked)
+            fuzzy = [(score, idx) for idx, score in self._trigram_matches(query).items() if idx not in seen and keep(idx)]
+            rank = self._rank_key(query)
+            ranked += [idx for _, idx in heapq.nsmallest(limit - len(ranked), fuzzy, key=lambda item: (-item[0], rank(item[1])))]
+        return [self._result(idx) for idx in ranked]
+
+    def _result(self, idx):
+        game_id, console_id, game_url, _ = self.games[idx]
+        return {'game_id': game_id, 'console_id': console_id, 'game_url': game_url, 'name': game_name(game_url)}
@@ -0,0 +1,162 @@
+import time
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+import psycopg2.extensions
+from psycopg2.extras import RealDictCursor
+
+# Upper bounds in seconds of the histogram buckets kept for every timing
+BUCKETS = [0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+
+class Metrics:
+    '''Thread-safe counters and timings, exported in the Prometheus text format
+
+    Every metric is keyed on its name and a sorted tuple of label pairs, so
+    metrics.inc('scraper_http_responses_total', status=429) and the same call with
+    status=200 are two series of the same metric.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.timings = {}
+
+    def inc(self, name, amount=1, **labels):
+        '''Adds amount to a counter'''
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def get(self, name, **labels):
+        '''Returns the value of a counter, 0 if it was never incremented'''
+        with self.lock:
+            return self.counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def observe(self, name, seconds, **labels):
+        '''Records one duration of a timing'''
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            timing = self.timings.get(key)
+            if timing is None:
+                timing = {'count': 0, 'sum': 0.0, 'max': 0.0, 'buckets': [0] * len(BUCKETS)}
+                self.timings[key] = timing
+            timing['count'] += 1
+            timing['sum'] += seconds
+            timing['max'] = max(timing['max'], seconds)
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    timing['buckets'][i] += 1
+                    break
+
+    @contextmanager
+    def span(self, name, **labels):
+        '''Times the body of a with block, failures are timed too and counted under error="true"'''
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.observe(name, time.perf_counter() - start, error='true', **labels)
+            raise
+        self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, name, **labels):
+        '''Decorator that times every call of a function as a span'''
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name, **labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.timings.clear()
+
+    def prometheus(self):
+        '''Returns every metric in the Prometheus text exposition format'''
+        with self.lock:
+            counters = sorted(self.counters.items())
+            timings = sorted((key, dict(timing, buckets=list(timing['buckets']))) for key, timing in self.timings.items())
+        lines = []
+        seen = set()
+        for (name, labels), value in counters:
+            if name not in seen:
+                lines.append(f'# TYPE {name} counter')
+                seen.add(name)
+            lines.append(f'{name}{_labels(labels)} {value}')
+        for (name, labels), timing in timings:
+            if name not in seen:
+                lines.append(f'# TYPE {name} histogram')
+                seen.add(name)
+            cumulative = 0
+            for bound, n in zip(BUCKETS, timing['buckets']):
+                cumulative += n
+                lines.append(f'{name}_bucket{_labels(labels + (("le", str(bound)),))} {cumulative}')
+            lines.append(f'{name}_bucket{_labels(labels + (("le", "+Inf"),))} {timing["count"]}')
+            lines.append(f'{name}_sum{_labels(labels)} {timing["sum"]:.6f}')
+            lines.append(f'{name}_count{_labels(labels)} {timing["count"]}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        '''Returns a plain text table of every timing and counter, printed at the end of a scrape'''
+        with self.lock:
+            counters = sorted(self.counters.items())
+            timings = sorted(self.timings.items())
+        lines = [f'{"span":60} {"count":>8} {"total s":>10} {"mean ms":>10} {"max ms":>10}']
+        for (name, labels), timing in timings:
+            mean = timing['sum'] / timing['count'] if timing['count'] else 0.0
+            lines.append(f'{name + _labels(labels):60} {timing["count"]:8d} {timing["sum"]:10.2f} '
+                         f'{mean * 1000:10.2f} {timing["max"] * 1000:10.2f}')
+        for (name, labels), value in counters:
+            lines.append(f'{name + _labels(labels):60} {value:8}')
+        return '\n'.join(lines)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def statement_kind(query):
+    '''Returns the first keyword of a SQL statement, used to label DB timings without exploding the series'''
+    if isinstance(query, bytes):
+        query = query.decode(errors='replace')
+    words = str(query).split(None, 1)
+    return words[0].upper() if words else 'UNKNOWN'
+
+
+# Registry shared by the scraper and the web app of this process
+metrics = Metrics()
+
+
+class TimedCursorMixin:
+    '''Times every statement a cursor runs under db_statement_seconds{statement="SELECT"...}'''
+
+    def execute(self, query, vars=None):
+        with metrics.span('db_statement_seconds', statement=statement_kind(query)):
+            return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        with metrics.span('db_statement_seconds', statement=statement_kind(query)):
+            return super().executemany(query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        with metrics.span('db_statement_seconds', statement='COPY'):
+            return super().copy_expert(sql, file, size)
+
+
+class TimedCursor(TimedCursorMixin, psycopg2.extensions.cursor):
+    pass
+
+
+class TimedRealDictCursor(TimedCursorMixin, RealDictCursor):
+    pass
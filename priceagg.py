@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+# Statistics computed for every sale date
+DAILY_STATS = ['mean', 'median', 'count', 'min', 'max']
+
+
+def parse_money(values):
+    '''Parses money values like '$1,234.56' into floats in one vectorized pass
+
+    Args:
+        values: list, array or Series of money strings or numbers
+
+    Returns:
+        (ndarray) float prices, NaN for values that are not prices (None, 'Private Sale', ...)
+    '''
+    values = pd.Series(values, dtype=None if len(values) else float)
+    if pd.api.types.is_numeric_dtype(values):
+        return values.to_numpy(dtype=float)
+    cleaned = values.astype(str).str.replace(r'[$,\s]', '', regex=True)
+    return pd.to_numeric(cleaned, errors='coerce').to_numpy(dtype=float)
+
+
+def daily_stats(dates, prices):
+    '''Computes the mean, median, count, min and max price of every sale date
+
+    Rows can come in any order, sales without a date or a price are ignored.
+
+    Args:
+        dates: sale dates, one per sale
+        prices: money strings or numbers, one per sale
+
+    Returns:
+        (dataframe) one row per date sorted by date, with a column per statistic in DAILY_STATS
+    '''
+    sales_df = DataFrame({'date': pd.Series(dates, dtype=object), 'price': parse_money(prices)})
+    sales_df = sales_df.dropna()
+    if sales_df.empty:
+        return DataFrame(columns=['date'] + DAILY_STATS)
+    stats_df = sales_df.groupby('date', sort=True)['price'].agg(DAILY_STATS).reset_index()
+    return stats_df
+
+
+def reference_daily_stats(dates, prices):
+    '''Plain python version of daily_stats, used to check and benchmark it'''
+    by_date = {}
+    for date, price in zip(dates, prices):
+        if date is None or price is None:
+            continue
+        if isinstance(price, str):
+            try:
+                price = float(price.replace('$', '').replace(',', '').strip())
+            except ValueError:
+                continue
+        if np.isnan(price):
+            continue
+        by_date.setdefault(date, []).append(price)
+    rows = []
+    for date in sorted(by_date):
+        day = sorted(by_date[date])
+        n = len(day)
+        median = day[n // 2] if n % 2 else (day[n // 2 - 1] + day[n // 2]) / 2
+        rows.append((date, sum(day) / n, median, n, day[0], day[-1]))
+    return DataFrame(rows, columns=['date'] + DAILY_STATS)
+
+
+def lttb(x, y, n_out):
+    '''Picks n_out points of a series with Largest-Triangle-Three-Buckets, keeping its visual shape
+
+    The first and last points are always kept, every other point is the one of its bucket forming
+    the largest triangle with the point kept before it and the average of the next bucket.
+
+    Args:
+        x: ascending numeric x values
+        y: y values, without NaN
+        n_out: number of points to keep
+
+    Returns:
+        (ndarray) ascending indexes of the kept points, every index if there are n_out points or fewer
+    '''
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # n_out - 2 buckets between the first and the last point
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    kept = np.empty(n_out, dtype=int)
+    kept[0] = 0
+    kept[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_x = x[end:edges[i + 2]].mean()
+            next_y = y[end:edges[i + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        areas = np.abs((x[a] - next_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (next_y - y[a]))
+        a = start + int(np.argmax(areas))
+        kept[i + 1] = a
+    return kept
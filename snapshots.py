@@ -0,0 +1,320 @@
+import os
+import json
+import time
+import shutil
+import argparse
+import threading
+import datetime
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    from pyarrow import fs
+except ImportError:
+    pa = None
+
+# Directory the Parquet snapshots are written to and read from
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', 'snapshots')
+# File in SNAPSHOT_DIR naming the newest complete snapshot, replaced atomically after every export
+CURRENT_FILE = 'CURRENT'
+
+# Sales of every condition, with the console and month they are partitioned by
+SALES_QUERY = '''
+    SELECT s.game_id, s.condition, s.date_sold, s.price_sold::float8, s.sale_seq, to_char(s.date_sold, 'YYYY-MM')
+    FROM (
+        SELECT game_id, 'loose' AS condition, date_sold, price_sold, sale_seq FROM loose_game_prices
+        UNION ALL
+        SELECT game_id, 'cib', date_sold, price_sold, sale_seq FROM cib_game_prices
+        UNION ALL
+        SELECT game_id, 'new', date_sold, price_sold, sale_seq FROM new_game_prices
+    ) s
+    JOIN avg_game_prices a ON a.game_id = s.game_id
+    WHERE a.console_id = %s AND s.date_sold IS NOT NULL
+    ORDER BY s.date_sold, s.game_id
+    ;
+'''
+
+CATALOG_QUERY = '''
+    SELECT a.game_id, a.console_id, c.console, a.loose_val::numeric::float8, a.complete_val::numeric::float8,
+        a.new_val::numeric::float8, a.date_scraped, a.game_url, a.url
+    FROM avg_game_prices a JOIN consoles c ON c.console_id = a.console_id
+    ORDER BY a.game_id
+    ;
+'''
+
+
+def require_pyarrow():
+    if pa is None:
+        raise ImportError('the Parquet snapshots need pyarrow, install it with pip install pyarrow')
+
+
+def sales_schema():
+    return pa.schema([
+        ('game_id', pa.int32()),
+        ('condition', pa.string()),
+        ('date_sold', pa.date32()),
+        ('price_sold', pa.float64()),
+        ('sale_seq', pa.int16()),
+        ('month', pa.string()),
+        ('console', pa.string()),
+    ])
+
+
+def catalog_schema():
+    return pa.schema([
+        ('game_id', pa.int32()),
+        ('console_id', pa.int32()),
+        ('console', pa.string()),
+        ('loose_val', pa.float64()),
+        ('complete_val', pa.float64()),
+        ('new_val', pa.float64()),
+        ('date_scraped', pa.string()),
+        ('game_url', pa.string()),
+        ('url', pa.string()),
+    ])
+
+
+def rows_to_table(rows, schema):
+    '''Builds an Arrow table from database rows whose columns are in the order of schema'''
+    columns = list(zip(*rows)) if rows else [[] for _ in schema]
+    return pa.Table.from_arrays([pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema)
+
+
+def export_snapshot(conn, snapshot_dir=SNAPSHOT_DIR, batch_size=100000, keep=2):
+    '''Writes the catalog and every scraped sale to a new Parquet snapshot
+
+    Sales are partitioned by console and month, the catalog by console. The snapshot is written
+    to a temporary directory and only becomes current once it is complete, so readers never see
+    half an export.
+
+    Args:
+        conn: database connection, the sales are streamed through a server-side cursor
+        snapshot_dir: directory holding the snapshots
+        batch_size: number of sales fetched and written at a time
+        keep: number of snapshots kept, older ones are deleted
+
+    Returns:
+        (string) path of the new snapshot
+    '''
+    require_pyarrow()
+    os.makedirs(snapshot_dir, exist_ok=True)
+    name = datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')
+    tmp_path = os.path.join(snapshot_dir, f'.{name}.tmp')
+    start = time.perf_counter()
+
+    with conn.cursor() as cursor:
+        cursor.execute(CATALOG_QUERY)
+        catalog = rows_to_table(cursor.fetchall(), catalog_schema())
+        cursor.execute('SELECT max(updated_at) FROM sales_versions;')
+        data_version = cursor.fetchone()[0]
+    os.makedirs(tmp_path)
+    if catalog.num_rows:
+        pq.write_to_dataset(catalog, os.path.join(tmp_path, 'catalog'), partition_cols=['console'])
+
+    schema = sales_schema()
+    n_sales = 0
+    n_files = 0
+    consoles = sorted(set(zip(catalog.column('console_id').to_pylist(), catalog.column('console').to_pylist())))
+    for console_id, console in consoles:
+        # A named cursor streams the console's sales instead of loading them all at once
+        with conn.cursor(name='snapshot_sales') as cursor:
+            cursor.itersize = batch_size
+            cursor.execute(SALES_QUERY, (console_id,))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                table = rows_to_table([row + (console,) for row in rows], schema)
+                pq.write_to_dataset(table, os.path.join(tmp_path, 'sales'), partition_cols=['console', 'month'],
+                                    basename_template=f'part-{n_files}-{{i}}.parquet',
+                                    existing_data_behavior='overwrite_or_ignore')
+                n_sales += len(rows)
+                n_files += 1
+
+    manifest = {
+        'name': name,
+        'games': catalog.num_rows,
+        'sales': n_sales,
+        'data_version': data_version.isoformat() if data_version is not None else None,
+        'export_seconds': time.perf_counter() - start,
+    }
+    with open(os.path.join(tmp_path, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.rename(tmp_path, os.path.join(snapshot_dir, name))
+    set_current(snapshot_dir, name)
+    prune_snapshots(snapshot_dir, keep)
+    print('Exported snapshot', name, 'with', catalog.num_rows, 'games and', n_sales, 'sales in',
+          f"{manifest['export_seconds']:.1f}s")
+    return os.path.join(snapshot_dir, name)
+
+
+def set_current(snapshot_dir, name):
+    tmp_path = os.path.join(snapshot_dir, f'.{CURRENT_FILE}.{threading.get_ident()}.tmp')
+    with open(tmp_path, 'w') as f:
+        f.write(name)
+    os.replace(tmp_path, os.path.join(snapshot_dir, CURRENT_FILE))
+
+
+def current_snapshot(snapshot_dir=SNAPSHOT_DIR):
+    '''Returns the name of the newest complete snapshot, None if nothing was exported yet'''
+    try:
+        with open(os.path.join(snapshot_dir, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def prune_snapshots(snapshot_dir, keep):
+    '''Deletes all but the newest keep snapshots'''
+    names = sorted(name for name in os.listdir(snapshot_dir)
+                   if not name.startswith('.') and os.path.isdir(os.path.join(snapshot_dir, name)))
+    current = current_snapshot(snapshot_dir)
+    for name in names[:-keep] if keep else []:
+        if name != current:
+            shutil.rmtree(os.path.join(snapshot_dir, name), ignore_errors=True)
+
+
+class SnapshotStore:
+    '''Reads sales history and console trends from the newest Parquet snapshot, without Postgres
+
+    The files are memory-mapped through Arrow and only the console and month partitions a query
+    needs are read. The store switches to a newer snapshot as soon as one is exported.
+
+    Args:
+        snapshot_dir: directory the snapshots are exported to
+    '''
+
+    def __init__(self, snapshot_dir=SNAPSHOT_DIR):
+        require_pyarrow()
+        self.snapshot_dir = snapshot_dir
+        self.filesystem = fs.LocalFileSystem(use_mmap=True)
+        self.lock = threading.Lock()
+        self.name = None
+        self.sales = None
+        self.catalog = None
+        self.consoles = {}
+
+    def _open(self):
+        '''Opens the current snapshot if it changed, returns False if there is none'''
+        name = current_snapshot(self.snapshot_dir)
+        if name is None:
+            return False
+        with self.lock:
+            if name != self.name:
+                path = os.path.join(self.snapshot_dir, name)
+                partitioning = ds.partitioning(pa.schema([('console', pa.string()), ('month', pa.string())]), flavor='hive')
+                self.sales = self._dataset(os.path.join(path, 'sales'), sales_schema(), partitioning)
+                self.catalog = self._dataset(os.path.join(path, 'catalog'), catalog_schema(), 'hive').to_table()
+                self.consoles = dict(zip(self.catalog.column('game_id').to_pylist(),
+                                         self.catalog.column('console').to_pylist()))
+                self.name = name
+        return True
+
+    def _dataset(self, path, schema, partitioning):
+        '''Opens a dataset of the snapshot, an export without any rows writes no files so that is an empty table'''
+        if not os.path.isdir(path):
+            return ds.dataset(schema.empty_table())
+        return ds.dataset(path, format='parquet', partitioning=partitioning, filesystem=self.filesystem)
+
+    def snapshot_name(self):
+        return self.name if self._open() else None
+
+    def game_history(self, game_id, condition=None):
+        '''Returns every sale of a game
+
+        Args:
+            game_id: id of the game
+            condition: 'loose', 'cib' or 'new', None for all of them
+
+        Returns:
+            (dataframe) date_sold, condition, price_sold and sale_seq of every sale, oldest first,
+            None if there is no snapshot
+        '''
+        if not self._open():
+            return None
+        columns = ['date_sold', 'condition', 'price_sold', 'sale_seq']
+        console = self.consoles.get(int(game_id))
+        if console is None:
+            return self.sales.schema.empty_table().select(columns).to_pandas()
+        # The console partition is known from the catalog, so only its files are scanned
+        expr = (ds.field('console') == console) & (ds.field('game_id') == int(game_id))
+        if condition is not None:
+            expr &= ds.field('condition') == condition
+        table = self.sales.to_table(columns=columns, filter=expr)
+        return table.sort_by([('date_sold', 'ascending'), ('condition', 'ascending')]).to_pandas()
+
+    def console_trend(self, console, condition=None, start_month=None, end_month=None):
+        '''Returns the monthly price statistics of every sale on a console
+
+        Args:
+            console: name of the console
+            condition: 'loose', 'cib' or 'new', None for all of them
+            start_month, end_month: optional 'YYYY-MM' bounds, both included
+
+        Returns:
+            (dataframe) one row per month and condition with the mean, min, max and number of sales,
+            None if there is no snapshot
+        '''
+        if not self._open():
+            return None
+        expr = ds.field('console') == console
+        if condition is not None:
+            expr &= ds.field('condition') == condition
+        if start_month is not None:
+            expr &= ds.field('month') >= start_month
+        if end_month is not None:
+            expr &= ds.field('month') <= end_month
+        table = self.sales.to_table(columns=['month', 'condition', 'price_sold'], filter=expr)
+        trend = table.group_by(['month', 'condition']).aggregate([
+            ('price_sold', 'mean'), ('price_sold', 'min'), ('price_sold', 'max'), ('price_sold', 'count'),
+        ])
+        names = {'price_sold_mean': 'mean_price', 'price_sold_min': 'min_price',
+                 'price_sold_max': 'max_price', 'price_sold_count': 'n_sales'}
+        trend = trend.rename_columns([names.get(name, name) for name in trend.column_names])
+        return trend.sort_by([('month', 'ascending'), ('condition', 'ascending')]).to_pandas()
+
+    def get_stats(self):
+        self._open()
+        if self.name is None:
+            return {'snapshot': None}
+        with open(os.path.join(self.snapshot_dir, self.name, 'manifest.json')) as f:
+            return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export and query the Parquet snapshots of the sales history')
+    parser.add_argument('--dir', default=SNAPSHOT_DIR, help='snapshot directory')
+    commands = parser.add_subparsers(dest='command', required=True)
+    export = commands.add_parser('export', help='write a new snapshot from the database')
+    export.add_argument('--batch-size', type=int, default=100000)
+    export.add_argument('--keep', type=int, default=2, help='snapshots kept')
+    history = commands.add_parser('history', help='print the sales of a game')
+    history.add_argument('game_id', type=int)
+    history.add_argument('--condition', choices=['loose', 'cib', 'new'])
+    trend = commands.add_parser('trend', help='print the monthly prices of a console')
+    trend.add_argument('console')
+    trend.add_argument('--condition', choices=['loose', 'cib', 'new'])
+    args = parser.parse_args(argv)
+
+    if args.command == 'export':
+        from gamescraperapi import create_connection, un, pw, port, db_name
+        conn, cursor = create_connection(un, pw, port, db_name)
+        try:
+            export_snapshot(conn, args.dir, args.batch_size, args.keep)
+        finally:
+            conn.rollback()
+            conn.close()
+        return
+
+    store = SnapshotStore(args.dir)
+    if args.command == 'history':
+        result = store.game_history(args.game_id, args.condition)
+    else:
+        result = store.console_trend(args.console, args.condition)
+    if result is None:
+        raise SystemExit(f'No snapshot in {args.dir}, run: python snapshots.py export')
+    print(result.to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+// Draws the price charts of prices.html from the compact arrays of /chart-data
+const SVG_NS = 'http://www.w3.org/2000/svg';
+const CHART_WIDTH = 900;
+const CHART_HEIGHT = 450;
+const MARGIN = {top: 40, right: 20, bottom: 50, left: 70};
+const CONDITION_NAMES = {loose: 'Loose', new: 'New', cib: 'CIB'};
+
+function svgElement(name, attributes, text) {
+    const element = document.createElementNS(SVG_NS, name);
+    for (const [key, value] of Object.entries(attributes)) {
+        element.setAttribute(key, value);
+    }
+    if (text !== undefined) element.textContent = text;
+    return element;
+}
+
+function dayNumber(isoDate) {
+    return Date.parse(isoDate) / 86400000;
+}
+
+function formatDay(day) {
+    return new Date(day * 86400000).toISOString().slice(0, 10);
+}
+
+// Draws one condition's sales, daily averages and, in daily mode, the daily low and high
+function drawPriceChart(container, data, title) {
+    const days = data.dates.map(dayNumber);
+    const avgDays = data.avg_dates.map(dayNumber);
+    const allDays = days.concat(avgDays);
+    const allPrices = data.prices.concat(data.avg_prices, data.high || []);
+    const minDay = Math.min(...allDays);
+    const maxDay = Math.max(...allDays, minDay + 1);
+    const maxPrice = Math.max(...allPrices, 1) * 1.05;
+    const width = CHART_WIDTH - MARGIN.left - MARGIN.right;
+    const height = CHART_HEIGHT - MARGIN.top - MARGIN.bottom;
+    const px = (day) => MARGIN.left + (day - minDay) / (maxDay - minDay) * width;
+    const py = (price) => MARGIN.top + height - price / maxPrice * height;
+
+    const svg = svgElement('svg', {viewBox: `0 0 ${CHART_WIDTH} ${CHART_HEIGHT}`, width: '100%', 'font-family': 'sans-serif', 'font-size': 12});
+    svg.append(svgElement('text', {x: CHART_WIDTH / 2, y: 22, 'text-anchor': 'middle', 'font-size': 16}, title));
+
+    // Axes with five ticks each
+    for (let i = 0; i <= 5; i++) {
+        const price = maxPrice * i / 5;
+        const day = minDay + (maxDay - minDay) * i / 5;
+        svg.append(svgElement('line', {x1: MARGIN.left, x2: MARGIN.left + width, y1: py(price), y2: py(price), stroke: '#eee'}));
+        svg.append(svgElement('text', {x: MARGIN.left - 8, y: py(price) + 4, 'text-anchor': 'end'}, `$${price.toFixed(2)}`));
+        svg.append(svgElement('text', {x: px(day), y: MARGIN.top + height + 20, 'text-anchor': 'middle'}, formatDay(day)));
+    }
+    svg.append(svgElement('line', {x1: MARGIN.left, x2: MARGIN.left + width, y1: MARGIN.top + height, y2: MARGIN.top + height, stroke: '#444'}));
+    svg.append(svgElement('line', {x1: MARGIN.left, x2: MARGIN.left, y1: MARGIN.top, y2: MARGIN.top + height, stroke: '#444'}));
+    svg.append(svgElement('text', {x: MARGIN.left + width / 2, y: CHART_HEIGHT - 8, 'text-anchor': 'middle'}, 'Date Sold'));
+    svg.append(svgElement('text', {x: 16, y: MARGIN.top + height / 2, 'text-anchor': 'middle', transform: `rotate(-90 16 ${MARGIN.top + height / 2})`}, 'Price Sold'));
+
+    if (data.low) {
+        data.low.forEach((low, i) => {
+            const x = px(avgDays[i]);
+            const bar = svgElement('line', {x1: x, x2: x, y1: py(low), y2: py(data.high[i]), stroke: '#9ecae1', 'stroke-width': 3});
+            bar.append(svgElement('title', {}, `${data.avg_dates[i]}: $${low.toFixed(2)} - $${data.high[i].toFixed(2)}`));
+            svg.append(bar);
+        });
+    }
+    data.prices.forEach((price, i) => {
+        const point = svgElement('circle', {cx: px(days[i]), cy: py(price), r: 3, fill: '#1f77b4', 'fill-opacity': 0.7});
+        point.append(svgElement('title', {}, `${data.dates[i]}: $${price.toFixed(2)}`));
+        svg.append(point);
+    });
+    const line = data.avg_prices.map((price, i) => `${px(avgDays[i]).toFixed(1)},${py(price).toFixed(1)}`).join(' ');
+    svg.append(svgElement('polyline', {points: line, fill: 'none', stroke: '#ff7f0e', 'stroke-width': 2}));
+
+    let legend = `Average Price, ${data.n_sales} sales`;
+    if (data.prices.length && data.prices.length < data.n_sales) legend += `, ${data.prices.length} shown`;
+    svg.append(svgElement('text', {x: MARGIN.left + width, y: MARGIN.top - 8, 'text-anchor': 'end', fill: '#ff7f0e'}, legend));
+    container.replaceChildren(svg);
+}
+
+// Fetches the chart arrays of a game once and draws every .price-chart of the page
+async function renderPriceCharts(url, title) {
+    const response = await fetch(url);
+    if (!response.ok) return;
+    const payload = await response.json();
+    for (const container of document.querySelectorAll('.price-chart')) {
+        const condition = container.dataset.condition;
+        const data = payload.conditions[condition];
+        if (data) drawPriceChart(container, data, `${title} ${CONDITION_NAMES[condition]} Price History`);
+    }
+}
@@ -0,0 +1,57 @@
+import datetime
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import build_chart_data
+
+
+def fake_sales(n_sales, n_days, seed=0):
+    '''Builds unsorted (game_id, date_sold, price_sold) rows like the rows of a sales table'''
+    rng = random.Random(seed)
+    start = datetime.date(2023, 1, 1)
+    return [(1, start + datetime.timedelta(days=rng.randrange(n_days)), f'{rng.uniform(1, 300):.2f}')
+            for _ in range(n_sales)]
+
+
+@pytest.mark.parametrize('max_points', [3, 50, 500])
+def test_lttb_keeps_the_first_and_last_sale(max_points):
+    prices = fake_sales(2000, 365)
+    data = build_chart_data(prices, None, 'lttb', max_points)
+    by_date = sorted(prices, key=lambda price: price[1])
+    assert data['n_sales'] == 2000
+    assert len(data['dates']) == len(data['prices']) == max_points
+    assert data['dates'] == sorted(data['dates'])
+    assert (data['dates'][0], data['prices'][0]) == (by_date[0][1].isoformat(), float(by_date[0][2]))
+    assert (data['dates'][-1], data['prices'][-1]) == (by_date[-1][1].isoformat(), float(by_date[-1][2]))
+
+
+@pytest.mark.parametrize('downsample', ['lttb', 'none'])
+def test_sales_below_max_points_are_all_sent(downsample):
+    prices = fake_sales(40, 30)
+    data = build_chart_data(prices, None, downsample, 500)
+    by_date = sorted(prices, key=lambda price: price[1])
+    assert data['n_sales'] == 40
+    assert data['dates'] == [price[1].isoformat() for price in by_date]
+    assert data['prices'] == [float(price[2]) for price in by_date]
+    assert data['avg_dates'] == sorted(set(data['dates']))
+
+
+def test_daily_sends_the_low_and_high_instead_of_the_sales():
+    data = build_chart_data(fake_sales(1000, 30), None, 'daily', 500)
+    assert data['dates'] == [] and data['prices'] == []
+    assert len(data['low']) == len(data['high']) == len(data['avg_dates']) == len(data['avg_prices'])
+    assert all(low <= avg <= high for low, avg, high in zip(data['low'], data['avg_prices'], data['high']))
+
+
+def test_sales_without_a_date_or_price_are_skipped():
+    day = datetime.date(2023, 5, 1)
+    prices = [(1, None, '0'), (1, day, 'Private Sale'), (1, day, '12.50')]
+    data = build_chart_data(prices, None, 'lttb', 500)
+    assert data['n_sales'] == 1
+    assert data['dates'] == ['2023-05-01'] and data['prices'] == [12.5]
+    assert build_chart_data(prices[:2], None, 'lttb', 500) is None
@@ -0,0 +1,81 @@
+import datetime
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from gamescraperapi import PARSERS, parse_product_page
+
+# Product page saved from the replay server, with used, cib and new completed auctions
+FIXTURE = os.path.join(REPO_DIR, 'tests', 'fixtures', 'product_page.html')
+
+# (date, price) of every sale on the page, in page order, as the original three-fetch scraper read them
+LOOSE_SALES = [
+    ('2023-06-02', 294.98),
+    ('2023-05-03', 1.12),
+    ('2023-11-06', 75.05),
+    ('2023-12-21', 130.28),
+    ('2023-09-09', 163.29),
+    ('2023-10-14', 248.38),
+    ('2023-07-12', 227.14),
+    ('2023-07-08', 118.23),
+    ('2023-02-17', 149.72),
+    ('2023-04-17', 89.00),
+    ('2023-08-23', 178.40),
+    ('2023-12-18', 51.38),
+    ('2023-10-13', 270.31),
+    ('2023-08-05', 227.51),
+    ('2023-04-14', 269.19),
+]
+
+CIB_SALES = [
+    ('2023-11-20', 28.39),
+    ('2023-10-22', 252.73),
+    ('2023-11-17', 11.60),
+    ('2023-06-15', 158.88),
+    ('2023-02-22', 137.60),
+    ('2023-05-13', 291.95),
+    ('2023-07-15', 44.17),
+    ('2023-01-03', 124.52),
+    ('2023-09-10', 278.98),
+    ('2023-11-23', 130.27),
+    ('2023-10-19', 110.48),
+    ('2023-12-19', 291.16),
+    ('2023-09-20', 64.76),
+    ('2023-07-03', 3.63),
+    ('2023-11-17', 273.16),
+]
+
+NEW_SALES = [
+    ('2023-11-14', 129.28),
+    ('2023-12-04', 20.80),
+    ('2023-12-15', 113.10),
+    ('2023-10-22', 51.86),
+    ('2023-06-11', 80.82),
+    ('2023-06-20', 218.25),
+    ('2023-08-25', 175.27),
+    ('2023-04-20', 26.23),
+    ('2023-08-05', 131.55),
+    ('2023-04-01', 114.74),
+    ('2023-12-18', 272.97),
+    ('2023-10-17', 8.35),
+    ('2023-08-04', 75.81),
+    ('2023-12-05', 268.20),
+    ('2023-02-04', 231.72),
+]
+
+
+@pytest.mark.parametrize('parser', list(PARSERS))
+def test_parse_saved_product_page(parser):
+    with open(FIXTURE, 'rb') as f:
+        content = f.read()
+    dfs = parse_product_page(content, 12, parser)
+    assert len(dfs) == 3
+    for df, expected in zip(dfs, [LOOSE_SALES, CIB_SALES, NEW_SALES]):
+        assert list(df['game_id']) == [12] * len(expected)
+        assert list(zip(df['date'], df['price_sold'])) == [
+            (datetime.date.fromisoformat(date), pytest.approx(price)) for date, price in expected]
+        assert list(df['sale_seq']) == [0] * len(expected)
@@ -0,0 +1,89 @@
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+
+from pandas.testing import assert_frame_equal
+
+from gamescraperapi import PARSERS, parse_product_page
+from fakeserver import fake_product_page, fake_sales_table
+
+# Product page whose cib division has no table, every backend gives the 'empty row' for it
+PAGE_WITHOUT_CIB_TABLE = f'''<html><body><div class="tab-frame">
+    {fake_sales_table('used', 5, 1)}
+    <div class="completed-auctions-cib"><p>No sales</p></div>
+    {fake_sales_table('new', 5, 2)}
+</div></body></html>'''
+
+
+def private_sale_row(date):
+    '''A sale row without a price, like the private sales PriceCharting lists among the auctions'''
+    return f'''
+                <tr>
+                    <td class="date">{date}</td>
+                    <td class="title">
+                        <a href="#">Private listing
+                        </a>
+                    </td>
+                    <td class="numeric">Private Sale</td>
+                </tr>'''
+
+# Product page with private sales first, in the middle and last of the tables
+PAGE_WITH_PRIVATE_SALES = f'''<html><body><div class="tab-frame">
+    {fake_sales_table('used', 6, 4).replace('<tr id="ebay-4-3">', private_sale_row('2023-03-01') + '<tr id="ebay-4-3">')}
+    {fake_sales_table('cib', 6, 5).replace('<tbody>', '<tbody>' + private_sale_row('2023-03-02'))}
+    {fake_sales_table('new', 6, 6).replace('</tbody>', private_sale_row('2023-03-03') + '</tbody>')}
+</div></body></html>'''
+
+# The same page without its private sales
+PAGE_WITHOUT_PRIVATE_SALES = f'''<html><body><div class="tab-frame">
+    {fake_sales_table('used', 6, 4)}
+    {fake_sales_table('cib', 6, 5)}
+    {fake_sales_table('new', 6, 6)}
+</div></body></html>'''
+
+# What a block or captcha page looks like to the parsers
+PAGE_WITHOUT_TAB_FRAME = '<html><body><h1>Access denied</h1></body></html>'
+
+
+def assert_same_sales(dfs, expected):
+    assert len(dfs) == len(expected) == 3
+    for df, expected_df in zip(dfs, expected):
+        assert_frame_equal(df.reset_index(drop=True), expected_df.reset_index(drop=True), check_dtype=False)
+
+
+@pytest.mark.parametrize('parser', list(PARSERS))
+@pytest.mark.parametrize('game_id', [1, 7, 42])
+def test_parsers_match_bs4(parser, game_id):
+    content = fake_product_page(game_id).encode()
+    assert_same_sales(parse_product_page(content, game_id, parser), parse_product_page(content, game_id, 'bs4'))
+
+
+@pytest.mark.parametrize('parser', list(PARSERS))
+def test_parsers_match_bs4_without_table(parser):
+    content = PAGE_WITHOUT_CIB_TABLE.encode()
+    dfs = parse_product_page(content, 3, parser)
+    assert_same_sales(dfs, parse_product_page(content, 3, 'bs4'))
+    assert dfs[1]['date'].tolist() == [None]
+
+
+@pytest.mark.parametrize('parser', list(PARSERS))
+def test_parsers_match_bs4_with_private_sales(parser):
+    content = PAGE_WITH_PRIVATE_SALES.encode()
+    dfs = parse_product_page(content, 5, parser)
+    assert_same_sales(dfs, parse_product_page(content, 5, 'bs4'))
+    # The private sales are dropped and every other sale keeps its own date and price
+    public = parse_product_page(PAGE_WITHOUT_PRIVATE_SALES.encode(), 5, parser)
+    for df, public_df in zip(dfs, public):
+        assert len(df) == 6
+        assert_frame_equal(df.reset_index(drop=True), public_df.reset_index(drop=True))
+
+
+@pytest.mark.parametrize('parser', list(PARSERS))
+def test_parsers_raise_without_tab_frame(parser):
+    with pytest.raises(ValueError):
+        parse_product_page(PAGE_WITHOUT_TAB_FRAME.encode(), 3, parser)
@@ -0,0 +1,94 @@
+import os
+import random
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from priceagg import daily_stats, reference_daily_stats, lttb, DAILY_STATS
+
+
+def fake_sales(n_sales, n_days, seed=0):
+    '''Builds unsorted (date, price) sales like the rows of a sales table, many sharing a date'''
+    rng = random.Random(seed)
+    dates = [f'2023-01-{rng.randint(1, n_days):02d}' for _ in range(n_sales)]
+    prices = [f'${rng.uniform(1, 3000):,.2f}' for _ in range(n_sales)]
+    return dates, prices
+
+
+def assert_matches_reference(dates, prices):
+    stats_df = daily_stats(dates, prices)
+    reference_df = reference_daily_stats(dates, prices)
+    assert list(stats_df.columns) == ['date'] + DAILY_STATS
+    assert list(stats_df['date']) == list(reference_df['date'])
+    assert np.allclose(stats_df[DAILY_STATS].to_numpy(dtype=float), reference_df[DAILY_STATS].to_numpy(dtype=float))
+    return stats_df
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('n_sales', [1, 2, 10, 500])
+def test_matches_reference(n_sales, seed):
+    assert_matches_reference(*fake_sales(n_sales, 7, seed))
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_shuffled_input_gives_the_same_stats(seed):
+    dates, prices = fake_sales(200, 10, seed)
+    sales = list(zip(dates, prices))
+    random.Random(seed).shuffle(sales)
+    shuffled_df = assert_matches_reference([date for date, _ in sales], [price for _, price in sales])
+    stats_df = daily_stats(dates, prices)
+    assert list(shuffled_df['date']) == sorted(shuffled_df['date'])
+    assert list(shuffled_df['date']) == list(stats_df['date'])
+    assert np.allclose(shuffled_df[DAILY_STATS].to_numpy(dtype=float), stats_df[DAILY_STATS].to_numpy(dtype=float))
+
+
+def test_duplicate_dates_are_one_row():
+    stats_df = assert_matches_reference(['2023-01-02', '2023-01-01', '2023-01-02', '2023-01-02'],
+                                        ['$10.00', '$5.00', '$20.00', '$1,000.00'])
+    assert list(stats_df['date']) == ['2023-01-01', '2023-01-02']
+    assert list(stats_df['count']) == [1, 3]
+    assert list(stats_df['median']) == [5.0, 20.0]
+    assert list(stats_df['max']) == [5.0, 1000.0]
+
+
+def test_prices_that_are_not_numbers_are_ignored():
+    dates = ['2023-01-01', '2023-01-01', '2023-01-01', '2023-01-02', None]
+    prices = ['$10.00', 'Private Sale', float('nan'), None, '$7.00']
+    stats_df = assert_matches_reference(dates, prices)
+    assert list(stats_df['date']) == ['2023-01-01']
+    assert list(stats_df['count']) == [1]
+    assert list(stats_df['mean']) == [10.0]
+
+
+@pytest.mark.parametrize('dates, prices', [([], []), (['2023-01-01'], ['Private Sale'])])
+def test_no_sales(dates, prices):
+    stats_df = daily_stats(dates, prices)
+    assert stats_df.empty
+    assert list(stats_df.columns) == ['date'] + DAILY_STATS
+    assert reference_daily_stats(dates, prices).empty
+
+
+@pytest.mark.parametrize('n_out', [3, 10, 500])
+def test_lttb_keeps_the_ends_and_n_out_points(n_out):
+    rng = np.random.default_rng(n_out)
+    x = np.sort(rng.uniform(0, 1000, 2000))
+    y = rng.lognormal(3, 0.5, 2000)
+    kept = lttb(x, y, n_out)
+    assert len(kept) == n_out
+    assert kept[0] == 0 and kept[-1] == len(x) - 1
+    assert np.all(np.diff(kept) > 0)
+
+
+@pytest.mark.parametrize('n_out', [50, 80])
+def test_lttb_keeps_every_point_below_n_out(n_out):
+    x = np.arange(50, dtype=float)
+    assert list(lttb(x, np.ones(50), n_out)) == list(range(50))
+
+
+def test_lttb_keeps_a_spike():
+    y = np.ones(1000)
+    y[437] = 100.0
+    assert 437 in lttb(np.arange(1000, dtype=float), y, 20)
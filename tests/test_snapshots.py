@@ -0,0 +1,76 @@
+import os
+import sys
+
+import pytest
+
+pytest.importorskip('pyarrow')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from snapshots import export_snapshot, SnapshotStore, SALES_QUERY, CATALOG_QUERY
+
+
+class FakeCursor:
+    '''Answers the queries of export_snapshot from canned rows'''
+
+    def __init__(self, catalog, sales):
+        self.catalog = catalog
+        self.sales = sales
+        self.rows = []
+        self.itersize = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        if query == CATALOG_QUERY:
+            self.rows = list(self.catalog)
+        elif query == SALES_QUERY:
+            self.rows = list(self.sales)
+        else:
+            # max(updated_at) of sales_versions
+            self.rows = [(None,)]
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def fetchone(self):
+        return self.rows.pop(0)
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+
+class FakeConnection:
+    def __init__(self, catalog, sales):
+        self.catalog = catalog
+        self.sales = sales
+
+    def cursor(self, name=None):
+        return FakeCursor(self.catalog, self.sales)
+
+
+CATALOG = [(1, 0, 'nintendo-64', 10.0, 20.0, 40.0, '2023-06-01', 'super-mario-64', 'https://example.com/1')]
+
+
+def test_export_without_sales(tmp_path):
+    export_snapshot(FakeConnection(CATALOG, []), str(tmp_path))
+    store = SnapshotStore(str(tmp_path))
+    assert store.game_history(1).empty
+    assert store.game_history(2).empty
+    assert store.console_trend('nintendo-64').empty
+    stats = store.get_stats()
+    assert stats['games'] == 1
+    assert stats['sales'] == 0
+
+
+def test_export_without_games(tmp_path):
+    export_snapshot(FakeConnection([], []), str(tmp_path))
+    store = SnapshotStore(str(tmp_path))
+    assert store.game_history(1).empty
+    assert store.get_stats()['games'] == 0